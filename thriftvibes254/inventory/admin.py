@@ -1,19 +1,35 @@
 from django.contrib import admin
 from .models import Product, Sale, Order, OrderItem, Payment, UserProfile
+from . import search
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('name', 'category', 'size', 'selling_price', 'quantity', 'reserved')
+    list_filter = ('category',)
+    # Required by autocomplete_fields; get_search_results does the matching
+    search_fields = ('name',)
+    ordering = ('name', 'id')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Word-prefix match on the full-text index, not a LIKE '%term%' scan
+        return search.match(queryset, search_term), False
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    autocomplete_fields = ('product',)
 
 
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('order_id', 'id', 'customer', 'status', 'created_at')
     list_filter = ('status',)
+    list_select_related = ('customer',)
+    search_fields = ('order_id', 'customer__username')
     inlines = [OrderItemInline]
 
 
-admin.site.register(Product)
 admin.site.register(Sale)
 admin.site.register(Order, OrderAdmin)
 
@@ -29,7 +45,9 @@ class PaymentAdmin(admin.ModelAdmin):
         'created_at'
     )
     list_filter = ('status',)
+    list_select_related = ('order__customer',)
     search_fields = ('phone_number', 'mpesa_receipt_number')
+    autocomplete_fields = ('order',)
 
 
 @admin.register(UserProfile)
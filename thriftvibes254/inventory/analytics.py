@@ -0,0 +1,184 @@
+"""
+Sales rollups for the staff dashboard.
+
+Each sale or paid order adds its units, revenue and profit to one
+SalesRollup row per product for its day, week and month, so reports read
+a few hundred pre-summed rows instead of scanning Sale and OrderItem.
+`rebuild()` (manage.py backfill_sales_rollups) recomputes them from scratch.
+
+Profit uses the product's current buying price; sales don't record cost.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DateField, F, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .caching import bump_catalogue_version
+from .models import OrderItem, Product, Sale, SalesRollup
+
+
+PERIOD_KINDS = {'D': 'day', 'W': 'week', 'M': 'month'}
+
+# Orders count as sold once paid; delivered orders were paid first
+SOLD_ORDER_STATUSES = ('paid', 'delivered')
+
+
+def period_starts(day):
+    return {
+        'D': day,
+        'W': day - timedelta(days=day.weekday()),
+        'M': day.replace(day=1),
+    }
+
+
+def _add(totals, when=None):
+    """
+    Add {(product_id, category): (units, revenue, cost)} to the buckets
+    containing `when`. One UPDATE per bucket; INSERT the first time.
+    """
+    day = timezone.localdate(when)
+    with transaction.atomic():
+        # The staff dashboard caches these totals under the catalogue version
+        transaction.on_commit(bump_catalogue_version)
+        for period, start in period_starts(day).items():
+            # Fixed order so concurrent writers lock rows the same way
+            for (product_id, category), (units, revenue, cost) in sorted(totals.items()):
+                bucket = SalesRollup.objects.filter(period=period, period_start=start, product_id=product_id)
+                increments = {
+                    'units': F('units') + units,
+                    'revenue': F('revenue') + revenue,
+                    'profit': F('profit') + (revenue - cost),
+                }
+                if bucket.update(**increments):
+                    continue
+                try:
+                    with transaction.atomic():
+                        SalesRollup.objects.create(
+                            period=period, period_start=start, product_id=product_id,
+                            category=category, units=units,
+                            revenue=revenue, profit=revenue - cost,
+                        )
+                except IntegrityError:
+                    # Someone else created the bucket first
+                    bucket.update(**increments)
+
+
+def record_sale(sale):
+    product = sale.product
+    _add({
+        (product.pk, product.category): (
+            sale.quantity, sale.total_amount, sale.quantity * product.buying_price,
+        ),
+    }, sale.date)
+
+
+def record_paid_orders(order_ids):
+    """Call once per order, when it first becomes paid."""
+    if not order_ids:
+        return
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('product_id', 'product__category')
+        .annotate(
+            units=Sum('quantity'),
+            revenue=Sum(F('quantity') * F('price')),
+            cost=Sum(F('quantity') * F('product__buying_price')),
+        )
+    )
+    _add({
+        (row['product_id'], row['product__category']): (row['units'], row['revenue'], row['cost'])
+        for row in rows
+    })
+
+
+def rebuild():
+    """Recompute every rollup from Sale and paid orders. Returns rows written."""
+    buckets = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for period, kind in PERIOD_KINDS.items():
+        sales = (
+            Sale.objects
+            .annotate(start=Trunc('date', kind, output_field=DateField()))
+            .values('start', 'product_id', 'product__category')
+            .annotate(
+                units=Sum('quantity'),
+                revenue=Sum('total_amount'),
+                cost=Sum(F('quantity') * F('product__buying_price')),
+            )
+        )
+        # Orders carry no paid-at stamp; updated_at is set when they flip to paid
+        orders = (
+            OrderItem.objects.filter(order__status__in=SOLD_ORDER_STATUSES)
+            .annotate(start=Trunc('order__updated_at', kind, output_field=DateField()))
+            .values('start', 'product_id', 'product__category')
+            .annotate(
+                units=Sum('quantity'),
+                revenue=Sum(F('quantity') * F('price')),
+                cost=Sum(F('quantity') * F('product__buying_price')),
+            )
+        )
+        for rows in (sales, orders):
+            for row in rows:
+                bucket = buckets[(period, row['start'], row['product_id'], row['product__category'])]
+                bucket[0] += row['units']
+                bucket[1] += row['revenue']
+                bucket[2] += row['revenue'] - row['cost']
+
+    rollups = [
+        SalesRollup(
+            period=period, period_start=start, product_id=product_id, category=category,
+            units=units, revenue=revenue, profit=profit,
+        )
+        for (period, start, product_id, category), (units, revenue, profit) in buckets.items()
+    ]
+    with transaction.atomic():
+        SalesRollup.objects.all().delete()
+        SalesRollup.objects.bulk_create(rollups, batch_size=1000)
+        transaction.on_commit(bump_catalogue_version)
+    return len(rollups)
+
+
+def _sell_through(units, on_hand):
+    """Share of the units available in the period that were sold."""
+    total = (units or 0) + (on_hand or 0)
+    return round(100 * (units or 0) / total, 1) if total else 0
+
+
+def summary(period='D', buckets=30):
+    """Revenue series, category and top-product tables for the last `buckets` periods."""
+    today = timezone.localdate()
+    first = today - {'D': timedelta(days=buckets - 1),
+                     'W': timedelta(weeks=buckets - 1),
+                     'M': timedelta(days=31 * (buckets - 1))}[period]
+    rollups = SalesRollup.objects.filter(period=period, period_start__gte=period_starts(first)[period])
+    totals = {'units': Sum('units'), 'revenue': Sum('revenue'), 'profit': Sum('profit')}
+
+    series = list(rollups.values('period_start').annotate(**totals).order_by('period_start'))
+    peak = max((row['revenue'] for row in series), default=0) or 1
+    for row in series:
+        row['width'] = round(100 * row['revenue'] / peak)
+
+    on_hand = dict(Product.objects.values_list('category').annotate(Sum('quantity')))
+    categories = list(rollups.values('category').annotate(**totals).order_by('-revenue'))
+    for row in categories:
+        row['sell_through'] = _sell_through(row['units'], on_hand.get(row['category']))
+
+    products = list(
+        rollups.values('product_id', 'product__name', 'product__quantity')
+        .annotate(**totals).order_by('-revenue')[:10]
+    )
+    for row in products:
+        row['sell_through'] = _sell_through(row['units'], row['product__quantity'])
+
+    return {
+        'period': period,
+        'series': series,
+        'categories': categories,
+        'products': products,
+        'revenue': sum((row['revenue'] for row in series), Decimal(0)),
+        'profit': sum((row['profit'] for row in series), Decimal(0)),
+        'units': sum(row['units'] for row in series),
+    }
@@ -0,0 +1,87 @@
+"""
+In-memory, precompressed copies of small static files that must be served
+from a fixed URL (the service worker can't live under a hashed /static/ name).
+
+The file is read and compressed once per process (again only if it changes
+on disk), and responses carry an ETag so repeat visits get a bodiless 304.
+"""
+import gzip
+import hashlib
+import os
+import threading
+
+from django.contrib.staticfiles import finders
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+
+class CachedAsset:
+    def __init__(self, static_path, content_type, headers=None):
+        self.static_path = static_path
+        self.content_type = content_type
+        self.headers = headers or {}
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._variants = {}
+        self.etag = None
+
+    def _locate(self):
+        path = finders.find(self.static_path)
+        if not path:
+            raise Http404(f"{self.static_path} not found")
+        return path
+
+    def _load(self):
+        path = self._locate()
+        mtime = os.stat(path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(path, 'rb') as f:
+                raw = f.read()
+            variants = {'identity': raw, 'gzip': gzip.compress(raw, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(raw)
+            self._variants = variants
+            self.etag = f'"{hashlib.sha256(raw).hexdigest()[:32]}"'
+            self._mtime = mtime
+
+    def _pick_encoding(self, accept_encoding):
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in self._variants:
+                return encoding
+        return 'identity'
+
+    def serve(self, request):
+        self._load()
+        if_none_match = request.headers.get('If-None-Match', '')
+        if self.etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match == '*':
+            response = HttpResponseNotModified()
+        else:
+            encoding = self._pick_encoding(request.headers.get('Accept-Encoding', ''))
+            response = HttpResponse(self._variants[encoding], content_type=self.content_type)
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+            response['Content-Length'] = str(len(self._variants[encoding]))
+        response['ETag'] = self.etag
+        # Always revalidate: a stale service worker is worse than a 304 round-trip
+        response['Cache-Control'] = 'no-cache'
+        for header, value in self.headers.items():
+            response[header] = value
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+service_worker_asset = CachedAsset(
+    'pwa/service-worker.js',
+    'application/javascript',
+    headers={'Service-Worker-Allowed': '/'},
+)
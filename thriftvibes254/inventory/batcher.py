@@ -0,0 +1,131 @@
+"""
+Write-behind mode for M-Pesa callbacks.
+
+With MPESA_CALLBACK_MODE = "deferred" the callback view only appends the raw
+body to MpesaCallback. The `mpesa_batcher` command then applies staged rows
+every few milliseconds in batches (bulk_update instead of a save() per
+callback) and periodically reconciles stuck payments against Daraja's STK
+query API.
+
+In "direct" mode only callbacks that arrive before their payment's
+CheckoutRequestID is stored are staged here; mpesa_worker drains those.
+"""
+import logging
+import time
+from datetime import timedelta
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+
+from .callbacks import CallbackResult, apply_callbacks, parse_callback
+from .models import MpesaCallback, Payment
+from .mpesa import stk_query
+
+
+logger = logging.getLogger(__name__)
+
+# A callback for a CheckoutRequestID no Payment has yet is usually just ahead
+# of mpesa_worker storing it: try again shortly, give up after a while.
+UNMATCHED_RETRY = timedelta(seconds=5)
+UNMATCHED_MAX_AGE = timedelta(hours=1)
+
+
+def stage_callback(data):
+    """Accept a callback body for later processing. One INSERT, no lookups."""
+    return MpesaCallback.objects.create(
+        checkout_request_id=data['Body']['stkCallback']['CheckoutRequestID'],
+        payload=data,
+    )
+
+
+def drain(limit=500):
+    """
+    Apply up to `limit` due staged callbacks. Returns (rows_read, payments_changed).
+
+    Rows whose CheckoutRequestID matches no Payment stay unprocessed and are
+    retried every UNMATCHED_RETRY until they are UNMATCHED_MAX_AGE old.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            MpesaCallback.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, next_attempt_at__lte=now)
+            .order_by('id')[:limit]
+        )
+        if not rows:
+            return 0, 0
+
+        results = {}
+        for row in rows:
+            try:
+                results[row.pk] = parse_callback(row.payload)
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Dropping malformed staged callback %s", row.pk)
+
+        applied = apply_callbacks(results.values())
+        known = set(Payment.objects.filter(
+            checkout_request_id__in={result.checkout_request_id for result in results.values()},
+        ).values_list('checkout_request_id', flat=True))
+
+        waiting = []
+        for row in rows:
+            if row.pk not in results or results[row.pk].checkout_request_id in known:
+                continue
+            if row.received_at > now - UNMATCHED_MAX_AGE:
+                waiting.append(row.pk)
+            else:
+                logger.warning("Dropping staged callback %s for unknown CheckoutRequestID %s",
+                               row.pk, row.checkout_request_id)
+
+        MpesaCallback.objects.filter(pk__in=waiting).update(next_attempt_at=now + UNMATCHED_RETRY)
+        MpesaCallback.objects.filter(pk__in=[row.pk for row in rows]).exclude(pk__in=waiting).update(
+            processed_at=now
+        )
+    return len(rows), applied
+
+
+def run(interval_ms=200, batch_size=500, reconcile_every=None, stop=None):
+    """
+    Drain forever: immediately while full batches keep coming, otherwise every
+    `interval_ms`. `stop` is an optional callable used to end the loop.
+    """
+    last_reconcile = time.monotonic()
+    while not (stop and stop()):
+        read, _ = drain(batch_size)
+        if reconcile_every and time.monotonic() - last_reconcile >= reconcile_every:
+            reconcile()
+            last_reconcile = time.monotonic()
+        if read < batch_size:
+            time.sleep(interval_ms / 1000)
+
+
+def reconcile(older_than=timedelta(minutes=2), limit=100):
+    """
+    Settle payments whose callback never arrived by asking Daraja directly.
+    Returns the number of payments changed.
+    """
+    stuck = Payment.objects.filter(
+        status='PENDING',
+        dispatch_status='SENT',
+        checkout_request_id__isnull=False,
+        updated_at__lt=timezone.now() - older_than,
+    ).values_list('checkout_request_id', 'merchant_request_id')[:limit]
+
+    results = []
+    for checkout_id, merchant_id in stuck:
+        try:
+            response = stk_query(checkout_id)
+        except (requests.RequestException, ValueError) as exc:
+            logger.warning("STK query for %s failed: %r", checkout_id, exc)
+            continue
+        if response.get('ResultCode') is None:
+            # Still being processed on Safaricom's side
+            continue
+        results.append(CallbackResult(
+            checkout_request_id=checkout_id,
+            merchant_request_id=merchant_id or '',
+            result_code=int(response['ResultCode']),
+            result_desc=response.get('ResultDesc', ''),
+        ))
+    return apply_callbacks(results)
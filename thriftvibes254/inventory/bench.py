@@ -0,0 +1,54 @@
+"""
+Shared helpers for the `bench_*` management commands.
+
+Benchmarks always run against a throwaway test database so seeding 100k rows
+never touches real shop data.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def isolated_database():
+    """Create a fresh test database for the duration of the block."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def time_calls(fn, runs):
+    """Call `fn` `runs` times and return each call's duration in ms."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentiles(samples):
+    """Return p50/p95/p99 (ms) for a list of samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+    def pick(pct):
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99)}
+
+
+def format_row(label, samples):
+    stats = percentiles(samples)
+    return (
+        f"{label:<32} p50={stats['p50']:8.2f}ms  "
+        f"p95={stats['p95']:8.2f}ms  p99={stats['p99']:8.2f}ms"
+    )
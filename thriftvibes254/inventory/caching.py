@@ -0,0 +1,72 @@
+"""
+Catalogue caching.
+
+Cached catalogue pages and template fragments are keyed by a version
+counter instead of being deleted one by one: any product change bumps the
+version and every old entry simply stops being looked up and ages out.
+"""
+import threading
+import time
+
+from django.core.cache import cache
+
+
+CATALOGUE_VERSION_KEY = "catalogue:version"
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never repeats an old version
+        cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version(**kwargs):
+    """Invalidate every cached catalogue page. Usable directly as a signal receiver."""
+    try:
+        cache.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+
+
+def get_or_build(key, build, timeout):
+    """cache.get_or_set that also counts hits and misses. A timeout of 0 disables caching."""
+    if not timeout:
+        return build()
+    sentinel = object()
+    value = cache.get(key, sentinel)
+    if value is not sentinel:
+        _record("hits")
+        return value
+    _record("misses")
+    value = build()
+    cache.set(key, value, timeout)
+    return value
+
+
+def _record(kind):
+    with _stats_lock:
+        _stats[kind] += 1
+
+
+def stats():
+    """
+    Hits and misses of get_or_build (catalogue pages, facets, dashboard) in
+    this process. {% cache %} template fragments don't go through it and
+    aren't counted.
+    """
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+        "catalogue_version": catalogue_version(),
+        "excludes": "template fragment caching",
+    }
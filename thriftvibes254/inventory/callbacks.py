@@ -0,0 +1,178 @@
+"""
+M-Pesa STK callback ingestion.
+
+Safaricom retries callbacks it thinks we missed, so applying one must be
+idempotent: the Payment row is flipped with a single conditional UPDATE
+that only matches while it is still PENDING, and a replay simply matches
+nothing.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MpesaTransaction, Order, Payment
+from .analytics import SOLD_ORDER_STATUSES, record_paid_orders
+from .stock import commit_holds
+
+
+@dataclass
+class CallbackResult:
+    checkout_request_id: str
+    merchant_request_id: str
+    result_code: int
+    result_desc: str = ""
+    receipt_number: str = None
+    transaction_date: datetime = None
+    amount: object = None
+    phone: str = None
+
+    @property
+    def succeeded(self):
+        return self.result_code == 0
+
+
+def parse_callback(data):
+    """Pull the fields we store out of a Daraja stkCallback body."""
+    callback = data['Body']['stkCallback']
+    items = {
+        item.get('Name'): item.get('Value')
+        for item in callback.get('CallbackMetadata', {}).get('Item', [])
+    }
+    return CallbackResult(
+        checkout_request_id=callback['CheckoutRequestID'],
+        merchant_request_id=callback.get('MerchantRequestID', ''),
+        result_code=int(callback['ResultCode']),
+        result_desc=callback.get('ResultDesc', ''),
+        receipt_number=items.get('MpesaReceiptNumber'),
+        transaction_date=parse_transaction_date(items.get('TransactionDate')),
+        amount=items.get('Amount'),
+        phone=str(items['PhoneNumber']) if items.get('PhoneNumber') else None,
+    )
+
+
+def parse_transaction_date(value):
+    """Daraja sends TransactionDate as a number like 20191219102115 (EAT)."""
+    if not value:
+        return None
+    try:
+        naive = datetime.strptime(str(value), '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    return timezone.make_aware(naive, timezone.get_fixed_timezone(180))
+
+
+def _newly_paid(order_ids):
+    # A second successful payment for the same order mustn't count its sales twice
+    return list(
+        Order.objects.filter(pk__in=order_ids)
+        .exclude(status__in=SOLD_ORDER_STATUSES)
+        .values_list('pk', flat=True)
+    )
+
+
+def apply_callback(result):
+    """
+    Record one callback. Returns True if it changed anything, False for
+    replays and unknown CheckoutRequestIDs.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if result.succeeded:
+            updated = Payment.objects.filter(
+                checkout_request_id=result.checkout_request_id,
+                status='PENDING',
+            ).update(
+                status='SUCCESS',
+                mpesa_receipt_number=result.receipt_number,
+                transaction_date=result.transaction_date,
+                updated_at=now,
+            )
+            if updated:
+                order_ids = list(Payment.objects.filter(
+                    checkout_request_id=result.checkout_request_id,
+                ).values_list('order_id', flat=True))
+                newly_paid = _newly_paid(order_ids)
+                Order.objects.filter(pk__in=order_ids).update(status='paid', updated_at=now)
+                commit_holds(order_ids)
+                record_paid_orders(newly_paid)
+        else:
+            updated = Payment.objects.filter(
+                checkout_request_id=result.checkout_request_id,
+                status='PENDING',
+            ).update(status='FAILED', last_error=result.result_desc, updated_at=now)
+
+        if updated:
+            MpesaTransaction.objects.filter(
+                checkout_request_id=result.checkout_request_id,
+            ).update(
+                status='SUCCESS' if result.succeeded else 'FAILED',
+                mpesa_receipt_number=result.receipt_number,
+                transaction_date=result.transaction_date.strftime('%Y%m%d%H%M%S')
+                if result.transaction_date else None,
+            )
+    return bool(updated)
+
+
+def apply_callbacks(results):
+    """
+    Bulk version of apply_callback for many results at once. Returns the
+    number of payments that changed; replays and duplicates are skipped.
+    """
+    by_checkout = {}
+    for result in results:
+        by_checkout.setdefault(result.checkout_request_id, result)
+    if not by_checkout:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update()
+            .filter(checkout_request_id__in=by_checkout, status='PENDING')
+        )
+        succeeded, failed_by_desc = [], {}
+        for payment in payments:
+            result = by_checkout[payment.checkout_request_id]
+            if result.succeeded:
+                payment.mpesa_receipt_number = result.receipt_number
+                payment.transaction_date = result.transaction_date
+                succeeded.append(payment)
+            else:
+                failed_by_desc.setdefault(result.result_desc, []).append(payment.pk)
+
+        # Only the per-row columns go through bulk_update's CASE expressions;
+        # status flips are one plain UPDATE per outcome.
+        Payment.objects.filter(pk__in=[p.pk for p in succeeded]).update(
+            status='SUCCESS', updated_at=now,
+        )
+        Payment.objects.bulk_update(
+            succeeded, ['mpesa_receipt_number', 'transaction_date'], batch_size=500,
+        )
+        for desc, pks in failed_by_desc.items():
+            Payment.objects.filter(pk__in=pks).update(
+                status='FAILED', last_error=desc, updated_at=now,
+            )
+        paid_order_ids = [p.order_id for p in succeeded]
+
+        if paid_order_ids:
+            newly_paid = _newly_paid(paid_order_ids)
+            Order.objects.filter(pk__in=paid_order_ids).update(status='paid', updated_at=now)
+            commit_holds(paid_order_ids)
+            record_paid_orders(newly_paid)
+
+        changed = {payment.checkout_request_id for payment in payments}
+        transactions = list(MpesaTransaction.objects.filter(checkout_request_id__in=changed))
+        for tx in transactions:
+            result = by_checkout[tx.checkout_request_id]
+            tx.status = 'SUCCESS' if result.succeeded else 'FAILED'
+            tx.mpesa_receipt_number = result.receipt_number
+            tx.transaction_date = (
+                result.transaction_date.strftime('%Y%m%d%H%M%S')
+                if result.transaction_date else None
+            )
+        MpesaTransaction.objects.bulk_update(
+            transactions, ['status', 'mpesa_receipt_number', 'transaction_date'], batch_size=500,
+        )
+    return len(payments)
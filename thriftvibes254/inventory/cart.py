@@ -0,0 +1,133 @@
+"""
+Shopping cart kept in the session until checkout.
+
+Adding, changing and removing items only touches the session, never the
+order tables. `checkout` turns the cart into an Order and all its OrderItems
+with one insert each, so browsing that never reaches checkout leaves nothing
+behind in the database. Prices are read from Product.selling_price whenever
+the cart is shown or checked out; the session only holds quantities.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import Order, OrderItem, Product
+
+
+SESSION_KEY = 'cart'
+BATCHES_KEY = 'cart_batches'
+# Keep a session from growing without bound
+MAX_LINES = 50
+MAX_BATCHES = 100
+
+Line = namedtuple('Line', 'product quantity price subtotal')
+
+
+class CartError(ValueError):
+    pass
+
+
+class Cart:
+    def __init__(self, session):
+        self.session = session
+        # JSON session serialization turns the keys into strings
+        self.quantities = {int(pk): quantity for pk, quantity in session.get(SESSION_KEY, {}).items()}
+
+    def __len__(self):
+        return sum(self.quantities.values())
+
+    def _save(self):
+        self.session[SESSION_KEY] = {str(pk): quantity for pk, quantity in self.quantities.items()}
+
+    def add(self, product, quantity):
+        """Add `quantity` of `product`; raises CartError if there isn't enough stock."""
+        self.set(product, self.quantities.get(product.pk, 0) + quantity)
+
+    def set(self, product, quantity):
+        """Set the quantity of `product` in the cart; 0 removes it."""
+        if quantity <= 0:
+            self.remove(product.pk)
+            return
+        if product.pk not in self.quantities and len(self.quantities) >= MAX_LINES:
+            raise CartError(f"A cart can hold at most {MAX_LINES} different products.")
+        if quantity > product.available:
+            raise CartError(f"Only {product.available} of {product.name} left.")
+        self.quantities[product.pk] = quantity
+        self._save()
+
+    def add_many(self, pairs):
+        """
+        Add a batch of (product_id, quantity) pairs, e.g. replayed from the
+        offline outbox. Returns (lines_added, errors) like orders.add_items.
+        """
+        errors, valid = {}, []
+        for product_id, quantity in pairs:
+            try:
+                valid.append((int(product_id), int(quantity)))
+            except (TypeError, ValueError):
+                errors[str(product_id)] = "Invalid product or quantity"
+        products = Product.objects.in_bulk([product_id for product_id, _ in valid])
+        added = 0
+        for product_id, quantity in valid:
+            if product_id not in products:
+                errors[product_id] = "Unknown product"
+            elif quantity <= 0:
+                errors[product_id] = "Quantity must be greater than zero"
+            else:
+                try:
+                    self.add(products[product_id], quantity)
+                    added += 1
+                except CartError as exc:
+                    errors[product_id] = str(exc)
+        return added, errors
+
+    def add_batch(self, batch_id, pairs):
+        """
+        add_many for an offline-queued batch, applied at most once per
+        batch_id. Returns None if it was applied already.
+
+        The id is stored in the session next to the cart change and only
+        after add_many returns. The session isn't saved on a 5xx, so a
+        failed apply leaves the batch free for the client's retry.
+        """
+        applied = self.session.get(BATCHES_KEY, [])
+        if batch_id in applied:
+            return None
+        result = self.add_many(pairs)
+        self.session[BATCHES_KEY] = (applied + [batch_id])[-MAX_BATCHES:]
+        return result
+
+    def remove(self, product_id):
+        if self.quantities.pop(product_id, None) is not None:
+            self._save()
+
+    def clear(self):
+        self.quantities = {}
+        self.session.pop(SESSION_KEY, None)
+
+    def lines(self):
+        """(lines, total) with current prices. Products deleted since are dropped."""
+        products = Product.objects.in_bulk(list(self.quantities))
+        lines = []
+        for pk, quantity in self.quantities.items():
+            product = products.get(pk)
+            if product is not None:
+                price = product.selling_price
+                lines.append(Line(product, quantity, price, price * quantity))
+        return lines, sum((line.subtotal for line in lines), Decimal(0))
+
+    def checkout(self, customer):
+        """Write the cart out as a pending Order and empty it."""
+        lines, total = self.lines()
+        if not lines:
+            raise CartError("Your cart is empty.")
+        with transaction.atomic():
+            order = Order.objects.create(customer=customer, total_amount=total)
+            # bulk_create skips OrderItem.save(); total_amount is already right
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=line.product, quantity=line.quantity, price=line.price)
+                for line in lines
+            ])
+        self.clear()
+        return order
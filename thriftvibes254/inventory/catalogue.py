@@ -0,0 +1,103 @@
+"""
+Versioned catalogue for offline clients.
+
+Every product change appends a ProductChange row; the newest row id is the
+catalogue version. Clients download one snapshot, then ask only for what
+changed since the version (or time) they last synced.
+
+Products are sent column-wise, `{"fields": [...], "products": [[...], ...]}`,
+so the field names aren't repeated for every row.
+"""
+from django.db.models import Max, OuterRef, Subquery
+
+from .images import srcset
+from .models import Product, ProductChange
+
+
+FIELDS = ('id', 'name', 'category', 'size', 'price', 'available', 'image')
+
+# More changes than this since a client's version: cheaper to resend everything
+MAX_DELTA_CHANGES = 5000
+
+
+def record_changes(product_ids, operation='U'):
+    ProductChange.objects.bulk_create(
+        ProductChange(product_id=pk, operation=operation) for pk in set(product_ids)
+    )
+
+
+def current_version():
+    return ProductChange.objects.aggregate(version=Max('id'))['version'] or 0
+
+
+def version_at(moment):
+    """Newest version recorded at or before `moment` (a datetime)."""
+    return ProductChange.objects.filter(changed_at__lte=moment).aggregate(
+        version=Max('id'),
+    )['version'] or 0
+
+
+def row(product):
+    image, _ = srcset(product.image, product.image_variants)
+    return [
+        product.pk,
+        product.name,
+        product.category,
+        product.size,
+        str(product.selling_price),
+        product.available,
+        image,
+    ]
+
+
+def snapshot():
+    # Read the version first: anything changing after it is re-sent by the next delta
+    version = current_version()
+    products = [row(p) for p in Product.objects.order_by('id').iterator(chunk_size=1000)]
+    return {'version': version, 'fields': FIELDS, 'products': products}
+
+
+def delta(since):
+    """
+    Products upserted and ids deleted after version `since`. `reset` tells
+    the client to fetch a fresh snapshot instead.
+    """
+    version = current_version()
+    if since > version:
+        # Ahead of the server: the database was restored or swapped
+        return {'reset': True, 'version': version}
+
+    changes = list(
+        ProductChange.objects.filter(id__gt=since)
+        .order_by('id')
+        .values_list('id', 'product_id', 'operation')[:MAX_DELTA_CHANGES + 1]
+    )
+    if len(changes) > MAX_DELTA_CHANGES:
+        return {'reset': True, 'version': version}
+    if not changes:
+        return {'version': since, 'fields': FIELDS, 'products': [], 'deleted': []}
+
+    latest = {}
+    for _, product_id, operation in changes:
+        latest[product_id] = operation
+    products = Product.objects.in_bulk([pk for pk, op in latest.items() if op == 'U'])
+    deleted = [pk for pk in latest if pk not in products]
+    return {
+        'version': changes[-1][0],
+        'fields': FIELDS,
+        'products': [row(products[pk]) for pk in sorted(products)],
+        'deleted': sorted(deleted),
+    }
+
+
+def compact():
+    """
+    Drop every change row superseded by a newer one for the same product.
+    A delta only ever reports the newest row per product, so this never
+    changes what any client receives; the log stays one row per product.
+    """
+    newest = ProductChange.objects.filter(product_id=OuterRef('product_id')).order_by('-id')
+    deleted, _ = ProductChange.objects.exclude(
+        id=Subquery(newest.values('id')[:1]),
+    ).delete()
+    return deleted
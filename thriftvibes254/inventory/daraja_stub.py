@@ -0,0 +1,152 @@
+"""
+Minimal local stand-in for the Safaricom Daraja API.
+
+Speaks just enough of OAuth and STK push for tests and benchmarks. Point
+MPESA_BASE_URL at `server.url` to use it.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_callback(checkout_request_id, merchant_request_id, amount=1, phone="254700000000",
+                   result_code=0, receipt_number=None):
+    """The JSON body Daraja POSTs to CallBackURL once the customer answers."""
+    callback = {
+        "MerchantRequestID": merchant_request_id,
+        "CheckoutRequestID": checkout_request_id,
+        "ResultCode": result_code,
+        "ResultDesc": "The service request is processed successfully."
+        if result_code == 0 else "Request cancelled by user",
+    }
+    if result_code == 0:
+        callback["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": amount},
+            {"Name": "MpesaReceiptNumber", "Value": receipt_number or uuid.uuid4().hex[:10].upper()},
+            {"Name": "TransactionDate", "Value": int(time.strftime("%Y%m%d%H%M%S"))},
+            {"Name": "PhoneNumber", "Value": int(phone)},
+        ]}
+    return {"Body": {"stkCallback": callback}}
+
+
+class StubState:
+    def __init__(self, latency=0.0, token_lifetime=3599):
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.oauth_calls = 0
+        self.stk_calls = 0
+        self.pushes = {}
+        self.lock = threading.Lock()
+
+
+class DarajaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        time.sleep(self.state.latency)
+        if self.path.startswith("/oauth/v1/generate"):
+            with self.state.lock:
+                self.state.oauth_calls += 1
+            self._send(200, {
+                "access_token": uuid.uuid4().hex,
+                "expires_in": str(self.state.token_lifetime),
+            })
+        else:
+            self._send(404, {"errorMessage": "Not found"})
+
+    def do_POST(self):
+        time.sleep(self.state.latency)
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send(401, {"errorMessage": "Invalid Access Token"})
+            return
+
+        payload = self._read_json()
+        if self.path == "/mpesa/stkpush/v1/processrequest":
+            checkout_id = f"ws_CO_{uuid.uuid4().hex[:20]}"
+            merchant_id = f"{uuid.uuid4().int % 10**5}-{uuid.uuid4().int % 10**8}-1"
+            with self.state.lock:
+                self.state.stk_calls += 1
+                self.state.pushes[checkout_id] = {
+                    "MerchantRequestID": merchant_id,
+                    "Amount": payload.get("Amount"),
+                    "PhoneNumber": payload.get("PhoneNumber"),
+                }
+            self._send(200, {
+                "MerchantRequestID": merchant_id,
+                "CheckoutRequestID": checkout_id,
+                "ResponseCode": "0",
+                "ResponseDescription": "Success. Request accepted for processing",
+                "CustomerMessage": "Success. Request accepted for processing",
+            })
+        elif self.path == "/mpesa/stkpushquery/v1/query":
+            checkout_id = payload.get("CheckoutRequestID")
+            push = self.state.pushes.get(checkout_id)
+            if push is None:
+                self._send(500, {"errorCode": "500.001.1001", "errorMessage": "The transaction is being processed"})
+                return
+            self._send(200, {
+                "ResponseCode": "0",
+                "ResponseDescription": "The service request has been accepted successsfully",
+                "MerchantRequestID": push["MerchantRequestID"],
+                "CheckoutRequestID": checkout_id,
+                "ResultCode": "0",
+                "ResultDesc": "The service request is processed successfully.",
+            })
+        else:
+            self._send(404, {"errorMessage": "Not found"})
+
+
+class DarajaStubServer:
+    """Run the stub on a background thread: `with DarajaStubServer() as stub:`."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.httpd = ThreadingHTTPServer((host, port), DarajaStubHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = StubState(latency=latency)
+        self.thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
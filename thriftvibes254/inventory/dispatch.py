@@ -0,0 +1,160 @@
+"""
+Background delivery of STK pushes.
+
+`pay_order` only queues a Payment; the `mpesa_worker` management command
+drains the queue here with a bounded thread pool and retries failed pushes
+with exponential backoff, so no web worker ever waits on Safaricom.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal, ROUND_CEILING
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Payment
+from .mpesa import stk_push
+
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 2  # seconds
+BACKOFF_CAP = 300
+
+
+def backoff_delay(attempts):
+    """
+    Equal-jitter exponential backoff for the given attempt number: a random
+    delay between half and all of the capped exponential step, so retries
+    spread out but never come straight back at a struggling Daraja.
+    """
+    ceiling = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+def claim(payment_id):
+    """Atomically move a payment from QUEUED to SENDING; False if someone beat us."""
+    return Payment.objects.filter(pk=payment_id, dispatch_status='QUEUED').update(
+        dispatch_status='SENDING',
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now(),
+    ) == 1
+
+
+def send(payment_id):
+    """Push one claimed payment to Daraja and record the outcome."""
+    try:
+        payment = Payment.objects.select_related('order').get(pk=payment_id)
+        amount = int(payment.amount.quantize(Decimal('1'), rounding=ROUND_CEILING))
+        try:
+            response = stk_push(payment.phone_number, amount, payment.order.order_id)
+        except requests.HTTPError as exc:
+            if _transient(exc.response):
+                _retry_or_fail(payment, repr(exc))
+            else:
+                # Daraja rejected the request itself (bad phone, etc.) - retrying won't help
+                _fail(payment, _error_message(exc.response))
+            return
+        except (requests.RequestException, ValueError) as exc:
+            _retry_or_fail(payment, repr(exc))
+            return
+
+        if response.get('ResponseCode') is None:
+            # No verdict at all, e.g. a throttling or outage body: try again later
+            _retry_or_fail(payment, response.get('errorMessage') or str(response))
+        elif str(response['ResponseCode']) == '0':
+            Payment.objects.filter(pk=payment.pk).update(
+                dispatch_status='SENT',
+                checkout_request_id=response.get('CheckoutRequestID'),
+                merchant_request_id=response.get('MerchantRequestID'),
+                last_error='',
+                updated_at=timezone.now(),
+            )
+        else:
+            # Daraja rejected the request itself (bad phone, etc.) - retrying won't help
+            _fail(payment, response.get('errorMessage') or response.get('ResponseDescription') or str(response))
+    finally:
+        close_old_connections()
+
+
+def _transient(response):
+    """Whether an HTTP error from Daraja is worth retrying: outages and throttling."""
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+def _error_message(response):
+    try:
+        return response.json().get('errorMessage') or response.text
+    except ValueError:
+        return response.text[:500]
+
+
+def _fail(payment, error):
+    Payment.objects.filter(pk=payment.pk).update(
+        dispatch_status='ERROR',
+        status='FAILED',
+        last_error=error,
+        updated_at=timezone.now(),
+    )
+
+
+def _retry_or_fail(payment, error):
+    if payment.attempts >= settings.MPESA_DISPATCH_MAX_ATTEMPTS:
+        _fail(payment, error)
+    else:
+        Payment.objects.filter(pk=payment.pk).update(
+            dispatch_status='QUEUED',
+            next_attempt_at=timezone.now() + timedelta(seconds=backoff_delay(payment.attempts)),
+            last_error=error,
+            updated_at=timezone.now(),
+        )
+
+
+def requeue_stale(max_age=timedelta(minutes=5)):
+    """Return SENDING payments abandoned by a crashed worker to the queue."""
+    return Payment.objects.filter(
+        dispatch_status='SENDING',
+        updated_at__lt=timezone.now() - max_age,
+    ).update(dispatch_status='QUEUED', next_attempt_at=timezone.now())
+
+
+def dispatch_due(executor, limit):
+    """Claim up to `limit` due payments and send them on `executor`. Returns how many."""
+    due = Payment.objects.filter(
+        dispatch_status='QUEUED',
+        next_attempt_at__lte=timezone.now(),
+    ).order_by('next_attempt_at').values_list('pk', flat=True)[:limit]
+
+    futures = {pk: executor.submit(send, pk) for pk in due if claim(pk)}
+    for pk, future in futures.items():
+        try:
+            future.result()
+        except Exception as exc:
+            # One bad payment must not stop the worker or strand the rest in SENDING
+            logger.exception("Dispatching payment %s failed", pk)
+            _requeue_after_crash(pk, exc)
+    return len(futures)
+
+
+def _requeue_after_crash(pk, exc):
+    try:
+        payment = Payment.objects.get(pk=pk, dispatch_status='SENDING')
+    except Payment.DoesNotExist:
+        return
+    except Exception:
+        # Still can't reach the database: requeue_stale will pick it up
+        logger.exception("Could not requeue payment %s", pk)
+        return
+    _retry_or_fail(payment, repr(exc))
+
+
+def dispatch_once(concurrency=None, limit=100):
+    """Drain one batch with a fresh pool; handy for tests and cron."""
+    concurrency = concurrency or settings.MPESA_DISPATCH_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return dispatch_due(executor, limit)
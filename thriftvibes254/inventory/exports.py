@@ -0,0 +1,150 @@
+"""
+Bulk exports of sales, orders, order items and payments.
+
+Rows are read as plain tuples (values_list) in primary-key order through
+.iterator(), so only one chunk is ever in memory whatever the history size.
+CSV is streamed line by line; Parquet (needs `pip install pyarrow`) is
+written one row group per chunk.
+"""
+import csv
+from datetime import date, datetime, time
+
+from django.utils import timezone
+
+from .models import Order, OrderItem, Payment, Sale
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional
+    pa = pq = None
+
+
+CHUNK_SIZE = 2000
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# name -> (queryset, date field for --since/--until, [(column, lookup, arrow type)])
+DATASETS = {
+    'sales': (Sale.objects, 'date', [
+        ('id', 'id', 'int64'),
+        ('date', 'date', 'timestamp'),
+        ('product_id', 'product_id', 'int64'),
+        ('product', 'product__name', 'string'),
+        ('category', 'product__category', 'string'),
+        ('quantity', 'quantity', 'int64'),
+        ('total_amount', 'total_amount', 'decimal'),
+    ]),
+    'orders': (Order.objects, 'created_at', [
+        ('id', 'id', 'int64'),
+        ('order_id', 'order_id', 'string'),
+        ('customer', 'customer__username', 'string'),
+        ('status', 'status', 'string'),
+        ('total_amount', 'total_amount', 'decimal'),
+        ('created_at', 'created_at', 'timestamp'),
+        ('updated_at', 'updated_at', 'timestamp'),
+    ]),
+    'order_items': (OrderItem.objects, 'order__created_at', [
+        ('id', 'id', 'int64'),
+        ('order_id', 'order__order_id', 'string'),
+        ('product_id', 'product_id', 'int64'),
+        ('product', 'product__name', 'string'),
+        ('quantity', 'quantity', 'int64'),
+        ('price', 'price', 'decimal'),
+    ]),
+    'payments': (Payment.objects, 'created_at', [
+        ('id', 'id', 'int64'),
+        ('order_id', 'order__order_id', 'string'),
+        ('phone_number', 'phone_number', 'string'),
+        ('amount', 'amount', 'decimal'),
+        ('status', 'status', 'string'),
+        ('mpesa_receipt_number', 'mpesa_receipt_number', 'string'),
+        ('transaction_date', 'transaction_date', 'timestamp'),
+        ('created_at', 'created_at', 'timestamp'),
+    ]),
+}
+
+
+def columns(dataset):
+    return [column for column, _, _ in DATASETS[dataset][2]]
+
+
+def _moment(value):
+    # Plain dates mean local midnight
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return timezone.make_aware(datetime.combine(value, time.min))
+    return value
+
+
+def rows(dataset, since=None, until=None):
+    manager, date_field, spec = DATASETS[dataset]
+    queryset = manager.all()
+    if since:
+        queryset = queryset.filter(**{f'{date_field}__gte': _moment(since)})
+    if until:
+        queryset = queryset.filter(**{f'{date_field}__lt': _moment(until)})
+    return (
+        queryset.order_by('pk')
+        .values_list(*[lookup for _, lookup, _ in spec])
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _safe_cell(value):
+    # Customer names and product names are user input: a leading ' keeps
+    # "=HYPERLINK(...)" a string when staff open the file in a spreadsheet
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_lines(dataset, since=None, until=None):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns(dataset))
+    for row in rows(dataset, since, until):
+        yield writer.writerow([_safe_cell(value) for value in row])
+
+
+def _arrow_schema(dataset):
+    types = {
+        'int64': pa.int64(),
+        'string': pa.string(),
+        'decimal': pa.decimal128(14, 2),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(column, types[kind]) for column, _, kind in DATASETS[dataset][2]])
+
+
+def _record_batch(chunk, schema):
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+        schema=schema,
+    )
+
+
+def write_parquet(dataset, path, since=None, until=None):
+    """Write `dataset` to a Parquet file at `path`. Returns the row count."""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = _arrow_schema(dataset)
+    written = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        chunk = []
+        for row in rows(dataset, since, until):
+            chunk.append(row)
+            if len(chunk) == CHUNK_SIZE:
+                writer.write_batch(_record_batch(chunk, schema))
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_batch(_record_batch(chunk, schema))
+            written += len(chunk)
+    return written
@@ -1,11 +1,43 @@
 from itertools import product
+import zipfile
 from django import forms
-from .models import OrderItem, Product, Sale
+from .models import OrderItem, Product, ProductImport, Sale
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
+from django.urls import reverse
 
 
 
+class ProductAutocomplete(forms.Select):
+    """
+    A product <select> that renders only the chosen product. Typing in the
+    search box static/js/autocomplete.js adds above it fetches matches from
+    inventory:product_autocomplete, so the page never carries the whole
+    catalogue.
+    """
+    class Media:
+        js = ('js/autocomplete.js',)
+
+    def __init__(self, attrs=None):
+        super().__init__({'class': 'form-select', **(attrs or {})})
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse('inventory:product_autocomplete')
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        chosen = [pk for pk in value if str(pk).isdigit()]
+        options = [self.create_option(name, '', '---------', not chosen, 0)]
+        if chosen:
+            field = self.choices.field
+            for product in self.choices.queryset.filter(pk__in=chosen):
+                options.append(self.create_option(
+                    name, product.pk, field.label_from_instance(product), True, len(options),
+                ))
+        return [(None, options, 0)]
+
+
 class CustomerSignupForm(UserCreationForm):
     email = forms.EmailField(required=True)
     
@@ -29,9 +61,18 @@ class SaleForm(forms.ModelForm):
         model = Sale
         fields = ['product', 'quantity']
         widgets = {
-            'product': forms.Select(attrs={'class': 'form-select'}),
-            'quantity': forms.NumberInput(attrs={'class': 'form-control'}),
+            'product': ProductAutocomplete,
+            'quantity': forms.NumberInput(attrs={'class': 'form-control', 'min': 1}),
         }
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data.get("quantity")
+
+        if quantity <= 0:
+            raise forms.ValidationError("Quantity must be greater than zero")
+
+        return quantity
+
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
@@ -43,6 +84,62 @@ class ProductForm(forms.ModelForm):
             field.widget.attrs.update({'class': 'form-control'})
             
             
+class ProductSearchForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        max_length=100,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'type': 'search', 'placeholder': 'Search products'}),
+    )
+    category = forms.ChoiceField(
+        required=False,
+        choices=[('', 'All categories')] + Product.CATEGORY_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    size = forms.CharField(required=False, max_length=10, widget=forms.HiddenInput)
+    min_price = forms.DecimalField(
+        required=False, min_value=0,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Min KES'}),
+    )
+    max_price = forms.DecimalField(
+        required=False, min_value=0,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Max KES'}),
+    )
+
+    def params(self):
+        """The valid, non-empty filters; invalid ones are ignored rather than reported."""
+        self.is_valid()
+        return {
+            name: value for name, value in self.cleaned_data.items()
+            if value not in (None, '')
+        }
+
+
+class ProductImportForm(forms.ModelForm):
+    class Meta:
+        model = ProductImport
+        fields = ['source', 'images']
+        labels = {
+            'source': 'Product sheet (.csv or .xlsx)',
+            'images': 'Photos (.zip, optional)',
+        }
+        widgets = {
+            'source': forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+            'images': forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.zip'}),
+        }
+
+    def clean_source(self):
+        source = self.cleaned_data['source']
+        if not source.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Upload a .csv or .xlsx file")
+        return source
+
+    def clean_images(self):
+        images = self.cleaned_data.get('images')
+        if images and not zipfile.is_zipfile(images):
+            raise forms.ValidationError("Upload a .zip file of photos")
+        return images
+
+
 class CustomLoginForm(AuthenticationForm):
     username = forms.CharField(
         widget=forms.TextInput(attrs={
@@ -57,9 +154,11 @@ class CustomLoginForm(AuthenticationForm):
         })
     )
 class OrderItemForm(forms.ModelForm):
+    # No price field: inventory.orders.add_items prices every item from the product
     class Meta:
         model = OrderItem
-        fields = ["product", "quantity", "price"]
+        fields = ["product", "quantity"]
+        widgets = {"product": ProductAutocomplete}
 
     def clean_quantity(self):
         quantity = self.cleaned_data.get("quantity")
@@ -67,4 +166,11 @@ class OrderItemForm(forms.ModelForm):
         if quantity <= 0:
             raise forms.ValidationError("Quantity must be greater than zero")
 
-        return quantity
\ No newline at end of file
+        return quantity
+
+class CartItemForm(forms.Form):
+    product = forms.ModelChoiceField(queryset=Product.objects.all(), widget=ProductAutocomplete)
+    quantity = forms.IntegerField(
+        min_value=0, initial=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control'}),
+    )
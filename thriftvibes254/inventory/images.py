@@ -0,0 +1,199 @@
+"""
+Upload image pipeline.
+
+Every product photo and profile picture is re-encoded into a few resized,
+EXIF-free WebP variants stored under content-hashed names, so the gallery
+serves a ~30 KB thumbnail instead of a multi-megabyte phone photo. Work runs
+on a small thread pool after the upload's transaction commits; templates
+fall back to the original until the variants exist.
+
+Variants are stored on the model as
+    {"source": "<original name>", "widths": {"320": "variants/<hash>.webp", ...}}
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .caching import bump_catalogue_version
+from .models import Product, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+# model -> (image field, variants field, target widths)
+IMAGE_FIELDS = {
+    Product: ('image', 'image_variants', (320, 640, 960)),
+    UserProfile: ('profile_pic', 'profile_pic_variants', (96, 240)),
+}
+
+WEBP_QUALITY = 80
+AVATAR_SIZE = 512
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='images',
+                )
+    return _executor
+
+
+def needs_variants(instance):
+    field, variants_field, _ = IMAGE_FIELDS[type(instance)]
+    image = getattr(instance, field)
+    if not image:
+        return False
+    return getattr(instance, variants_field).get('source') != image.name
+
+
+def schedule(instance):
+    """Build variants for `instance` in the background once the transaction commits."""
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: get_executor().submit(_run, model, pk))
+
+
+def _run(model, pk):
+    try:
+        build_for(model, pk)
+    except Exception:
+        logger.exception("Building image variants for %s %s failed", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def encode_variants(fp, widths):
+    """
+    Decode an image once and return {width: webp_bytes} for each target width
+    no wider than the original. Orientation is applied and metadata dropped.
+    """
+    with Image.open(fp) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        encoded = {}
+        for width in sorted(widths, reverse=True):
+            if width >= img.width and encoded:
+                continue
+            copy = img.copy()
+            copy.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            out = BytesIO()
+            # No exif= argument, so nothing from the original survives
+            copy.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+            encoded[min(width, img.width)] = out.getvalue()
+        return encoded
+
+
+def store(data):
+    """Save bytes under a name derived from their hash; identical output is stored once."""
+    name = f"variants/{hashlib.sha256(data).hexdigest()[:20]}.webp"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def build_for(model, pk):
+    """Synchronously (re)build variants for one row. Returns the variants dict or None."""
+    field, variants_field, widths = IMAGE_FIELDS[model]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_variants(instance):
+        return None
+
+    image = getattr(instance, field)
+    source = image.name
+    try:
+        with default_storage.open(source, 'rb') as fp:
+            encoded = encode_variants(fp, widths)
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as exc:
+        logger.warning("Cannot build variants for %s: %r", source, exc)
+        return None
+
+    variants = {
+        'source': source,
+        'widths': {str(width): store(data) for width, data in sorted(encoded.items())},
+    }
+    # Only apply if the image wasn't replaced while we were encoding
+    model.objects.filter(pk=pk, **{field: source}).update(**{variants_field: variants})
+    if model is Product:
+        from .catalogue import record_changes  # catalogue imports srcset from here
+        record_changes([pk])
+        bump_catalogue_version()
+    return variants
+
+
+def srcset(image, variants):
+    """Return (src, srcset) for an image field and its variants dict."""
+    if not image:
+        return None, ''
+    widths = variants.get('widths', {}) if variants.get('source') == image.name else {}
+    if not widths:
+        return image.url, ''
+    entries = sorted((int(width), name) for width, name in widths.items())
+    srcset = ', '.join(f"{default_storage.url(name)} {width}w" for width, name in entries)
+    return default_storage.url(entries[0][1]), srcset
+
+
+def queue_avatar(profile, upload):
+    """
+    Take ownership of an uploaded avatar's temp file and process it on the
+    pool. The profile keeps its old picture until the new one is ready.
+    """
+    fd, path = tempfile.mkstemp(prefix='avatar-', dir=settings.FILE_UPLOAD_TEMP_DIR)
+    os.close(fd)
+    if hasattr(upload, 'temporary_file_path'):
+        # Already on disk: just move it out of the request's way
+        os.replace(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as out:
+            for chunk in upload.chunks():
+                out.write(chunk)
+    profile_pk = profile.pk
+    transaction.on_commit(lambda: get_executor().submit(_run_avatar, profile_pk, path))
+
+
+def _run_avatar(profile_pk, path):
+    try:
+        process_avatar(profile_pk, path)
+    except Exception:
+        logger.exception("Processing avatar for profile %s failed", profile_pk)
+    finally:
+        close_old_connections()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def process_avatar(profile_pk, path):
+    """Decode, square-crop, re-encode and store an avatar, then swap it in."""
+    try:
+        with Image.open(path) as img:
+            img = ImageOps.exif_transpose(img)
+            img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+            img = ImageOps.fit(img, (AVATAR_SIZE, AVATAR_SIZE), Image.Resampling.LANCZOS)
+            out = BytesIO()
+            img.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning("Rejected avatar upload for profile %s: %r", profile_pk, exc)
+        return None
+
+    data = out.getvalue()
+    name = f"profiles/{hashlib.sha256(data).hexdigest()[:20]}.webp"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    # Queryset update: no post_save, so variants are built right here
+    UserProfile.objects.filter(pk=profile_pk).update(profile_pic=name, profile_pic_variants={})
+    build_for(UserProfile, profile_pk)
+    return name
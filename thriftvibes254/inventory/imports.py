@@ -0,0 +1,225 @@
+"""
+Bulk product import.
+
+A sheet (CSV, or XLSX when openpyxl is installed) is read one row at a time
+and each row is checked with the product form's own field rules. Valid rows
+are bulk_created BATCH_SIZE at a time, and every batch commits together with
+the import's `processed_rows` checkpoint, so a failed or interrupted import
+resumes after its last batch without creating anything twice.
+
+Photos named in an `image` column are pulled out of the uploaded zip on a
+thread pool once their batch has committed; see _attach_images.
+"""
+import csv
+import io
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django import forms
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, UnidentifiedImageError
+
+from . import images
+from .caching import bump_catalogue_version
+from .catalogue import record_changes
+from .models import Product, ProductImport
+
+try:
+    import openpyxl
+except ImportError:  # optional: `pip install openpyxl` enables .xlsx sheets
+    openpyxl = None
+
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('name', 'category', 'size', 'buying_price', 'selling_price', 'quantity')
+BATCH_SIZE = 200
+# Stop collecting row errors past this; a wrong sheet would otherwise store one per row
+MAX_ERRORS = 500
+
+RowForm = forms.modelform_factory(Product, fields=COLUMNS)
+
+# Accept "Hoodie" as well as "HOODIE"
+CATEGORY_CODES = {
+    name.lower(): code
+    for code, label in Product.CATEGORY_CHOICES
+    for name in (code, label)
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # One import at a time; each one already fans its images out
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='imports')
+    return _executor
+
+
+def start(product_import):
+    """Run `product_import` in the background once the transaction commits."""
+    pk = product_import.pk
+    transaction.on_commit(lambda: get_executor().submit(_run_in_background, pk))
+
+
+def _run_in_background(pk):
+    try:
+        run(pk)
+    finally:
+        close_old_connections()
+
+
+def read_rows(product_import):
+    """Yield each data row of the sheet as a {lowercased header: value} dict."""
+    name = product_import.source.name.lower()
+    with product_import.source.open('rb') as fp:
+        if name.endswith('.xlsx'):
+            if openpyxl is None:
+                raise ValueError("XLSX import needs openpyxl: pip install openpyxl")
+            workbook = openpyxl.load_workbook(fp, read_only=True, data_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+                for values in rows:
+                    if any(value not in (None, '') for value in values):
+                        yield {key: '' if value is None else value for key, value in zip(header, values)}
+            finally:
+                workbook.close()
+        else:
+            text = io.TextIOWrapper(fp, encoding='utf-8-sig', newline='')
+            for row in csv.DictReader(text):
+                yield {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+
+def validate(row):
+    """Returns (unsaved Product, None) or (None, {field: [messages]})."""
+    data = dict(row)
+    category = str(data.get('category', '')).strip().lower()
+    data['category'] = CATEGORY_CODES.get(category, data.get('category'))
+    form = RowForm(data)
+    if form.is_valid():
+        return form.save(commit=False), None
+    return None, {field: [str(message) for message in messages] for field, messages in form.errors.items()}
+
+
+def run(import_id, force=False, progress=None):
+    """
+    Import (or resume importing) one ProductImport. `force` also takes over
+    an import left RUNNING by a process that died. `progress(product_import)`
+    is called after every batch.
+    """
+    statuses = ('PENDING', 'FAILED', 'RUNNING') if force else ('PENDING', 'FAILED')
+    if not ProductImport.objects.filter(pk=import_id, status__in=statuses).update(status='RUNNING'):
+        return ProductImport.objects.get(pk=import_id)
+    product_import = ProductImport.objects.get(pk=import_id)
+
+    try:
+        if not product_import.total_rows:
+            product_import.total_rows = sum(1 for _ in read_rows(product_import))
+            product_import.save(update_fields=['total_rows', 'updated_at'])
+
+        with ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix='import-images') as pool:
+            # Photos of the last batch committed before an interruption
+            _attach_images(product_import, pool)
+
+            batch, errors = [], []
+            start_row = index = product_import.processed_rows
+            for index, row in enumerate(read_rows(product_import), start=1):
+                if index <= start_row:
+                    continue
+                product, row_errors = validate(row)
+                if product is None:
+                    # +1 for the header line, so numbers match the spreadsheet
+                    errors.append({'row': index + 1, 'errors': row_errors})
+                else:
+                    batch.append((product, str(row.get('image') or '').strip()))
+                if index - product_import.processed_rows >= BATCH_SIZE:
+                    _commit(product_import, batch, errors, index)
+                    _attach_images(product_import, pool)
+                    batch, errors = [], []
+                    if progress:
+                        progress(product_import)
+            if index > product_import.processed_rows:
+                _commit(product_import, batch, errors, index)
+                _attach_images(product_import, pool)
+                if progress:
+                    progress(product_import)
+
+        product_import.status = 'DONE'
+    except Exception as exc:
+        logger.exception("Product import %s failed", import_id)
+        product_import.status = 'FAILED'
+        product_import.errors = product_import.errors + [{'row': None, 'errors': {'import': [str(exc)]}}]
+    product_import.save(update_fields=['status', 'errors', 'updated_at'])
+    return product_import
+
+
+def _commit(product_import, batch, errors, processed_rows):
+    with transaction.atomic():
+        created = Product.objects.bulk_create([product for product, _ in batch])
+        # bulk_create skips post_save, so log the change for offline clients here
+        record_changes([product.pk for product in created])
+        transaction.on_commit(bump_catalogue_version)
+
+        product_import.pending_images = [
+            [product.pk, member] for product, (_, member) in zip(created, batch) if member
+        ]
+        product_import.processed_rows = processed_rows
+        product_import.created_count += len(created)
+        product_import.errors = (product_import.errors + errors)[:MAX_ERRORS]
+        product_import.save(update_fields=[
+            'pending_images', 'processed_rows', 'created_count', 'errors', 'updated_at',
+        ])
+
+
+def _attach_images(product_import, pool):
+    if not product_import.pending_images:
+        return
+    if not product_import.images:
+        errors = [
+            {'product': pk, 'image': member, 'errors': {'image': ["No image zip was uploaded"]}}
+            for pk, member in product_import.pending_images
+        ]
+    else:
+        storage, zip_name = product_import.images.storage, product_import.images.name
+        futures = [
+            pool.submit(_attach_one, storage, zip_name, pk, member)
+            for pk, member in product_import.pending_images
+        ]
+        errors = [error for error in (future.result() for future in futures) if error]
+    product_import.pending_images = []
+    product_import.errors = (product_import.errors + errors)[:MAX_ERRORS]
+    product_import.save(update_fields=['pending_images', 'errors', 'updated_at'])
+
+
+def _attach_one(storage, zip_name, pk, member):
+    """Copy one photo out of the zip onto product `pk`. Returns an error dict or None."""
+    try:
+        # Each worker opens its own handle: ZipFile objects aren't thread-safe
+        with storage.open(zip_name, 'rb') as fp, zipfile.ZipFile(fp) as archive:
+            info = archive.getinfo(member)
+            if info.file_size > settings.MAX_IMAGE_UPLOAD_BYTES:
+                raise ValueError(f"larger than {settings.MAX_IMAGE_UPLOAD_BYTES} bytes")
+            data = archive.read(info)
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        name = default_storage.save(f'products/{os.path.basename(member)}', ContentFile(data))
+        Product.objects.filter(pk=pk).update(image=name)
+        images.build_for(Product, pk)
+        return None
+    except KeyError:
+        return {'product': pk, 'image': member, 'errors': {'image': ["Not found in the zip"]}}
+    except (ValueError, zipfile.BadZipFile, UnidentifiedImageError, OSError) as exc:
+        return {'product': pk, 'image': member, 'errors': {'image': [str(exc)]}}
+    finally:
+        close_old_connections()
@@ -0,0 +1,157 @@
+"""
+Seed data and the scripted customer flow behind `manage.py bench_flows`.
+
+One flow is what a customer does end to end, through the real views and
+middleware via the test Client:
+
+    login -> add_to_cart (xN) -> create_order -> checkout_order
+          -> pay_order -> stk_push (the mpesa_worker's job) -> mpesa_callback
+
+STK pushes go to the local Daraja stub, so every step runs the same code as
+production without touching Safaricom.
+"""
+import random
+from decimal import Decimal, ROUND_CEILING
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.test import Client
+from django.urls import resolve, reverse
+
+from . import dispatch
+from .daraja_stub import build_callback
+from .models import Order, OrderItem, Payment, Product, generate_order_id
+
+
+STEPS = (
+    'login', 'add_to_cart', 'create_order', 'checkout_order',
+    'pay_order', 'stk_push', 'mpesa_callback',
+)
+PASSWORD = 'bench-password'
+BATCH = 2000
+
+WORDS = (
+    'vintage denim jacket hoodie oversized cropped graphic tee slim jeans '
+    'leather boots sneakers retro flannel shirt cargo pants bomber wool'
+).split()
+SIZES = ('XS', 'S', 'M', 'L', 'XL', '28', '30', '32', '40', '42')
+
+
+class FlowError(Exception):
+    """A step got a response the happy path never produces."""
+
+
+def seed(products, customers, orders, rng=None):
+    """
+    Bulk-create a shop of the given size: products with plenty of stock,
+    customers sharing one password, and past orders with items and payments.
+    Returns (customer usernames, product ids).
+    """
+    rng = rng or random.Random(254)
+    categories = [code for code, _ in Product.CATEGORY_CHOICES]
+    Product.objects.bulk_create((
+        Product(
+            name=' '.join(rng.sample(WORDS, 3)) + f' {i}',
+            category=rng.choice(categories),
+            size=rng.choice(SIZES),
+            buying_price=Decimal('200.00'),
+            selling_price=Decimal(rng.randrange(100, 8000)),
+            # Enough that checkouts never run a product out mid-benchmark
+            quantity=100_000,
+        )
+        for i in range(products)
+    ), batch_size=BATCH)
+    product_prices = dict(Product.objects.values_list('id', 'selling_price'))
+    product_ids = list(product_prices)
+
+    # Hashing once instead of per user keeps seeding fast; login still verifies it
+    password = make_password(PASSWORD)
+    User.objects.bulk_create((
+        User(username=f'bench{i}', password=password) for i in range(customers)
+    ), batch_size=BATCH)
+    users = list(User.objects.filter(username__startswith='bench').values_list('id', 'username'))
+
+    statuses = ('pending', 'confirmed', 'paid', 'paid', 'delivered', 'cancelled')
+    for start in range(0, orders, BATCH):
+        created = Order.objects.bulk_create(
+            Order(customer_id=rng.choice(users)[0], order_id=generate_order_id(), status=rng.choice(statuses))
+            for _ in range(min(BATCH, orders - start))
+        )
+        items, payments = [], []
+        for order in created:
+            total = Decimal(0)
+            for product_id in rng.sample(product_ids, rng.randint(1, min(3, len(product_ids)))):
+                quantity = rng.randint(1, 3)
+                items.append(OrderItem(order=order, product_id=product_id, quantity=quantity,
+                                       price=product_prices[product_id]))
+                total += quantity * product_prices[product_id]
+            order.total_amount = total
+            if order.status in ('paid', 'delivered'):
+                payments.append(Payment(
+                    order=order, phone_number='254700000000', amount=total,
+                    checkout_request_id=f'ws_CO_seed_{order.order_id}',
+                    status='SUCCESS', dispatch_status='SENT',
+                ))
+        OrderItem.objects.bulk_create(items, batch_size=BATCH)
+        Order.objects.bulk_update(created, ['total_amount'], batch_size=BATCH)
+        Payment.objects.bulk_create(payments, batch_size=BATCH)
+
+    return [username for _, username in users], product_ids
+
+
+def _expect(response, step, status=302):
+    if response.status_code != status:
+        raise FlowError(f"{step}: expected HTTP {status}, got {response.status_code}")
+    return response
+
+
+def _redirect_kwargs(response, step, url_name):
+    match = resolve(response.url)
+    if match.view_name != url_name:
+        raise FlowError(f"{step}: redirected to {match.view_name}, expected {url_name}")
+    return match.kwargs
+
+
+def run_flow(username, product_ids, items, timer, rng):
+    """
+    Walk one customer through a whole purchase. `timer(step)` returns a
+    context manager that records how long the step took.
+    """
+    client = Client()
+
+    with timer('login'):
+        response = client.post(reverse('inventory:login'), {'username': username, 'password': PASSWORD})
+    _expect(response, 'login')
+
+    cart_url = reverse('inventory:cart')
+    for product_id in rng.sample(product_ids, items):
+        with timer('add_to_cart'):
+            response = client.post(cart_url, {'product': product_id, 'quantity': 1})
+        _expect(response, 'add_to_cart')
+
+    with timer('create_order'):
+        response = client.post(reverse('inventory:create_order'))
+    order_id = _redirect_kwargs(_expect(response, 'create_order'), 'create_order', 'inventory:checkout_order')['order_id']
+
+    with timer('checkout_order'):
+        response = client.post(reverse('inventory:checkout_order', args=[order_id]))
+    _redirect_kwargs(_expect(response, 'checkout_order'), 'checkout_order', 'inventory:order_confirmation')
+
+    with timer('pay_order'):
+        response = client.post(reverse('inventory:pay_order', args=[order_id]), {'phone': '254700000000'})
+    payment_id = _redirect_kwargs(_expect(response, 'pay_order'), 'pay_order', 'inventory:payment_detail')['payment_id']
+
+    with timer('stk_push'):
+        if dispatch.claim(payment_id):
+            dispatch.send(payment_id)
+    payment = Payment.objects.get(pk=payment_id)
+    if payment.dispatch_status != 'SENT':
+        raise FlowError(f"stk_push: payment {payment_id} is {payment.dispatch_status}: {payment.last_error}")
+
+    callback = build_callback(
+        payment.checkout_request_id, payment.merchant_request_id,
+        amount=int(payment.amount.quantize(Decimal('1'), rounding=ROUND_CEILING)),
+    )
+    with timer('mpesa_callback'):
+        response = client.post(reverse('inventory:mpesa_callback'), callback, content_type='application/json')
+    _expect(response, 'mpesa_callback', status=200)
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.analytics import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily/weekly/monthly sales rollups from all sales and paid orders."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild()
+        self.stdout.write(f"Wrote {written} rollup row(s) in {time.perf_counter() - started:.2f}s")
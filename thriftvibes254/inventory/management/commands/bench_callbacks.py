@@ -0,0 +1,86 @@
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from inventory import batcher
+from inventory.bench import format_row, isolated_database
+from inventory.daraja_stub import build_callback
+from inventory.models import Order, Payment
+from inventory.views import mpesa_callback
+
+
+class Command(BaseCommand):
+    help = "Replay M-Pesa callbacks (including Safaricom-style retries) against mpesa_callback."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10_000,
+                            help="Number of distinct payments to call back.")
+        parser.add_argument('--replay-ratio', type=float, default=0.3,
+                            help="Fraction of callbacks delivered a second time.")
+        parser.add_argument('--deferred', action='store_true',
+                            help="Stage callbacks and apply them with the batch writer.")
+
+    def handle(self, *args, **options):
+        settings.MPESA_CALLBACK_MODE = "deferred" if options['deferred'] else "direct"
+        with isolated_database():
+            bodies = self.seed(options['count'])
+            replays = random.sample(bodies, int(len(bodies) * options['replay_ratio']))
+            self.run(bodies + replays, options['count'])
+
+    def seed(self, count):
+        user = User.objects.create(username='bench')
+        orders = Order.objects.bulk_create(
+            Order(customer=user, order_id=f"TV-BENCH-{i}") for i in range(count)
+        )
+        payments = Payment.objects.bulk_create(
+            Payment(
+                order=order,
+                phone_number='254700000000',
+                amount=Decimal('100.00'),
+                checkout_request_id=f"ws_CO_{i}",
+                merchant_request_id=f"MR_{i}",
+                dispatch_status='SENT',
+            )
+            for i, order in enumerate(orders)
+        )
+        return [
+            json.dumps(build_callback(
+                p.checkout_request_id, p.merchant_request_id,
+                amount=100, result_code=0 if i % 10 else 1032,
+            ))
+            for i, p in enumerate(payments)
+        ]
+
+    def run(self, bodies, count):
+        factory = RequestFactory()
+        samples = []
+        start = time.perf_counter()
+        for body in bodies:
+            request = factory.post('/mpesa/callback/', body, content_type='application/json')
+            t0 = time.perf_counter()
+            mpesa_callback(request)
+            samples.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(format_row(f"{len(bodies)} callbacks", samples))
+        self.stdout.write(f"ingest throughput: {len(bodies) / elapsed:.0f} callbacks/s")
+
+        if settings.MPESA_CALLBACK_MODE == "deferred":
+            start = time.perf_counter()
+            while batcher.drain(500)[0]:
+                pass
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"batch apply throughput: {len(bodies) / elapsed:.0f} callbacks/s")
+
+        settled = Payment.objects.exclude(status='PENDING').count()
+        paid_orders = Order.objects.filter(status='paid').count()
+        successes = Payment.objects.filter(status='SUCCESS').count()
+        self.stdout.write(f"settled payments: {settled}/{count}, paid orders: {paid_orders}")
+        if settled != count or paid_orders != successes:
+            raise CommandError("Replayed callbacks were applied more than once or lost")
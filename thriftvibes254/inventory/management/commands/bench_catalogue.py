@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from inventory.bench import format_row, isolated_database, time_calls
+from inventory.models import Product
+from inventory.pagination import NEWEST, encode_cursor
+from inventory.views import product_gallery, product_list
+
+
+class Command(BaseCommand):
+    help = "Benchmark catalogue page latency at the first, middle and last page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--runs', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            self.seed(options['products'])
+            self.run(options['products'], options['runs'])
+
+    def seed(self, count):
+        self.stdout.write(f"Seeding {count} products...")
+        categories = [code for code, _ in Product.CATEGORY_CHOICES]
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=f"Item {i}",
+                category=categories[i % len(categories)],
+                size='M',
+                buying_price=Decimal('200.00'),
+                selling_price=Decimal('450.00'),
+                quantity=1 + i % 5,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def run(self, count, runs):
+        factory = RequestFactory()
+        for view, key in ((product_list, NEWEST), (product_gallery, ('id',))):
+            ordered = Product.objects.order_by(*[f'-{field}' for field in key])
+            cursors = {
+                'first page': None,
+                'middle page': encode_cursor(ordered[count // 2], key),
+                'last page': encode_cursor(ordered[max(count - 2, 0)], key),
+            }
+            for label, cursor in cursors.items():
+                params = {'after': cursor} if cursor else {}
+                request = factory.get('/products/', params)
+                samples = time_calls(lambda: view(request), runs)
+                self.stdout.write(format_row(f"{view.__name__} {label}", samples))
@@ -0,0 +1,167 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from inventory import mpesa
+from inventory.bench import format_row, isolated_database, percentiles
+from inventory.daraja_stub import DarajaStubServer
+from inventory.loadtest import STEPS, run_flow, seed
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'flows.json'
+# Sub-millisecond steps jitter by more than any sane percentage
+SLACK_MS = 2.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a shop and time the customer purchase flow step by step against "
+        "a stub Daraja. Fails when a step is slower than the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=5000,
+                            help="Past orders (with items and payments) to seed.")
+        parser.add_argument('--flows', type=int, default=50,
+                            help="Complete purchases to run.")
+        parser.add_argument('--items', type=int, default=3,
+                            help="Items added to each order.")
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Customers shopping at once (PostgreSQL only).")
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help="Simulated Daraja latency per request, in seconds.")
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument('--save-baseline', action='store_true',
+                            help="Store this run as the baseline instead of comparing.")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed slowdown over the baseline, as a fraction.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] > 1 and connection.vendor == 'sqlite':
+            # The in-memory test database locks the whole table on every write
+            raise CommandError("--concurrency > 1 needs PostgreSQL (DB_ENGINE=postgres).")
+
+        with isolated_database(), DarajaStubServer(latency=options['latency']) as stub, \
+                override_settings(MPESA_BASE_URL=stub.url, MPESA_CALLBACK_MODE='direct'):
+            mpesa.reset_client()
+            try:
+                self.stdout.write(
+                    f"Seeding {options['products']} products, {options['customers']} customers, "
+                    f"{options['orders']} orders..."
+                )
+                usernames, product_ids = seed(options['products'], options['customers'], options['orders'])
+                result = self.run(usernames, product_ids, options)
+            finally:
+                mpesa.reset_client()
+
+        self.report(result)
+        if options['save_baseline']:
+            self.save_baseline(options['baseline'], result, options)
+        else:
+            self.compare(options['baseline'], result, options)
+
+    def run(self, usernames, product_ids, options):
+        samples = defaultdict(list)
+        lock = threading.Lock()
+
+        @contextmanager
+        def timer(step):
+            start = time.perf_counter()
+            yield
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                samples[step].append(elapsed)
+
+        def worker(index):
+            rng = random.Random(index)
+            try:
+                for flow in range(index, options['flows'], options['concurrency']):
+                    run_flow(usernames[flow % len(usernames)], product_ids, options['items'], timer, rng)
+            finally:
+                if options['concurrency'] > 1:
+                    connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            # .result() re-raises a FlowError from any worker
+            for future in [pool.submit(worker, index) for index in range(options['concurrency'])]:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'vendor': connection.vendor,
+            'flows_per_second': options['flows'] / elapsed,
+            'requests_per_second': sum(len(s) for s in samples.values()) / elapsed,
+            'steps': {step: percentiles(samples[step]) for step in STEPS},
+            'samples': samples,
+        }
+
+    def report(self, result):
+        for step in STEPS:
+            samples = result['samples'][step]
+            rate = len(samples) / (sum(samples) / 1000) if samples else 0
+            self.stdout.write(f"{format_row(step, samples)}  {rate:8.1f} req/s")
+        self.stdout.write(
+            f"{'whole flow':<32} {result['flows_per_second']:.2f} flows/s, "
+            f"{result['requests_per_second']:.1f} requests/s"
+        )
+
+    def workload(self, options):
+        keys = ('products', 'customers', 'orders', 'flows', 'items', 'concurrency', 'latency')
+        return {key: options[key] for key in keys}
+
+    def save_baseline(self, path, result, options):
+        # One baseline per database: SQLite and PostgreSQL numbers aren't comparable
+        baselines = json.loads(path.read_text()) if path.exists() else {}
+        baselines[result['vendor']] = {
+            'workload': self.workload(options),
+            'flows_per_second': round(result['flows_per_second'], 3),
+            'steps': {
+                step: {name: round(value, 3) for name, value in stats.items()}
+                for step, stats in result['steps'].items()
+            },
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(self.style.SUCCESS(f"Saved {result['vendor']} baseline to {path}"))
+
+    def compare(self, path, result, options):
+        baseline = (json.loads(path.read_text()) if path.exists() else {}).get(result['vendor'])
+        if baseline is None:
+            self.stdout.write(f"No {result['vendor']} baseline in {path}; run with --save-baseline to store one.")
+            return
+        if baseline['workload'] != self.workload(options):
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was recorded with {baseline['workload']}; numbers may not be comparable."
+            ))
+
+        allowed = 1 + options['threshold']
+        failures = []
+        # Gated on medians: with a few dozen flows the p95 is the third-slowest
+        # sample and moves by 2x between identical runs
+        for step, stats in result['steps'].items():
+            before = baseline['steps'].get(step, {}).get('p50')
+            if before is not None and stats['p50'] > before * allowed + SLACK_MS:
+                failures.append(f"{step} p50: {stats['p50']:.2f}ms (baseline {before:.2f}ms)")
+        if result['flows_per_second'] * allowed < baseline['flows_per_second']:
+            failures.append(
+                f"throughput: {result['flows_per_second']:.2f} flows/s "
+                f"(baseline {baseline['flows_per_second']:.2f})"
+            )
+
+        if failures:
+            raise CommandError(
+                f"Slower than the baseline by more than {options['threshold']:.0%}:\n  " + '\n  '.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS(f"Within {options['threshold']:.0%} of the baseline."))
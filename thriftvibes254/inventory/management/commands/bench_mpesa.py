@@ -0,0 +1,42 @@
+import requests
+from django.core.management.base import BaseCommand
+
+from inventory.bench import format_row, time_calls
+from inventory.daraja_stub import DarajaStubServer
+from inventory.mpesa import DarajaClient
+
+
+class Command(BaseCommand):
+    help = "Compare per-payment STK push latency: fresh OAuth per call vs the pooled client."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help="Simulated Daraja latency per request, in seconds.")
+
+    def handle(self, *args, **options):
+        with DarajaStubServer(latency=options['latency']) as stub:
+            def unpooled_push():
+                # What stk_push used to do: new connection + OAuth every time
+                token = requests.get(
+                    f"{stub.url}/oauth/v1/generate?grant_type=client_credentials",
+                    auth=("key", "secret"),
+                ).json()["access_token"]
+                requests.post(
+                    f"{stub.url}/mpesa/stkpush/v1/processrequest",
+                    json={"Amount": 1, "PhoneNumber": "254700000000"},
+                    headers={"Authorization": f"Bearer {token}"},
+                ).json()
+
+            client = DarajaClient(base_url=stub.url, consumer_key="key", consumer_secret="secret")
+            client.invalidate_token()
+
+            before = stub.state.oauth_calls
+            samples = time_calls(unpooled_push, options['runs'])
+            self.stdout.write(format_row("unpooled (OAuth per push)", samples))
+            self.stdout.write(f"  oauth calls: {stub.state.oauth_calls - before}")
+
+            before = stub.state.oauth_calls
+            samples = time_calls(lambda: client.stk_push("254700000000", 1, 1), options['runs'])
+            self.stdout.write(format_row("pooled DarajaClient", samples))
+            self.stdout.write(f"  oauth calls: {stub.state.oauth_calls - before}")
@@ -0,0 +1,81 @@
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from inventory.bench import format_row, isolated_database
+from inventory.models import Order, generate_order_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare order creation: the old probe-then-insert order_id on an "
+        "unindexed column against the unique-index generator."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--existing', type=int, default=100_000,
+                            help="Orders already in the table.")
+        parser.add_argument('--orders', type=int, default=500,
+                            help="Orders to create for each variant.")
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            customer = User.objects.create_user('bench')
+            self.seed(customer, options['existing'])
+
+            with self.unindexed_order_id():
+                before = self.measure(lambda: self.legacy_create(customer), options['orders'])
+            after = self.measure(lambda: Order.objects.create(customer=customer), options['orders'])
+
+        for label, (samples, queries) in (('before: probe + insert', before), ('after: unique index', after)):
+            total = sum(samples) / 1000
+            self.stdout.write(
+                f"{format_row(label, samples)}  {len(samples) / total:8.0f} orders/s  {queries} statements/order"
+            )
+
+    def seed(self, customer, count):
+        self.stdout.write(f"Seeding {count} orders...")
+        for start in range(0, count, 5000):
+            Order.objects.bulk_create(
+                Order(customer=customer, order_id=generate_order_id())
+                for _ in range(min(5000, count - start))
+            )
+
+    @contextmanager
+    def unindexed_order_id(self):
+        """Temporarily put order_id back the way it was: no index at all."""
+        indexed = Order._meta.get_field('order_id')
+        plain = models.CharField(max_length=40, blank=True, null=True)
+        plain.set_attributes_from_name('order_id')
+        plain.model = Order
+        with connection.schema_editor() as editor:
+            editor.alter_field(Order, indexed, plain)
+        try:
+            yield
+        finally:
+            with connection.schema_editor() as editor:
+                editor.alter_field(Order, plain, indexed)
+
+    def legacy_create(self, customer):
+        # The generator Order.save used before: 4 random chars and a lookup first
+        base = timezone.now().strftime('%Y%m%d%H%M%S')
+        candidate = f"TV-{base}-{get_random_string(4).upper()}"
+        while Order.objects.filter(order_id=candidate).exists():
+            candidate = f"TV-{base}-{get_random_string(4).upper()}"
+        Order.objects.create(customer=customer, order_id=candidate)
+
+    def measure(self, create, count):
+        with CaptureQueriesContext(connection) as captured:
+            create()
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            create()
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples, len(captured.captured_queries)
@@ -0,0 +1,67 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from inventory import search
+from inventory.bench import format_row, isolated_database, time_calls
+from inventory.models import Product
+from inventory.views import product_gallery
+
+WORDS = (
+    'vintage denim jacket hoodie oversized cropped graphic tee slim jeans '
+    'leather boots sneakers retro flannel shirt cargo pants bomber wool'
+).split()
+SIZES = ('XS', 'S', 'M', 'L', 'XL', '28', '30', '32', '40', '42')
+
+
+class Command(BaseCommand):
+    help = "Benchmark product search and facet latency against a seeded catalogue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--runs', type=int, default=30)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            self.seed(options['products'])
+            self.run(options['runs'])
+
+    def seed(self, count):
+        self.stdout.write(f"Seeding {count} products...")
+        rng = random.Random(254)
+        categories = [code for code, _ in Product.CATEGORY_CHOICES]
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rng.sample(WORDS, 3)) + f' {i}',
+                category=rng.choice(categories),
+                size=rng.choice(SIZES),
+                buying_price=Decimal('200.00'),
+                selling_price=Decimal(rng.randrange(100, 8000)),
+                quantity=1 + i % 5,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def run(self, runs):
+        cases = {
+            'no filters': {},
+            'one word': {'q': 'denim'},
+            'prefix, two words': {'q': 'vint jack'},
+            'word + category': {'q': 'boots', 'category': 'SHOES'},
+            'word + size + price': {'q': 'hoodie', 'size': 'M', 'min_price': Decimal(500), 'max_price': Decimal(1000)},
+            'rare word': {'q': 'bomber wool cargo'},
+        }
+        for label, params in cases.items():
+            self.stdout.write(format_row(f"results {label}", time_calls(lambda: list(search.search(params)[:25]), runs)))
+            self.stdout.write(format_row(f"facets  {label}", time_calls(lambda: search.facets(params), runs)))
+
+        # Whole view, cache disabled by a new catalogue version per request
+        factory = RequestFactory()
+        request = factory.get('/gallery/', {'q': 'denim', 'category': 'JEANS'})
+        samples = time_calls(lambda: (Product.objects.first().save(), product_gallery(request)), runs)
+        self.stdout.write(format_row("gallery view, uncached", samples))
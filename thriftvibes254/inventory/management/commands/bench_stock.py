@@ -0,0 +1,65 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections
+
+from inventory.bench import isolated_database
+from inventory.models import Product
+from inventory.stock import take_stock
+
+
+class Command(BaseCommand):
+    help = "Hammer take_stock from many threads and check nothing is oversold."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--attempts', type=int, default=200,
+                            help="Sale attempts per thread.")
+        parser.add_argument('--stock', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            product = Product.objects.create(
+                name='Last hoodie', category='HOODIE', size='L',
+                buying_price=Decimal('300'), selling_price=Decimal('800'),
+                quantity=options['stock'],
+            )
+            sold = self.run(product.pk, options['threads'], options['attempts'])
+            product.refresh_from_db()
+
+            self.stdout.write(f"started with {options['stock']}, sold {sold}, left {product.quantity}")
+            if sold + product.quantity != options['stock'] or sold > options['stock']:
+                raise CommandError("Stock was oversold or lost")
+            self.stdout.write("zero oversells")
+
+    def run(self, product_id, threads, attempts):
+        sold = []
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def worker():
+            start.wait()
+            mine = 0
+            try:
+                for _ in range(attempts):
+                    while True:
+                        try:
+                            ok = take_stock(product_id, 1)
+                            break
+                        except OperationalError:
+                            # SQLite "database is locked" - writers just queue up
+                            time.sleep(0.001)
+                    mine += ok
+            finally:
+                close_old_connections()
+            with lock:
+                sold.append(mine)
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return sum(sold)
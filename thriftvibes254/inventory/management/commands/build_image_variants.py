@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from inventory import images
+
+
+class Command(BaseCommand):
+    help = "Build missing WebP variants for product photos and profile pictures."
+
+    def handle(self, *args, **options):
+        for model, (field, _, _) in images.IMAGE_FIELDS.items():
+            built = 0
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f"{field}__isnull": True})
+            for instance in rows.iterator(chunk_size=500):
+                if images.needs_variants(instance) and images.build_for(model, instance.pk):
+                    built += 1
+            self.stdout.write(f"{model.__name__}: built variants for {built} image(s)")
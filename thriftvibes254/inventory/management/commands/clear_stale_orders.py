@@ -0,0 +1,26 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from inventory.orders import delete_stale
+
+
+class Command(BaseCommand):
+    help = "Delete pending orders that were abandoned before payment."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help="Age after which an untouched pending order is stale (default: STALE_ORDER_HOURS).")
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep running, sweeping every N seconds (default: sweep once).")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['hours']) if options['hours'] is not None else None
+        while True:
+            deleted = delete_stale(max_age)
+            if deleted:
+                self.stdout.write(f"Deleted {deleted} stale pending order(s)")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.catalogue import compact
+
+
+class Command(BaseCommand):
+    help = "Trim the catalogue change log to the newest row per product."
+
+    def handle(self, *args, **options):
+        deleted = compact()
+        self.stdout.write(f"Removed {deleted} superseded change row(s)")
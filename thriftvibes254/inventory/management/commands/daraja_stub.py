@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.daraja_stub import DarajaStubServer
+
+
+class Command(BaseCommand):
+    help = "Run a local stub of the Daraja API (set MPESA_BASE_URL to its URL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help="Seconds to sleep before every response.")
+
+    def handle(self, *args, **options):
+        stub = DarajaStubServer(port=options['port'], latency=options['latency']).start()
+        self.stdout.write(f"Daraja stub listening on {stub.url} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stub.stop()
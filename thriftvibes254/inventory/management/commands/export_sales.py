@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from inventory.exports import DATASETS, csv_lines, write_parquet
+
+
+class Command(BaseCommand):
+    help = "Export sales, orders, order items and payments to CSV or Parquet files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', action='append', choices=sorted(DATASETS),
+                            help="Dataset to export; repeat for several (default: all).")
+        parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+        parser.add_argument('--output', default='exports', help="Directory to write into.")
+        parser.add_argument('--since', help="Only rows on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--until', help="Only rows before this date (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        since, until = self._date(options['since']), self._date(options['until'])
+        os.makedirs(options['output'], exist_ok=True)
+
+        for dataset in options['dataset'] or DATASETS:
+            path = os.path.join(options['output'], f"{dataset}.{options['format']}")
+            started = time.perf_counter()
+            if options['format'] == 'parquet':
+                try:
+                    written = write_parquet(dataset, path, since, until)
+                except RuntimeError as exc:
+                    raise CommandError(str(exc))
+            else:
+                written = -1  # header line
+                with open(path, 'w', newline='', encoding='utf-8') as f:
+                    for line in csv_lines(dataset, since, until):
+                        f.write(line)
+                        written += 1
+            self.stdout.write(f"{dataset}: {written} row(s) -> {path} in {time.perf_counter() - started:.2f}s")
+
+    def _date(self, value):
+        if not value:
+            return None
+        try:
+            parsed = parse_date(value)
+        except ValueError:  # well formed but impossible, e.g. 2026-13-01
+            parsed = None
+        if parsed is None:
+            raise CommandError(f"Not a date: {value}")
+        return parsed
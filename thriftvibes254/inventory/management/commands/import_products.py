@@ -0,0 +1,54 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.imports import run
+from inventory.models import ProductImport
+
+
+class Command(BaseCommand):
+    help = "Bulk-import products from a CSV/XLSX sheet, or resume an earlier import."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sheet', nargs='?', help="CSV or XLSX file, one product per row.")
+        parser.add_argument('--images', help="Zip of the photos named in the sheet's image column.")
+        parser.add_argument('--resume', type=int, metavar='IMPORT_ID',
+                            help="Continue an interrupted or failed import after its last committed batch.")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            if not ProductImport.objects.filter(pk=options['resume']).exists():
+                raise CommandError(f"No import #{options['resume']}")
+            import_id = options['resume']
+        elif options['sheet']:
+            import_id = self._create(options['sheet'], options['images']).pk
+        else:
+            raise CommandError("Give a sheet to import or --resume IMPORT_ID")
+
+        # --resume also takes over an import left RUNNING by a process that died
+        product_import = run(import_id, force=bool(options['resume']), progress=self._progress)
+        self.stdout.write(
+            f"Import #{product_import.pk} {product_import.status}: "
+            f"{product_import.created_count} created, {len(product_import.errors)} problem(s)"
+        )
+        for error in product_import.errors[:20]:
+            self.stdout.write(f"  {error}")
+
+    def _create(self, sheet, images):
+        product_import = ProductImport()
+        for field, path in (('source', sheet), ('images', images)):
+            if not path:
+                continue
+            if not os.path.exists(path):
+                raise CommandError(f"{path} does not exist")
+            with open(path, 'rb') as f:
+                getattr(product_import, field).save(os.path.basename(path), File(f), save=False)
+        product_import.save()
+        return product_import
+
+    def _progress(self, product_import):
+        self.stdout.write(
+            f"{product_import.processed_rows}/{product_import.total_rows} rows, "
+            f"{product_import.created_count} created"
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from inventory import batcher
+
+
+class Command(BaseCommand):
+    help = "Apply staged M-Pesa callbacks in batches and reconcile stuck payments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval-ms', type=int, default=200,
+                            help="How long to wait between partial batches.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--reconcile-every', type=float, default=60,
+                            help="Seconds between Daraja STK query reconciliation runs (0 disables).")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain what is staged now, reconcile once and exit.")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            total = 0
+            while True:
+                read, applied = batcher.drain(options['batch_size'])
+                total += applied
+                if read < options['batch_size']:
+                    break
+            reconciled = batcher.reconcile() if options['reconcile_every'] else 0
+            self.stdout.write(f"Applied {total} callback(s), reconciled {reconciled} payment(s)")
+            return
+
+        batcher.run(
+            interval_ms=options['interval_ms'],
+            batch_size=options['batch_size'],
+            reconcile_every=options['reconcile_every'] or None,
+        )
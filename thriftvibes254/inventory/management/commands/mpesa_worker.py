@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inventory import batcher
+from inventory.dispatch import dispatch_due, requeue_stale
+
+
+class Command(BaseCommand):
+    help = "Send queued M-Pesa STK pushes in the background."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.MPESA_DISPATCH_CONCURRENCY,
+                            help="Maximum STK pushes in flight at once.")
+        parser.add_argument('--batch', type=int, default=100)
+        parser.add_argument('--idle-sleep', type=float, default=0.5,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain a single batch and exit.")
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            requeue_stale()
+            while True:
+                sent = dispatch_due(executor, options['batch'])
+                if sent:
+                    self.stdout.write(f"Dispatched {sent} STK push(es)")
+                if settings.MPESA_CALLBACK_MODE == 'direct':
+                    # Callbacks that beat their push's CheckoutRequestID into the
+                    # database; in deferred mode mpesa_batcher drains these
+                    batcher.drain()
+                if options['once']:
+                    break
+                if not sent:
+                    requeue_stale()
+                    time.sleep(options['idle_sleep'])
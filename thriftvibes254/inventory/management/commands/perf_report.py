@@ -0,0 +1,97 @@
+import re
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.metrics import N_PLUS_ONE_THRESHOLD, PREFIX
+
+SAMPLE = re.compile(r'^(?P<name>\w+)\{(?P<labels>.*)\} (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the slowest and chattiest views and likely N+1 queries from a "
+        "running server's /metrics/ endpoint (metrics live in the server process)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/metrics/')
+        parser.add_argument('--token', default=settings.METRICS_TOKEN,
+                            help="Bearer token (default: METRICS_TOKEN).")
+        parser.add_argument('--top', type=int, default=10)
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+        try:
+            response = requests.get(options['url'], headers=headers, timeout=10)
+            response.raise_for_status()
+        except requests.RequestException as exc:
+            raise CommandError(f"Could not read {options['url']}: {exc}")
+
+        views, n_plus_one = self.parse(response.text)
+        if not views:
+            self.stdout.write("No requests recorded yet.")
+            return
+
+        self.stdout.write(
+            f"{'view':<40} {'requests':>8} {'total s':>8} {'avg ms':>8} {'p95 ms':>8} "
+            f"{'queries':>8} {'db ms':>8} {'tmpl ms':>8}"
+        )
+        ranked = sorted(views.items(), key=lambda item: item[1]['request_seconds']['sum'], reverse=True)
+        for view, series in ranked[:options['top']]:
+            latency = series['request_seconds']
+            self.stdout.write(
+                f"{view[:40]:<40} {latency['count']:>8.0f} {latency['sum']:>8.2f} "
+                f"{self.mean(latency) * 1000:>8.1f} {self.quantile(latency, 0.95) * 1000:>8.0f} "
+                f"{self.mean(series.get('db_queries')):>8.1f} "
+                f"{self.mean(series.get('db_seconds')) * 1000:>8.1f} "
+                f"{self.mean(series.get('template_seconds')) * 1000:>8.1f}"
+            )
+
+        if n_plus_one:
+            self.stdout.write(f"\nLikely N+1 (same statement >= {N_PLUS_ONE_THRESHOLD}x in one request):")
+            for (view, query), (requests_seen, most) in sorted(
+                n_plus_one.items(), key=lambda item: item[1][1], reverse=True,
+            ):
+                self.stdout.write(f"  {view}: up to {most:.0f}x in {requests_seen:.0f} sampled request(s)")
+                self.stdout.write(f"    {query[:160]}")
+
+    def parse(self, text):
+        views = defaultdict(lambda: defaultdict(lambda: {'buckets': [], 'sum': 0.0, 'count': 0.0}))
+        n_plus_one = defaultdict(lambda: [0.0, 0.0])
+        for line in text.splitlines():
+            match = SAMPLE.match(line)
+            if not match:
+                continue
+            name, value = match['name'], float(match['value'])
+            labels = {key: raw.replace('\\"', '"').replace('\\\\', '\\') for key, raw in LABEL.findall(match['labels'])}
+            metric = name.removeprefix(f'{PREFIX}_')
+            if metric.startswith('n_plus_one_'):
+                index = 0 if metric == 'n_plus_one_requests_total' else 1
+                n_plus_one[(labels['view'], labels['query'])][index] = value
+                continue
+            for suffix in ('_bucket', '_sum', '_count'):
+                if metric.endswith(suffix):
+                    series = views[labels['view']][metric.removesuffix(suffix)]
+                    if suffix == '_bucket':
+                        series['buckets'].append((float(labels['le']), value))
+                    else:
+                        series[suffix[1:]] = value
+                    break
+        return views, n_plus_one
+
+    def mean(self, series):
+        if not series or not series['count']:
+            return 0.0
+        return series['sum'] / series['count']
+
+    def quantile(self, series, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        target = q * series['count']
+        for bound, cumulative in series['buckets']:
+            if cumulative >= target:
+                return bound if bound != float('inf') else series['buckets'][-2][0]
+        return 0.0
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = "Release stock held by confirmed orders that were not paid in time."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep running, sweeping every N seconds (default: sweep once).")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired()
+            if released:
+                self.stdout.write(f"Released {released} expired hold(s)")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,183 @@
+"""
+In-process request metrics, exposed in Prometheus text format at /metrics/.
+
+Every request's latency goes into a histogram labelled with its URL name.
+A sample of requests (PERF_SAMPLE_RATE) also records DB query count, DB
+time and template render time, and flags queries repeated often enough in
+one request to look like an N+1. See inventory.middleware.PerfMiddleware and
+`manage.py perf_report`.
+
+Label values are URL names, never raw paths, so the number of series stays
+bounded by the URLconf.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.template.backends.django import Template as DjangoTemplate
+
+
+PREFIX = 'thriftvibes'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# name -> (help text, buckets)
+HISTOGRAMS = {
+    'request_seconds': ("Total time spent in the view and middleware.", LATENCY_BUCKETS),
+    'db_queries': ("Database queries per sampled request.", QUERY_BUCKETS),
+    'db_seconds': ("Time spent in database queries per sampled request.", LATENCY_BUCKETS),
+    'template_seconds': ("Time spent rendering templates per sampled request.", LATENCY_BUCKETS),
+}
+
+# The same statement this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+MAX_N_PLUS_ONE_SERIES = 200
+
+_lock = threading.Lock()
+_histograms = {}
+_n_plus_one = {}
+
+current = ContextVar('perf_request_stats', default=None)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Per-request accumulator; its `execute` is installed as a DB execute_wrapper."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+def observe(name, view, value):
+    with _lock:
+        histogram = _histograms.get((name, view))
+        if histogram is None:
+            histogram = _histograms[(name, view)] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+
+def record(view, elapsed, stats=None):
+    observe('request_seconds', view, elapsed)
+    if stats is None:
+        return
+    observe('db_queries', view, stats.queries)
+    observe('db_seconds', view, stats.db_seconds)
+    observe('template_seconds', view, stats.template_seconds)
+
+    repeated = [(sql, n) for sql, n in stats.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+    if not repeated:
+        return
+    with _lock:
+        for sql, repeats in repeated:
+            key = (view, fingerprint(sql))
+            seen = _n_plus_one.get(key)
+            if seen is None and len(_n_plus_one) >= MAX_N_PLUS_ONE_SERIES:
+                continue
+            requests, most = seen or (0, 0)
+            _n_plus_one[key] = (requests + 1, max(most, repeats))
+
+
+def fingerprint(sql):
+    sql = re.sub(r'\s+', ' ', sql)
+    # The column list is noise; the FROM/WHERE part identifies the query
+    sql = re.sub(r'^SELECT (DISTINCT )?.*? FROM ', r'SELECT \1... FROM ', sql)
+    # IN lists of different lengths are the same query
+    sql = re.sub(r'IN \((?:%s, )*%s\)', 'IN (...)', sql)
+    return sql[:300]
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _n_plus_one.clear()
+
+
+def _timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats.template_seconds += time.perf_counter() - start
+    wrapper.perf_timed = True
+    return wrapper
+
+
+def install_template_timer():
+    """
+    Time the backend Template.render that render()/TemplateResponse call.
+    {% include %} and {% extends %} render below it, so nothing is counted twice.
+    """
+    if not getattr(DjangoTemplate.render, 'perf_timed', False):
+        DjangoTemplate.render = _timed_render(DjangoTemplate.render)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+def render():
+    """Everything recorded so far, in Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: (list(h.counts), h.sum, h.count) for key, h in _histograms.items()}
+        n_plus_one = dict(_n_plus_one)
+
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = f'{PREFIX}_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for (series, view), (counts, total, count) in sorted(histograms.items()):
+            if series != name:
+                continue
+            label = f'view="{_escape(view)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{{label}}} {total:.6f}')
+            lines.append(f'{metric}_count{{{label}}} {count}')
+
+    for suffix, help_text, index in (
+        ('n_plus_one_requests_total', "Sampled requests that repeated this statement.", 0),
+        ('n_plus_one_max_repeats', "Most times this statement ran in one request.", 1),
+    ):
+        metric = f'{PREFIX}_{suffix}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {"counter" if index == 0 else "gauge"}')
+        for (view, sql), values in sorted(n_plus_one.items()):
+            lines.append(f'{metric}{{view="{_escape(view)}",query="{_escape(sql)}"}} {values[index]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_order_order_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-date_added', '-id'], name='product_newest_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_product_newest_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='dispatch_status',
+            # Payments created before the queue existed were already pushed
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('SENDING', 'Sending'), ('SENT', 'Sent'), ('ERROR', 'Error')], default='SENT', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='dispatch_status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('SENDING', 'Sending'), ('SENT', 'Sent'), ('ERROR', 'Error')], default='QUEUED', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['dispatch_status', 'next_attempt_at'], name='payment_dispatch_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_productchange'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productchange',
+            index=models.Index(fields=['changed_at'], name='productchange_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productchange',
+            index=models.Index(fields=['product_id', '-id'], name='productchange_product_idx'),
+        ),
+    ]
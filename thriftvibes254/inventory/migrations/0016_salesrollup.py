@@ -0,0 +1,30 @@
+# Generated by Django 6.0.6 on 2026-10-18 08:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_productchange_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('D', 'Day'), ('W', 'Week'), ('M', 'Month')], max_length=1)),
+                ('period_start', models.DateField()),
+                ('category', models.CharField(choices=[('T-SHIRT', 'T-Shirt'), ('HOODIE', 'Hoodie'), ('JEANS', 'Jeans'), ('SHOES', 'Shoes'), ('OTHER', 'Other')], max_length=20)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('profit', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='inventory.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'product'), name='salesrollup_unique_bucket')],
+            },
+        ),
+    ]
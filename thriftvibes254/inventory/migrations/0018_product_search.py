@@ -0,0 +1,29 @@
+# Generated by Django 6.0.6 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 table + triggers on SQLite, tsvector column + GIN index on PostgreSQL
+    from inventory.search import install
+    install(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from inventory.search import uninstall
+    uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_productimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'size', 'selling_price'], name='product_facet_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.6 on 2026-10-18 09:50
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils.crypto import get_random_string
+
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def fix_order_ids(apps, schema_editor):
+    """Give blank and duplicated order_ids a fresh value before the unique index goes on."""
+    Order = apps.get_model('inventory', 'Order')
+    duplicated = (
+        Order.objects.exclude(order_id__isnull=True).exclude(order_id='')
+        .values('order_id').annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('order_id', flat=True)
+    )
+    seen = set()
+    for order in Order.objects.filter(order_id__in=list(duplicated)).order_by('id'):
+        if order.order_id not in seen:
+            seen.add(order.order_id)  # the oldest keeps its ID
+            continue
+        order.order_id = None
+        order.save(update_fields=['order_id'])
+
+    for order in Order.objects.filter(models.Q(order_id__isnull=True) | models.Q(order_id='')):
+        stamp = order.created_at.strftime('%Y%m%d%H%M%S')
+        order.order_id = f"TV-{stamp}-{get_random_string(10, ALPHABET)}"
+        order.save(update_fields=['order_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_order_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.6 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_fix_order_ids'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+    ]
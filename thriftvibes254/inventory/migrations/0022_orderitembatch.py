@@ -0,0 +1,26 @@
+# Generated by Django 6.0.6 on 2026-10-18 12:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0021_product_name_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItemBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_batches', to='inventory.order')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('order', 'batch_id'), name='orderitembatch_unique_batch')],
+            },
+        ),
+    ]
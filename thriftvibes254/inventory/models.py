@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_pic = models.ImageField(upload_to='profiles/', blank=True, null=True, default='profiles/default_avatar.png')
+    # Resized WebP copies, filled in by inventory.images
+    profile_pic_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -25,12 +30,98 @@ class Product(models.Model):
     buying_price = models.DecimalField(max_digits=10, decimal_places=2)
     selling_price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField()
+    # Units held by confirmed-but-unpaid orders; see inventory.stock
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     date_added = models.DateTimeField(auto_now_add=True)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized WebP copies, filled in by inventory.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.name} ({self.size})"
 
+    @property
+    def available(self):
+        return max(self.quantity - self.reserved, 0)
+
+    def clean(self):
+        # Held units are promised to confirmed orders (inventory.stock)
+        if self.quantity is not None and self.quantity < self.reserved:
+            raise ValidationError({
+                'quantity': f"{self.reserved} units are held by confirmed orders; quantity can't go below that.",
+            })
+
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination in product_list / product_gallery
+            models.Index(fields=['-date_added', '-id'], name='product_newest_idx'),
+            # Covers the facet GROUP BY in inventory.search
+            models.Index(fields=['category', 'size', 'selling_price'], name='product_facet_idx'),
+            # ORDER BY name, id for the admin changelist and name-ordered
+            # autocomplete pages. Only the ordering: matching goes through the
+            # full-text index (inventory.search), and a plain btree like this
+            # can't serve a LIKE 'term%' prefix lookup on PostgreSQL anyway.
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ]
+
+
+
+class ProductChange(models.Model):
+    """
+    Log of catalogue changes. Its id is the catalogue version offline
+    clients sync from; `compact_catalogue_log` trims it to the newest row
+    per product. See inventory.catalogue.
+    """
+    OPERATION_CHOICES = (
+        ('U', 'Upsert'),
+        ('D', 'Delete'),
+    )
+
+    product_id = models.BigIntegerField()
+    operation = models.CharField(max_length=1, choices=OPERATION_CHOICES, default='U')
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['changed_at'], name='productchange_time_idx'),
+            models.Index(fields=['product_id', '-id'], name='productchange_product_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.operation} product {self.product_id}"
+
+
+
+class ProductImport(models.Model):
+    """
+    A bulk product import from a CSV/XLSX sheet, with an optional zip of
+    photos. processed_rows is the resume checkpoint; see inventory.imports.
+    """
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    )
+
+    source = models.FileField(upload_to='imports/')
+    images = models.FileField(upload_to='imports/', blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    # [[product_id, zip member], ...] committed with the batch, cleared once attached
+    pending_images = models.JSONField(default=list, blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status})"
+
+    @property
+    def progress(self):
+        return round(100 * self.processed_rows / self.total_rows) if self.total_rows else 0
 
 
 class Sale(models.Model):
@@ -43,6 +134,78 @@ class Sale(models.Model):
         return f"{self.product.name} - {self.quantity}"
 
 
+class SalesRollup(models.Model):
+    """
+    Per-product sales totals for one day, week or month, kept current by
+    inventory.analytics as sales and paid orders come in.
+    """
+    PERIOD_CHOICES = (
+        ('D', 'Day'),
+        ('W', 'Week'),
+        ('M', 'Month'),
+    )
+
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='rollups')
+    category = models.CharField(max_length=20, choices=Product.CATEGORY_CHOICES)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    profit = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'product'],
+                name='salesrollup_unique_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_display()} {self.period_start} {self.product_id}: {self.units}"
+
+
+# Crockford base32: no I, L, O or U, so IDs read back over the phone unambiguously
+ORDER_ID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def generate_order_id():
+    """TV-<UTC timestamp>-<10 random base32 chars>, e.g. TV-20261018093012-7KQ2M9XW4D."""
+    stamp = timezone.now().strftime('%Y%m%d%H%M%S')
+    return f"TV-{stamp}-{get_random_string(10, ORDER_ID_ALPHABET)}"
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate `total` computed by the database from the order's items."""
+        return self.annotate(
+            total=Coalesce(
+                Sum(F('items__quantity') * F('items__price')),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+    def with_items(self):
+        return self.prefetch_related('items__product')
+
+    def refresh_totals(self):
+        """Recompute the cached total_amount column in a single UPDATE."""
+        items_total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(sum=Sum(F('quantity') * F('price')))
+            .values('sum')
+        )
+        return self.update(
+            total_amount=Coalesce(
+                Subquery(items_total),
+                Value(0),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            )
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -52,7 +215,7 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     )
 
-    order_id = models.CharField(max_length=40, blank=True, null=True)
+    order_id = models.CharField(max_length=40, blank=True, null=True, unique=True)
 
     customer = models.ForeignKey(
         User,
@@ -64,27 +227,36 @@ class Order(models.Model):
         choices=STATUS_CHOICES,
         default='pending'
     )
+    # Kept in sync by OrderItem.save()/delete(); see OrderQuerySet.refresh_totals
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     def total_price(self):
-        return sum(item.subtotal() for item in self.items.all())
+        return self.total_amount
 
     def __str__(self):
         return f"Order {self.order_id} - {self.customer.username}"
 
     def save(self, *args, **kwargs):
-        # Generate a human-friendly unique order_id on first save
-        if not self.order_id:
-            base = timezone.now().strftime('%Y%m%d%H%M%S')
-            rand = get_random_string(4).upper()
-            candidate = f"TV-{base}-{rand}"
-            # Ensure uniqueness
-            while Order.objects.filter(order_id=candidate).exists():
-                rand = get_random_string(4).upper()
-                candidate = f"TV-{base}-{rand}"
-            self.order_id = candidate
-        super().save(*args, **kwargs)
+        if self.order_id:
+            return super().save(*args, **kwargs)
+
+        # No lookup first: the unique index is the check. A clash needs two
+        # orders in the same second drawing the same 50 random bits, so the
+        # retry is there for correctness, not because it ever runs.
+        for attempt in range(3):
+            self.order_id = generate_order_id()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                clashed = Order.objects.filter(order_id=self.order_id).exists()
+                if attempt == 2 or not clashed:
+                    self.order_id = None
+                    raise
     
     class Meta:
         ordering = ['-created_at']
@@ -107,10 +279,56 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} ({self.quantity})"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Order.objects.filter(pk=self.order_id).refresh_totals()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Order.objects.filter(pk=self.order_id).refresh_totals()
+        return result
     
     class Meta:
         unique_together = ('order', 'product')
 
+
+class OrderItemBatch(models.Model):
+    """An offline-queued item batch already applied to an order; see views.add_order_items_batch."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='item_batches')
+    batch_id = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.batch_id} on order {self.order_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'batch_id'], name='orderitembatch_unique_batch'),
+        ]
+
+class StockHold(models.Model):
+    STATUS_CHOICES = (
+        ('HELD', 'Held'),
+        ('COMMITTED', 'Committed'),
+        ('RELEASED', 'Released'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_holds')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='HELD')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='stockhold_expiry_idx'),
+        ]
+
 class Payment(models.Model):
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
@@ -129,18 +347,21 @@ class Payment(models.Model):
     checkout_request_id = models.CharField(
         max_length=100,
         blank=True,
-        null=True
+        null=True,
+        unique=True
     )
     mpesa_receipt_number = models.CharField(
         max_length=50,
         blank=True,
         null=True
     )
+    transaction_date = models.DateTimeField(blank=True, null=True)
 
     merchant_request_id= models.CharField(
         max_length=100,
         blank=True,
-        null=True
+        null=True,
+        unique=True
     )
 
     status = models.CharField(
@@ -149,6 +370,22 @@ class Payment(models.Model):
         default='PENDING'
     )
 
+    # STK push delivery, handled off the request by the mpesa_worker command
+    DISPATCH_CHOICES = (
+        ('QUEUED', 'Queued'),
+        ('SENDING', 'Sending'),
+        ('SENT', 'Sent'),
+        ('ERROR', 'Error'),
+    )
+    dispatch_status = models.CharField(
+        max_length=10,
+        choices=DISPATCH_CHOICES,
+        default='QUEUED'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -157,6 +394,9 @@ class Payment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['dispatch_status', 'next_attempt_at'], name='payment_dispatch_idx'),
+        ]
 
 class MpesaTransaction(models.Model):
     order = models.OneToOneField(
@@ -164,8 +404,8 @@ class MpesaTransaction(models.Model):
         on_delete=models.CASCADE,
         related_name="mpesa_transaction"
     )
-    checkout_request_id = models.CharField(max_length=100)
-    merchant_request_id = models.CharField(max_length=100)
+    checkout_request_id = models.CharField(max_length=100, unique=True)
+    merchant_request_id = models.CharField(max_length=100, unique=True)
     amount = models.IntegerField()
     phone = models.CharField(max_length=20)
     mpesa_receipt_number = models.CharField(max_length=50, blank=True, null=True)
@@ -177,3 +417,25 @@ class MpesaTransaction(models.Model):
         # Prefer the human-friendly order identifier when available
         order_ref = getattr(self.order, 'order_id', None) or self.order.id
         return f"M-Pesa Order {order_ref} - {self.status}"
+
+
+class MpesaCallback(models.Model):
+    """Append-only staging row for a raw callback awaiting the batch writer."""
+    checkout_request_id = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+    # Pushed back while no Payment has this CheckoutRequestID yet
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Callback {self.checkout_request_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='mpesa_callback_pending_idx',
+            ),
+        ]
@@ -1,54 +1,187 @@
 import base64
-import requests
+import threading
+import time
 from datetime import datetime
+
+import requests
 from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 
 
-def get_access_token():
-    consumer_key = settings.MPESA_CONSUMER_KEY
-    consumer_secret = settings.MPESA_CONSUMER_SECRET
+BASE_URLS = {
+    "sandbox": "https://sandbox.safaricom.co.ke",
+    "production": "https://api.safaricom.co.ke",
+}
 
-    api_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
+TOKEN_CACHE_KEY = "mpesa:access_token"
 
-    response = requests.get(
-        api_url,
-        auth=(consumer_key, consumer_secret)
-    )
+# Refresh the token this many seconds before Daraja says it expires
+TOKEN_REFRESH_MARGIN = 60
 
-    return response.json()["access_token"]
 
+class DarajaClient:
+    """
+    Reusable Daraja API client.
 
-def stk_push(phone, amount, order_id):
-    access_token = get_access_token()
+    Keeps one pooled keep-alive session and caches the OAuth token both
+    in-process and in the shared Django cache, so an STK push costs a single
+    HTTP round-trip instead of OAuth + push on fresh connections.
+    """
+
+    def __init__(self, base_url=None, consumer_key=None, consumer_secret=None,
+                 timeout=None, pool_size=None):
+        self.base_url = (base_url or _default_base_url()).rstrip("/")
+        self.consumer_key = consumer_key or settings.MPESA_CONSUMER_KEY
+        self.consumer_secret = consumer_secret or settings.MPESA_CONSUMER_SECRET
+        self.timeout = timeout or settings.MPESA_TIMEOUT
+        pool_size = pool_size or settings.MPESA_POOL_SIZE
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self):
+        now = time.time()
+        if self._token and now < self._token_expires_at:
+            return self._token
+
+        with self._token_lock:
+            # Another thread may have refreshed it while we waited
+            if self._token and time.time() < self._token_expires_at:
+                return self._token
+
+            cached = cache.get(TOKEN_CACHE_KEY)
+            if cached and time.time() < cached["expires_at"]:
+                self._token = cached["token"]
+                self._token_expires_at = cached["expires_at"]
+                return self._token
+
+            response = self.session.get(
+                f"{self.base_url}/oauth/v1/generate",
+                params={"grant_type": "client_credentials"},
+                auth=(self.consumer_key, self.consumer_secret),
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+
+            lifetime = max(int(data.get("expires_in", 3599)) - TOKEN_REFRESH_MARGIN, 1)
+            self._token = data["access_token"]
+            self._token_expires_at = time.time() + lifetime
+            cache.set(
+                TOKEN_CACHE_KEY,
+                {"token": self._token, "expires_at": self._token_expires_at},
+                lifetime,
+            )
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0
+            cache.delete(TOKEN_CACHE_KEY)
+
+    def post(self, path, payload):
+        headers = {
+            "Authorization": f"Bearer {self.get_access_token()}",
+            "Content-Type": "application/json",
+        }
+        response = self.session.post(
+            f"{self.base_url}{path}",
+            json=payload,
+            headers=headers,
+            timeout=self.timeout,
+        )
+        if response.status_code == 401:
+            # Token revoked early - fetch a new one and retry once
+            self.invalidate_token()
+            headers["Authorization"] = f"Bearer {self.get_access_token()}"
+            response = self.session.post(
+                f"{self.base_url}{path}",
+                json=payload,
+                headers=headers,
+                timeout=self.timeout,
+            )
+        # 5xx/429 and rejected requests raise HTTPError (response attached) so
+        # callers can tell them apart; an HTML error page never reaches .json()
+        response.raise_for_status()
+        return response.json()
+
+    def stk_push(self, phone, amount, order_id):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        payload = {
+            "BusinessShortCode": settings.MPESA_SHORTCODE,
+            "Password": _password(timestamp),
+            "Timestamp": timestamp,
+            "TransactionType": "CustomerPayBillOnline",
+            "Amount": amount,
+            "PartyA": phone,
+            "PartyB": settings.MPESA_SHORTCODE,
+            "PhoneNumber": phone,
+            "CallBackURL": settings.MPESA_CALLBACK_URL,
+            "AccountReference": f"ORDER{order_id}",
+            "TransactionDesc": "Order Payment"
+        }
+        return self.post("/mpesa/stkpush/v1/processrequest", payload)
+
+    def stk_query(self, checkout_request_id):
+        """Ask Daraja for the final result of an earlier STK push."""
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        payload = {
+            "BusinessShortCode": settings.MPESA_SHORTCODE,
+            "Password": _password(timestamp),
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id,
+        }
+        return self.post("/mpesa/stkpushquery/v1/query", payload)
 
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    password = base64.b64encode(
+
+def _default_base_url():
+    if settings.MPESA_BASE_URL:
+        return settings.MPESA_BASE_URL
+    return BASE_URLS.get(settings.MPESA_ENV or "sandbox", BASE_URLS["sandbox"])
+
+
+def _password(timestamp):
+    return base64.b64encode(
         f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}".encode()
     ).decode("utf-8")
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "BusinessShortCode": settings.MPESA_SHORTCODE,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": "CustomerPayBillOnline",
-        "Amount": amount,
-        "PartyA": phone,
-        "PartyB": settings.MPESA_SHORTCODE,
-        "PhoneNumber": phone,
-        "CallBackURL": settings.MPESA_CALLBACK_URL,
-        "AccountReference": f"ORDER{order_id}",
-        "TransactionDesc": "Order Payment"
-    }
-
-    response = requests.post(
-        "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest",
-        json=payload,
-        headers=headers
-    )
-
-    return response.json()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide DarajaClient, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DarajaClient()
+    return _client
+
+
+def reset_client():
+    """Drop the shared client, e.g. after changing MPESA_* settings."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def get_access_token():
+    return get_client().get_access_token()
+
+
+def stk_push(phone, amount, order_id):
+    return get_client().stk_push(phone, amount, order_id)
+
+
+def stk_query(checkout_request_id):
+    return get_client().stk_query(checkout_request_id)
@@ -0,0 +1,84 @@
+"""
+Order item writes shared by the order views and the offline batch endpoint,
+and the sweep that clears out abandoned pending orders.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderItem, Product
+
+
+def add_items(order, pairs):
+    """
+    Add a batch of (product_id, quantity) pairs to `order` in a handful of
+    queries. Prices always come from Product.selling_price, never the client.
+    Returns (items_touched, errors) where errors maps product_id -> message.
+    """
+    wanted = defaultdict(int)
+    errors = {}
+    for product_id, quantity in pairs:
+        try:
+            product_id, quantity = int(product_id), int(quantity)
+        except (TypeError, ValueError):
+            errors[str(product_id)] = "Invalid product or quantity"
+            continue
+        if quantity <= 0:
+            errors[product_id] = "Quantity must be greater than zero"
+            continue
+        wanted[product_id] += quantity
+
+    products = Product.objects.in_bulk(list(wanted))
+    for product_id in set(wanted) - set(products):
+        errors[product_id] = "Unknown product"
+        del wanted[product_id]
+    if not wanted:
+        return 0, errors
+
+    with transaction.atomic():
+        # Locking the order serialises concurrent adds: the item rows alone
+        # can't, as a product not yet on the order has no row to lock
+        Order.objects.select_for_update().only('pk').get(pk=order.pk)
+        existing = {
+            item.product_id: item
+            for item in order.items.select_for_update().filter(product_id__in=wanted)
+        }
+        to_create, to_update = [], []
+        for product_id, quantity in wanted.items():
+            price = products[product_id].selling_price
+            item = existing.get(product_id)
+            if item:
+                item.quantity += quantity
+                item.price = price
+                to_update.append(item)
+            else:
+                to_create.append(OrderItem(order=order, product_id=product_id, quantity=quantity, price=price))
+        # Bulk writes skip OrderItem.save(), so refresh the cached total here
+        OrderItem.objects.bulk_create(to_create)
+        OrderItem.objects.bulk_update(to_update, ['quantity', 'price'])
+        Order.objects.filter(pk=order.pk).refresh_totals()
+    return len(wanted), errors
+
+
+def delete_stale(max_age=None, batch_size=1000):
+    """
+    Delete pending orders untouched for `max_age` (STALE_ORDER_HOURS by
+    default) that never got a payment, `batch_size` at a time so each
+    transaction stays short. Returns the number of orders deleted.
+    """
+    if max_age is None:
+        max_age = timedelta(hours=settings.STALE_ORDER_HOURS)
+    cutoff = timezone.now() - max_age
+    stale = Order.objects.filter(status='pending', updated_at__lt=cutoff, payments__isnull=True)
+    deleted = 0
+    while True:
+        ids = list(stale.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            # Recheck the status: one may have been checked out since the select
+            _, per_model = Order.objects.filter(pk__in=ids, status='pending').delete()
+        deleted += per_model.get(Order._meta.label, 0)
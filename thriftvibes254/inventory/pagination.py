@@ -0,0 +1,61 @@
+import base64
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+PAGE_SIZE = 24
+# Newest first; `id` breaks ties between products added in the same instant
+NEWEST = ('date_added', 'id')
+
+
+def encode_cursor(obj, key=NEWEST):
+    """Turn the last product on a page into an opaque `?after=` token."""
+    raw = "|".join(_text(getattr(obj, field)) for field in key)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _text(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def decode_cursor(token, model, key=NEWEST):
+    """Return the `key` values of a cursor, or None if it is missing or bad."""
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        parts = raw.split("|")
+        if len(parts) != len(key):
+            return None
+        return tuple(model._meta.get_field(field).to_python(part) for field, part in zip(key, parts))
+    except (ValueError, UnicodeDecodeError, ValidationError):
+        return None
+
+
+def keyset_page(queryset, token=None, page_size=PAGE_SIZE, key=NEWEST):
+    """
+    Page of `queryset` in descending `key` order, starting after the cursor
+    `token`. `key` must end in a unique field so the order is total.
+
+    Seeks on the index over `key` instead of using OFFSET, so page N costs
+    the same as page 1 no matter how big the catalogue gets.
+    Returns (items, next_token); next_token is None on the last page.
+    """
+    queryset = queryset.order_by(*[f'-{field}' for field in key])
+    cursor = decode_cursor(token, queryset.model, key)
+    if cursor:
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        after = Q()
+        for index, field in enumerate(key):
+            equal = {name: value for name, value in zip(key[:index], cursor)}
+            after |= Q(**equal, **{f'{field}__lt': cursor[index]})
+        queryset = queryset.filter(after)
+
+    items = list(queryset[:page_size + 1])
+    next_token = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_token = encode_cursor(items[-1], key)
+    return items, next_token
@@ -0,0 +1,200 @@
+"""
+Product search and facets.
+
+Names are indexed by the database itself: an FTS5 table on SQLite, a
+generated tsvector column with a GIN index on PostgreSQL. Both are kept in
+sync by the database (triggers / GENERATED ALWAYS), so queryset updates and
+bulk_create are covered as well as save(). Other backends fall back to a
+case-insensitive LIKE.
+
+Facet counts for category, size and price band come from one GROUP BY over
+the matching products. Each facet's counts ignore its own filter, so picking
+"Hoodie" still shows how many jeans match.
+"""
+import re
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Count, IntegerField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+FTS_TABLE = 'inventory_product_fts'
+MAX_TERMS = 8
+
+# (label, min inclusive, max exclusive)
+PRICE_BANDS = (
+    ('Under 500', None, 500),
+    ('500 - 1,000', 500, 1000),
+    ('1,000 - 2,000', 1000, 2000),
+    ('2,000 - 5,000', 2000, 5000),
+    ('5,000 and up', 5000, None),
+)
+
+_SQLITE_SETUP = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, content='inventory_product', content_rowid='id', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON inventory_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+)
+
+_POSTGRES_SETUP = (
+    """ALTER TABLE inventory_product ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', coalesce(name, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS product_search_idx ON inventory_product USING GIN (search_vector)",
+)
+
+
+def install(schema_connection=None):
+    """
+    Create the search index if it is missing. Safe to run repeatedly.
+
+    SQLite drops a table's triggers whenever a migration rebuilds it, so this
+    also runs after every migrate (see signals) and refills the index when
+    the triggers had to be recreated.
+    """
+    conn = schema_connection or connection
+    if 'inventory_product' not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{FTS_TABLE}_%'],
+            )
+            complete = cursor.fetchone()[0] == 3
+            for statement in _SQLITE_SETUP:
+                cursor.execute(statement)
+            if not complete:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif conn.vendor == 'postgresql':
+            for statement in _POSTGRES_SETUP:
+                cursor.execute(statement)
+
+
+def uninstall(schema_connection=None):
+    conn = schema_connection or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == 'sqlite':
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif conn.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS product_search_idx")
+            cursor.execute("ALTER TABLE inventory_product DROP COLUMN IF EXISTS search_vector")
+
+
+def terms(text):
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def match(queryset, text):
+    """Products whose name contains words starting with every term in `text`."""
+    words = terms(text)
+    if not words:
+        return queryset
+    if connection.vendor == 'sqlite':
+        expression = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression],
+        ))
+    if connection.vendor == 'postgresql':
+        expression = ' & '.join(f'{word}:*' for word in words)
+        return queryset.filter(pk__in=RawSQL(
+            "SELECT id FROM inventory_product WHERE search_vector @@ to_tsquery('simple', %s)",
+            [expression],
+        ))
+    for word in words:
+        queryset = queryset.filter(name__icontains=word)
+    return queryset
+
+
+def _price_condition(min_price, max_price):
+    condition = Q()
+    if min_price is not None:
+        condition &= Q(selling_price__gte=min_price)
+    if max_price is not None:
+        condition &= Q(selling_price__lt=max_price)
+    return condition
+
+
+def _price_range(queryset, min_price, max_price):
+    return queryset.filter(_price_condition(min_price, max_price))
+
+
+def search(params):
+    """Filtered queryset for a cleaned ProductSearchForm."""
+    queryset = match(Product.objects.all(), params.get('q'))
+    if params.get('category'):
+        queryset = queryset.filter(category=params['category'])
+    if params.get('size'):
+        queryset = queryset.filter(size=params['size'])
+    return _price_range(queryset, params.get('min_price'), params.get('max_price'))
+
+
+def _band_filter(low, high):
+    # Integer Values: SQLite would otherwise compare every row against '500' as text
+    condition = Q()
+    if low is not None:
+        condition &= Q(selling_price__gte=Value(low, output_field=IntegerField()))
+    if high is not None:
+        condition &= Q(selling_price__lt=Value(high, output_field=IntegerField()))
+    return condition
+
+
+def facets(params):
+    """Category, size and price band counts for the products matching `params`."""
+    queryset = match(Product.objects.all(), params.get('q'))
+    # Grouping by (category, size) walks product_facet_idx in order; price
+    # bands are conditional counts per group, which avoids sorting every row
+    # by a computed band. The price range is a condition on the other counts
+    # rather than a WHERE, so the bands still count prices outside it.
+    bands = {
+        f'band{index}': Count('id', filter=_band_filter(low, high))
+        for index, (_, low, high) in enumerate(PRICE_BANDS)
+    }
+    in_range = _price_condition(params.get('min_price'), params.get('max_price'))
+    rows = (
+        queryset.values('category', 'size')
+        .annotate(count=Count('id', filter=in_range) if in_range else Count('id'), **bands)
+        .order_by()
+    )
+
+    category, size = params.get('category'), params.get('size')
+    categories, sizes, band_counts = Counter(), Counter(), Counter()
+    for row in rows:
+        category_ok = not category or row['category'] == category
+        size_ok = not size or row['size'] == size
+        if size_ok:
+            categories[row['category']] += row['count']
+        if category_ok:
+            sizes[row['size']] += row['count']
+        if category_ok and size_ok:
+            for index in range(len(PRICE_BANDS)):
+                band_counts[index] += row[f'band{index}']
+
+    return {
+        'categories': [
+            {'value': code, 'label': label, 'count': categories[code], 'selected': code == category}
+            for code, label in Product.CATEGORY_CHOICES if categories[code]
+        ],
+        'sizes': [
+            {'value': value, 'label': value, 'count': count, 'selected': value == size}
+            for value, count in sorted(sizes.items())
+        ],
+        'prices': [
+            {'label': label, 'min': low, 'max': high, 'count': band_counts[index]}
+            for index, (label, low, high) in enumerate(PRICE_BANDS) if band_counts[index]
+        ],
+    }
@@ -0,0 +1,34 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from . import images, search
+from .caching import bump_catalogue_version
+from .catalogue import record_changes
+from .models import Product, UserProfile
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    record_changes([instance.pk])
+    bump_catalogue_version()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    record_changes([instance.pk], operation='D')
+    bump_catalogue_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=UserProfile)
+def image_uploaded(sender, instance, **kwargs):
+    if images.needs_variants(instance):
+        images.schedule(instance)
+
+
+@receiver(post_migrate)
+def restore_search_index(sender, using, **kwargs):
+    # SQLite drops the FTS triggers whenever a migration rebuilds the product table
+    if sender.label == 'inventory':
+        search.install(connections[using])
@@ -0,0 +1,182 @@
+"""
+Atomic stock movements and checkout reservations.
+
+Every decrement is a single conditional UPDATE, so two cashiers selling the
+last item at the same moment can never both succeed and no row lock is held
+across Python code.
+
+Confirmed orders hold stock instead of taking it: `Product.reserved` counts
+held units, so available-to-sell is just `quantity - reserved` on the row.
+A paid callback commits the hold (both counters drop), and the
+`release_holds` sweeper hands expired holds back in bulk.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .caching import bump_catalogue_version
+from .catalogue import record_changes
+from .models import Order, Product, StockHold
+
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f"Not enough stock for product {product_id} (wanted {requested})")
+
+
+def _stock_changed(product_ids):
+    # Queryset updates skip post_save, so log the change for offline clients here.
+    # Cached catalogue pages show availability, so they go stale on commit.
+    record_changes(product_ids)
+    transaction.on_commit(bump_catalogue_version)
+
+
+def take_stock(product_id, quantity):
+    """Remove `quantity` unreserved units if available. Returns True on success."""
+    if quantity <= 0:
+        raise ValueError("quantity must be positive")
+    taken = Product.objects.filter(
+        pk=product_id, quantity__gte=F('reserved') + quantity,
+    ).update(quantity=F('quantity') - quantity) == 1
+    if taken:
+        _stock_changed([product_id])
+    return taken
+
+
+def take_stock_or_raise(product_id, quantity):
+    if not take_stock(product_id, quantity):
+        raise InsufficientStock(product_id, quantity)
+
+
+def return_stock(product_id, quantity):
+    """Put units back, e.g. when a sale is voided."""
+    Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity)
+    _stock_changed([product_id])
+
+
+def _quantities(order):
+    wanted = defaultdict(int)
+    for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+        wanted[product_id] += quantity
+    # Fixed lock order so two checkouts can't deadlock on each other's rows
+    return sorted(wanted.items())
+
+
+def hold_order(order, ttl=None):
+    """
+    Reserve stock for every item on `order`, all or nothing.
+    Raises InsufficientStock (and reserves nothing) if any item is short.
+    """
+    ttl = ttl or timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        holds = []
+        for product_id, quantity in _quantities(order):
+            reserved = Product.objects.filter(
+                pk=product_id, quantity__gte=F('reserved') + quantity,
+            ).update(reserved=F('reserved') + quantity)
+            if not reserved:
+                raise InsufficientStock(product_id, quantity)
+            holds.append(StockHold(
+                order=order, product_id=product_id,
+                quantity=quantity, expires_at=expires_at,
+            ))
+        StockHold.objects.bulk_create(holds)
+        _stock_changed([hold.product_id for hold in holds])
+    return holds
+
+
+def commit_holds(order_ids):
+    """Turn the holds of paid orders into real stock decrements."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+    with transaction.atomic():
+        holds = list(
+            StockHold.objects.select_for_update()
+            .filter(order_id__in=order_ids, status='HELD')
+            .values_list('pk', 'order_id', 'product_id', 'quantity')
+        )
+        per_product = defaultdict(int)
+        for _, _, product_id, quantity in holds:
+            per_product[product_id] += quantity
+        for product_id, quantity in per_product.items():
+            committed = Product.objects.filter(pk=product_id, quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity,
+                reserved=F('reserved') - quantity,
+            )
+            if not committed:
+                # Someone counted the shelf down below what was held: sell what's left
+                logger.warning("Product %s has fewer units than its paid holds (%s)", product_id, quantity)
+                Product.objects.filter(pk=product_id).update(
+                    quantity=Greatest(F('quantity') - quantity, 0),
+                    reserved=Greatest(F('reserved') - quantity, 0),
+                )
+        StockHold.objects.filter(pk__in=[h[0] for h in holds]).update(status='COMMITTED')
+        if holds:
+            _stock_changed(per_product)
+
+        # Paid after the hold expired: take whatever is still on the shelf
+        held_orders = {h[1] for h in holds}
+        for order in Order.objects.filter(pk__in=set(order_ids) - held_orders):
+            if order.stock_holds.filter(status='COMMITTED').exists():
+                continue
+            for product_id, quantity in _quantities(order):
+                if not take_stock(product_id, quantity):
+                    logger.warning(
+                        "Order %s paid after its hold expired; product %s is short by up to %s",
+                        order.order_id, product_id, quantity,
+                    )
+    return len(holds)
+
+
+def release_holds(order_ids):
+    """Give back the stock held by orders that will not be paid."""
+    return _release(StockHold.objects.filter(order_id__in=order_ids, status='HELD'))
+
+
+def release_expired(now=None):
+    """Sweep every hold past its expiry. Returns the number released."""
+    now = now or timezone.now()
+    expired = StockHold.objects.filter(status='HELD', expires_at__lt=now)
+    with transaction.atomic():
+        order_ids = set(expired.values_list('order_id', flat=True))
+        released = _release(expired)
+        # Unpaid confirmed orders go back to the cart so they can be re-confirmed
+        Order.objects.filter(pk__in=order_ids, status='confirmed').update(
+            status='pending', updated_at=now,
+        )
+    return released
+
+
+def _release(holds):
+    with transaction.atomic():
+        locked = holds.select_for_update()
+        pks = list(locked.values_list('pk', flat=True))
+        if not pks:
+            return 0
+        totals = (
+            StockHold.objects.filter(pk__in=pks)
+            .values('product_id')
+            .annotate(total=Sum('quantity'))
+        )
+        product_ids = []
+        for row in totals:
+            Product.objects.filter(pk=row['product_id']).update(
+                reserved=F('reserved') - row['total'],
+            )
+            product_ids.append(row['product_id'])
+        StockHold.objects.filter(pk__in=pks).update(status='RELEASED')
+        _stock_changed(product_ids)
+    return len(pks)
@@ -0,0 +1,49 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # optional: `pip install brotli` adds .br files
+    brotli = None
+
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.html', '.txt', '.map')
+
+
+class ManifestStorage(ManifestStaticFilesStorage):
+    """
+    Content-hashed static file names (style.3f2a9c1d4e5b.css) so they can be
+    cached "forever", plus precompressed .gz/.br siblings written at
+    collectstatic time for WhiteNoise or nginx gzip_static to serve.
+
+    The vendored Bootstrap bundles reference .map files we don't ship, so
+    sourceMappingURL comments are left alone, and a missing file in a
+    template falls back to its plain name instead of raising.
+    """
+    manifest_strict = False
+    patterns = (
+        ("*.css", ManifestStaticFilesStorage.patterns[0][1][:2]),
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and isinstance(hashed_name, str) and hashed_name.endswith(COMPRESSIBLE):
+                self._compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def _compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            with open(path + '.gz', 'wb') as f:
+                f.write(compressed)
+        if brotli is not None:
+            compressed = brotli.compress(data)
+            if len(compressed) < len(data):
+                with open(path + '.br', 'wb') as f:
+                    f.write(compressed)
+        os.utime(path)
@@ -0,0 +1,23 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from inventory.images import srcset
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_img(image, variants, sizes="100vw", **attrs):
+    """
+    <img> for an uploaded image using its WebP variants when they exist:
+    {% responsive_img product.image product.image_variants sizes="25vw" class="card-img-top" %}
+    """
+    src, candidates = srcset(image, variants or {})
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    if candidates:
+        return format_html(
+            '<img src="{}" srcset="{}" sizes="{}" loading="lazy" decoding="async"{}>',
+            src, candidates, sizes, extra,
+        )
+    return format_html('<img src="{}" loading="lazy" decoding="async"{}>', src, extra)
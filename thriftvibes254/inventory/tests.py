@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
+from django.db.models import Sum
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, batcher, cart, catalogue, dispatch, exports, images, imports, metrics, mpesa, search
+from .caching import CATALOGUE_VERSION_KEY, catalogue_version
+from .callbacks import apply_callback, parse_callback
+from .daraja_stub import DarajaStubServer, build_callback
+from .models import (
+    MpesaCallback, Order, OrderItem, Payment, Product, ProductChange, ProductImport, Sale, SalesRollup,
+    StockHold, UserProfile,
+)
+from .orders import add_items, delete_stale
+from .pagination import NEWEST, PAGE_SIZE, encode_cursor, keyset_page
+from .stock import InsufficientStock, commit_holds, hold_order, release_expired, take_stock
+from .uploads import FORM_OVERHEAD_BYTES
+
+
+PHONE = '254700000000'
+
+
+class PurchaseFlowTests(TransactionTestCase):
+    """
+    A customer's purchase end to end through the real views, with STK pushes
+    going to the local Daraja stub.
+
+    TransactionTestCase because dispatch.send calls close_old_connections(),
+    which would poison TestCase's wrapping transaction.
+    """
+
+    def setUp(self):
+        stub = self.enterContext(DarajaStubServer())
+        self.enterContext(override_settings(MPESA_BASE_URL=stub.url, MPESA_CALLBACK_MODE='direct'))
+        mpesa.reset_client()
+        self.addCleanup(mpesa.reset_client)
+
+        self.user = User.objects.create_user('shopper', password='pw')
+        self.client.force_login(self.user)
+        self.jacket = Product.objects.create(
+            name='Denim jacket', category='OTHER', size='M',
+            buying_price=Decimal('500'), selling_price=Decimal('1200'), quantity=5,
+        )
+
+    def add_to_cart(self, product, quantity):
+        response = self.client.post(reverse('inventory:cart'), {'product': product.pk, 'quantity': quantity})
+        self.assertRedirects(response, reverse('inventory:cart'), fetch_redirect_response=False)
+
+    def place_order(self, quantity=2):
+        self.add_to_cart(self.jacket, quantity)
+        self.client.post(reverse('inventory:create_order'))
+        order = Order.objects.get(customer=self.user)
+        self.client.post(reverse('inventory:checkout_order', args=[order.pk]))
+        order.refresh_from_db()
+        return order
+
+    def pay(self, order):
+        response = self.client.post(reverse('inventory:pay_order', args=[order.pk]), {'phone': PHONE})
+        payment = Payment.objects.filter(order=order).latest('created_at')
+        self.assertRedirects(
+            response, reverse('inventory:payment_detail', args=[payment.pk]), fetch_redirect_response=False,
+        )
+        return payment
+
+    def push(self, payment):
+        self.assertTrue(dispatch.claim(payment.pk))
+        dispatch.send(payment.pk)
+        payment.refresh_from_db()
+        return payment
+
+    def callback(self, payment, **kwargs):
+        body = build_callback(payment.checkout_request_id, payment.merchant_request_id, amount=2400, **kwargs)
+        response = self.client.post(reverse('inventory:mpesa_callback'), body, content_type='application/json')
+        self.assertEqual(response.json()['ResultCode'], 0)
+
+    def test_paid_order_takes_its_held_stock(self):
+        order = self.place_order(quantity=2)
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual(order.total_amount, Decimal('2400'))
+        self.jacket.refresh_from_db()
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (5, 2))
+
+        payment = self.push(self.pay(order))
+        self.assertEqual(payment.dispatch_status, 'SENT')
+        self.assertTrue(payment.checkout_request_id)
+
+        self.callback(payment)
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.jacket.refresh_from_db()
+        self.assertEqual(payment.status, 'SUCCESS')
+        self.assertEqual(order.status, 'paid')
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (3, 0))
+        self.assertEqual(StockHold.objects.get(order=order).status, 'COMMITTED')
+
+    def test_replayed_callback_changes_nothing(self):
+        payment = self.push(self.pay(self.place_order(quantity=2)))
+        self.callback(payment)
+        self.callback(payment)
+        self.jacket.refresh_from_db()
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (3, 0))
+
+    def test_cancelled_payment_keeps_the_hold(self):
+        order = self.place_order(quantity=1)
+        payment = self.push(self.pay(order))
+        self.callback(payment, result_code=1032)
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.jacket.refresh_from_db()
+        self.assertEqual(payment.status, 'FAILED')
+        self.assertEqual(order.status, 'confirmed')
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (5, 1))
+
+    def test_checkout_beyond_stock_reserves_nothing(self):
+        self.add_to_cart(self.jacket, 5)
+        self.client.post(reverse('inventory:create_order'))
+        order = Order.objects.get(customer=self.user)
+        Product.objects.filter(pk=self.jacket.pk).update(quantity=4)
+
+        response = self.client.post(reverse('inventory:checkout_order', args=[order.pk]))
+
+        self.assertRedirects(
+            response, reverse('inventory:add_order_items', args=[order.pk]), fetch_redirect_response=False,
+        )
+        order.refresh_from_db()
+        self.jacket.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertEqual(self.jacket.reserved, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_paying_twice_queues_one_push(self):
+        order = self.place_order()
+        first = self.pay(order)
+        second = self.pay(order)
+        self.assertEqual(first, second)
+        self.assertEqual(Payment.objects.filter(order=order).count(), 1)
+
+    def test_unconfirmed_order_cannot_be_paid(self):
+        self.add_to_cart(self.jacket, 1)
+        self.client.post(reverse('inventory:create_order'))
+        order = Order.objects.get(customer=self.user)
+        self.client.post(reverse('inventory:pay_order', args=[order.pk]), {'phone': PHONE})
+        self.assertFalse(Payment.objects.exists())
+
+    def test_callback_ahead_of_its_checkout_request_id_is_applied_later(self):
+        order = self.place_order(quantity=1)
+        payment = self.pay(order)
+        body = build_callback('ws_CO_early', 'merchant-early', amount=1200)
+        self.client.post(reverse('inventory:mpesa_callback'), body, content_type='application/json')
+        self.assertTrue(MpesaCallback.objects.filter(checkout_request_id='ws_CO_early').exists())
+
+        Payment.objects.filter(pk=payment.pk).update(
+            checkout_request_id='ws_CO_early', merchant_request_id='merchant-early', dispatch_status='SENT',
+        )
+        batcher.drain()
+
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual(payment.status, 'SUCCESS')
+        self.assertEqual(order.status, 'paid')
+
+
+def make_product(name='Denim jacket', quantity=5, **kwargs):
+    return Product.objects.create(
+        name=name, category=kwargs.pop('category', 'OTHER'), size=kwargs.pop('size', 'M'),
+        buying_price=Decimal('500'), selling_price=kwargs.pop('selling_price', Decimal('1200')),
+        quantity=quantity, **kwargs,
+    )
+
+
+def make_order(user, *lines):
+    order = Order.objects.create(customer=user)
+    for product, quantity in lines:
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.selling_price)
+    return order
+
+
+class StockTests(TestCase):
+    """The conditional F() updates in inventory.stock."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier')
+        self.jacket = make_product(quantity=5)
+
+    def test_take_stock_never_sells_held_units(self):
+        Product.objects.filter(pk=self.jacket.pk).update(reserved=3)
+        self.assertTrue(take_stock(self.jacket.pk, 2))
+        self.assertFalse(take_stock(self.jacket.pk, 1))
+        self.jacket.refresh_from_db()
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (3, 3))
+
+    def test_take_stock_rejects_non_positive_quantities(self):
+        with self.assertRaises(ValueError):
+            take_stock(self.jacket.pk, 0)
+
+    def test_hold_order_is_all_or_nothing(self):
+        boots = make_product('Leather boots', quantity=1)
+        order = make_order(self.user, (self.jacket, 2), (boots, 2))
+        with self.assertRaises(InsufficientStock) as raised:
+            hold_order(order)
+        self.assertEqual(raised.exception.product_id, boots.pk)
+        self.jacket.refresh_from_db()
+        self.assertEqual(self.jacket.reserved, 0)
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_released(self):
+        order = make_order(self.user, (self.jacket, 2))
+        hold_order(order)
+        Order.objects.filter(pk=order.pk).update(status='confirmed')
+
+        self.assertEqual(release_expired(timezone.now() + timedelta(days=1)), 1)
+
+        self.jacket.refresh_from_db()
+        order.refresh_from_db()
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (5, 0))
+        self.assertEqual(order.status, 'pending')
+
+    def test_commit_holds_clamps_a_shelf_counted_below_the_hold(self):
+        order = make_order(self.user, (self.jacket, 4))
+        hold_order(order)
+        Product.objects.filter(pk=self.jacket.pk).update(quantity=1)
+
+        with self.assertLogs('inventory.stock', 'WARNING'):
+            commit_holds([order.pk])
+
+        self.jacket.refresh_from_db()
+        self.assertEqual((self.jacket.quantity, self.jacket.reserved), (0, 0))
+
+    def test_product_quantity_cannot_be_edited_below_reserved(self):
+        hold_order(make_order(self.user, (self.jacket, 3)))
+        self.jacket.refresh_from_db()
+        self.jacket.quantity = 2
+        with self.assertRaises(ValidationError):
+            self.jacket.full_clean()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentStockTests(TransactionTestCase):
+    """
+    Real concurrent transactions, one connection per thread. Needs row
+    locks, so PostgreSQL only; on SQLite every writer takes the same
+    database lock (bench_stock covers that).
+    """
+
+    def race(self, target, threads=8):
+        start = threading.Barrier(threads)
+        errors = []
+
+        def worker():
+            start.wait()
+            try:
+                target()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_sales_never_oversell(self):
+        product = make_product(quantity=20)
+        sold = []
+
+        def sell():
+            sold.extend(take_stock(product.pk, 1) for _ in range(5))
+
+        self.race(sell)
+
+        product.refresh_from_db()
+        self.assertEqual(sum(sold), 20)
+        self.assertEqual(product.quantity, 0)
+
+    def test_concurrent_checkouts_never_over_reserve(self):
+        product = make_product(quantity=3)
+        orders = [make_order(User.objects.create_user(f'c{i}'), (product, 1)) for i in range(8)]
+        held = []
+
+        def checkout():
+            order = orders.pop()
+            try:
+                hold_order(order)
+                held.append(order.pk)
+            except InsufficientStock:
+                pass
+
+        self.race(checkout)
+
+        product.refresh_from_db()
+        self.assertEqual(len(held), 3)
+        self.assertEqual(product.reserved, 3)
+
+    def test_double_submitted_checkout_holds_stock_once(self):
+        product = make_product(quantity=5)
+        user = User.objects.create_user('double')
+        order = make_order(user, (product, 2))
+        url = reverse('inventory:checkout_order', args=[order.pk])
+
+        def submit():
+            client = Client()
+            client.force_login(user)
+            client.post(url)
+
+        self.race(submit, threads=4)
+
+        product.refresh_from_db()
+        self.assertEqual(product.reserved, 2)
+        self.assertEqual(StockHold.objects.filter(order=order).count(), 1)
+
+    def test_concurrent_adds_of_a_new_product_merge_into_one_line(self):
+        product = make_product(quantity=50)
+        order = make_order(User.objects.create_user('adder'))
+
+        self.race(lambda: add_items(order, [(product.pk, 1)]))
+
+        item = OrderItem.objects.get(order=order)
+        self.assertEqual(item.quantity, 8)
+
+    def test_concurrent_callback_replays_commit_stock_once(self):
+        product = make_product(quantity=5)
+        order = make_order(User.objects.create_user('racer'), (product, 2))
+        hold_order(order)
+        Order.objects.filter(pk=order.pk).update(status='confirmed')
+        Payment.objects.create(
+            order=order, phone_number=PHONE, amount=Decimal('2400'),
+            checkout_request_id='ws_CO_race', dispatch_status='SENT',
+        )
+        result = parse_callback(build_callback('ws_CO_race', 'merchant-race', amount=2400))
+        applied = []
+
+        self.race(lambda: applied.append(apply_callback(result)))
+
+        product.refresh_from_db()
+        self.assertEqual(applied.count(True), 1)
+        self.assertEqual((product.quantity, product.reserved), (3, 0))
+
+
+class SearchTests(TestCase):
+    """The database's own full-text index: FTS5 on SQLite, tsvector on PostgreSQL."""
+
+    def names(self, text):
+        return set(search.match(Product.objects.all(), text).values_list('name', flat=True))
+
+    def test_every_term_matches_the_start_of_a_word(self):
+        make_product('Vintage denim jacket')
+        make_product('Denim cap')
+        make_product('Slim jeans')
+        self.assertEqual(self.names('den'), {'Vintage denim jacket', 'Denim cap'})
+        self.assertEqual(self.names('DENIM jac'), {'Vintage denim jacket'})
+        self.assertEqual(self.names('nim'), set())
+
+    def test_index_follows_renames_deletes_and_bulk_writes(self):
+        hoodie = make_product('Grey hoodie')
+        hoodie.name = 'Black hoodie'
+        hoodie.save()
+        Product.objects.bulk_create([
+            Product(name='Cargo pants', category='OTHER', size='32', buying_price=1, selling_price=2, quantity=1),
+        ])
+        Product.objects.filter(name='Cargo pants').update(name='Cargo shorts')
+
+        self.assertEqual(self.names('grey'), set())
+        self.assertEqual(self.names('black'), {'Black hoodie'})
+        self.assertEqual(self.names('pants'), set())
+        self.assertEqual(self.names('shorts'), {'Cargo shorts'})
+
+        hoodie.delete()
+        self.assertEqual(self.names('hoodie'), set())
+
+    def test_search_applies_filters_and_facets_ignore_their_own(self):
+        make_product('Denim jacket', category='OTHER', size='M')
+        make_product('Denim jeans', category='JEANS', size='32')
+        make_product('Wool hoodie', category='HOODIE', size='L')
+
+        params = {'q': 'denim', 'category': 'JEANS'}
+        self.assertEqual(list(search.search(params).values_list('name', flat=True)), ['Denim jeans'])
+
+        facets = search.facets(params)
+        self.assertEqual(
+            {row['value']: row['count'] for row in facets['categories']}, {'OTHER': 1, 'JEANS': 1},
+        )
+        self.assertEqual({row['value'] for row in facets['sizes']}, {'32'})
+
+    def test_price_bands_ignore_the_selected_price_range(self):
+        make_product('Denim cap', selling_price=Decimal('300'))
+        make_product('Denim jacket', selling_price=Decimal('1200'))
+        make_product('Denim coat', category='HOODIE', selling_price=Decimal('1500'))
+
+        facets = search.facets({'q': 'denim', 'min_price': Decimal('1000'), 'max_price': Decimal('2000')})
+
+        self.assertEqual(
+            {row['label']: row['count'] for row in facets['prices']}, {'Under 500': 1, '1,000 - 2,000': 2},
+        )
+        self.assertEqual({row['value']: row['count'] for row in facets['categories']}, {'OTHER': 1, 'HOODIE': 1})
+
+
+class ExportTests(TestCase):
+    def lines(self, dataset, since=None, until=None):
+        text = ''.join(exports.csv_lines(dataset, since, until))
+        return list(csv.reader(io.StringIO(text, newline='')))
+
+    def test_csv_cells_that_look_like_formulas_are_escaped(self):
+        user = User.objects.create_user('=HYPERLINK("http://x","y")')
+        Order.objects.create(customer=user, total_amount=Decimal('-5'))
+        names = ('+cmd', '-1+2', '@SUM(A1)', '\tTab', '\rReturn', 'Plain')
+        for name in names:
+            Sale.objects.create(product=make_product(name), quantity=1, total_amount=Decimal('1200'))
+
+        header, order = self.lines('orders')
+        self.assertEqual(order[header.index('customer')], '\'=HYPERLINK("http://x","y")')
+        # Only text is escaped; a negative amount is still a number
+        self.assertEqual(order[header.index('total_amount')], '-5.00')
+
+        header, *sales = self.lines('sales')
+        self.assertEqual(
+            [sale[header.index('product')] for sale in sales],
+            ["'+cmd", "'-1+2", "'@SUM(A1)", "'\tTab", "'\rReturn", 'Plain'],
+        )
+    def sell_on(self, *days):
+        jacket = make_product()
+        for day in days:
+            sale = Sale.objects.create(product=jacket, quantity=1, total_amount=Decimal('1200'))
+            moment = timezone.make_aware(datetime.combine(day, time(12)))
+            Sale.objects.filter(pk=sale.pk).update(date=moment)
+        return list(Sale.objects.order_by('pk').values_list('pk', flat=True))
+
+    def test_csv_has_one_row_per_record_within_the_dates(self):
+        today = timezone.localdate()
+        first, second, third = self.sell_on(today - timedelta(days=2), today - timedelta(days=1), today)
+
+        header, *sales = self.lines('sales')
+        self.assertEqual(header, exports.columns('sales'))
+        self.assertEqual([int(sale[0]) for sale in sales], [first, second, third])
+        self.assertEqual(sales[0][header.index('product')], 'Denim jacket')
+        self.assertEqual(sales[0][header.index('total_amount')], '1200.00')
+
+        # since is inclusive, until exclusive, both local midnight
+        _, *sales = self.lines('sales', since=today - timedelta(days=1), until=today)
+        self.assertEqual([int(sale[0]) for sale in sales], [second])
+        _, *sales = self.lines('sales', since=today)
+        self.assertEqual([int(sale[0]) for sale in sales], [third])
+
+    def test_export_view_is_staff_only_and_checks_dates(self):
+        self.sell_on(timezone.localdate())
+        url = reverse('inventory:export_csv', args=['sales'])
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales.csv"')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 2)
+
+        self.assertEqual(self.client.get(url, {'since': '2026-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('inventory:export_csv', args=['users'])).status_code, 404)
+
+    @skipUnless(exports.pq, 'pyarrow is not installed')
+    def test_parquet_holds_the_same_rows_as_csv(self):
+        today = timezone.localdate()
+        self.sell_on(today - timedelta(days=1), today)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sales.parquet')
+            self.assertEqual(exports.write_parquet('sales', path, since=today), 1)
+            table = exports.pq.read_table(path)
+
+        _, *sales = self.lines('sales', since=today)
+        self.assertEqual(table.column_names, exports.columns('sales'))
+        self.assertEqual(table.column('id').to_pylist(), [int(sale[0]) for sale in sales])
+        self.assertEqual(table.column('total_amount').to_pylist(), [Decimal('1200.00')])
+
+
+
+class PaginationTests(TestCase):
+    """Keyset pages of the catalogue, through inventory.pagination and the views."""
+
+    def walk(self, queryset, key=NEWEST, page_size=2):
+        seen, token = [], None
+        while True:
+            items, token = keyset_page(queryset, token, page_size=page_size, key=key)
+            seen.extend(item.pk for item in items)
+            if token is None:
+                return seen
+
+    def test_pages_cover_every_product_once_when_timestamps_tie(self):
+        products = [make_product(f'Item {i}') for i in range(7)]
+        added = timezone.now()
+        Product.objects.filter(pk__in=[p.pk for p in products[1:6]]).update(date_added=added)
+        Product.objects.filter(pk=products[6].pk).update(date_added=added - timedelta(days=1))
+
+        expected = list(Product.objects.order_by('-date_added', '-id').values_list('pk', flat=True))
+        self.assertEqual(self.walk(Product.objects.all()), expected)
+        self.assertEqual(self.walk(Product.objects.all(), page_size=3), expected)
+
+    def test_gallery_key_walks_ids_downwards(self):
+        products = [make_product(f'Item {i}') for i in range(5)]
+        self.assertEqual(self.walk(Product.objects.all(), key=('id',)), [p.pk for p in reversed(products)])
+
+    def test_bad_cursor_starts_from_the_first_page(self):
+        make_product('Denim cap')
+        first, _ = keyset_page(Product.objects.all())
+        # Not base64, the wrong number of fields, fields that don't parse
+        for token in ('not base64!', encode_cursor(first[0], ('id',)), 'eWVzdGVyZGF5fGFiYw'):
+            self.assertEqual(keyset_page(Product.objects.all(), token)[0], first)
+
+    def test_next_link_leads_to_the_rest_of_the_catalogue(self):
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', category='OTHER', size='M', buying_price=1, selling_price=2, quantity=1)
+            for i in range(PAGE_SIZE + 1)
+        ])
+        newest = list(Product.objects.order_by('-date_added', '-id').values_list('pk', flat=True))
+
+        first = self.client.get(reverse('inventory:product_list'))
+        self.assertTrue(first.context['is_first_page'])
+        self.assertEqual([p.pk for p in first.context['products']], newest[:PAGE_SIZE])
+
+        rest = self.client.get(reverse('inventory:product_list'), {'after': first.context['next_cursor']})
+        self.assertFalse(rest.context['is_first_page'])
+        self.assertEqual([p.pk for p in rest.context['products']], newest[PAGE_SIZE:])
+        self.assertIsNone(rest.context['next_cursor'])
+
+    def test_gallery_lists_the_highest_ids_first(self):
+        products = [make_product(f'Item {i}') for i in range(3)]
+        Product.objects.filter(pk=products[0].pk).update(date_added=timezone.now() + timedelta(days=1))
+
+        response = self.client.get(reverse('inventory:product_gallery'))
+        self.assertEqual([p.pk for p in response.context['products']], [p.pk for p in reversed(products)])
+
+
+class CatalogueCacheTests(TestCase):
+    """Version-keyed catalogue caching in inventory.caching."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_product_save_and_delete_bump_the_version(self):
+        before = catalogue_version()
+        jacket = make_product()
+        self.assertGreater(catalogue_version(), before)
+
+        before = catalogue_version()
+        jacket.delete()
+        self.assertGreater(catalogue_version(), before)
+
+    def test_stock_changes_bump_the_version_on_commit(self):
+        jacket = make_product(quantity=5)
+        before = catalogue_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            take_stock(jacket.pk, 1)
+            self.assertEqual(catalogue_version(), before)
+        self.assertGreater(catalogue_version(), before)
+
+    def test_an_evicted_version_never_repeats(self):
+        before = catalogue_version()
+        cache.delete(CATALOGUE_VERSION_KEY)
+        self.assertGreater(catalogue_version(), before)
+
+    @override_settings(CATALOGUE_CACHE_SECONDS=60)
+    def test_cached_pages_are_served_until_a_product_changes(self):
+        jacket = make_product('Denim jacket')
+
+        def names():
+            response = self.client.get(reverse('inventory:product_list'))
+            return [p.name for p in response.context['products']]
+
+        self.assertEqual(names(), ['Denim jacket'])
+        # A queryset update sends no signal, so the cached page stays
+        Product.objects.filter(pk=jacket.pk).update(name='Cord jacket')
+        self.assertEqual(names(), ['Denim jacket'])
+
+        jacket.refresh_from_db()
+        jacket.save()
+        self.assertEqual(names(), ['Cord jacket'])
+
+
+@override_settings(MAX_IMAGE_UPLOAD_BYTES=1024)
+class UploadLimitTests(TestCase):
+    """@limit_upload_size and the checks on what gets uploaded."""
+
+    def post_product(self, image):
+        return self.client.post(reverse('inventory:product_create'), {
+            'name': 'Denim jacket', 'category': 'OTHER', 'size': 'M',
+            'buying_price': '500', 'selling_price': '1200', 'quantity': '5', 'image': image,
+        })
+
+    def messages(self, response):
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+    def test_body_over_the_limit_is_refused_unread(self):
+        image = SimpleUploadedFile('huge.jpg', b'x' * (FORM_OVERHEAD_BYTES + 2048), 'image/jpeg')
+        response = self.post_product(image)
+
+        self.assertTrue(response.wsgi_request.upload_rejected)
+        self.assertEqual(response.wsgi_request.POST, {})
+        self.assertEqual(self.messages(response), ['Product image is too large'])
+        self.assertFalse(Product.objects.exists())
+
+    def test_file_over_the_limit_is_dropped_while_streaming(self):
+        image = SimpleUploadedFile('big.jpg', b'x' * 2048, 'image/jpeg')
+        response = self.post_product(image)
+
+        request = response.wsgi_request
+        self.assertTrue(request.upload_rejected)
+        # The rest of the form still parsed; only the file is gone
+        self.assertEqual(request.POST['name'], 'Denim jacket')
+        self.assertNotIn('image', request.FILES)
+        self.assertEqual(self.messages(response), ['Product image is too large'])
+        self.assertFalse(Product.objects.exists())
+
+    def test_file_that_is_not_an_image_is_rejected(self):
+        response = self.post_product(SimpleUploadedFile('fake.jpg', b'not an image', 'image/jpeg'))
+
+        self.assertFalse(response.wsgi_request.upload_rejected)
+        self.assertTrue(response.context['form'].has_error('image'))
+        self.assertFalse(Product.objects.exists())
+
+    def test_avatar_that_is_not_an_image_leaves_the_old_picture(self):
+        profile = UserProfile.objects.create(user=User.objects.create_user('avatar'))
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as upload:
+            upload.write(b'not an image')
+            upload.flush()
+            with self.assertLogs('inventory.images', 'WARNING'):
+                self.assertIsNone(images.process_avatar(profile.pk, upload.name))
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.profile_pic.name, 'profiles/default_avatar.png')
+
+
+class ServiceWorkerAssetTests(TestCase):
+    """/service-worker.js served from memory by inventory.assets."""
+
+    def test_matching_etag_gets_a_bodiless_304(self):
+        first = self.client.get('/service-worker.js')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/javascript')
+        self.assertEqual(first['Service-Worker-Allowed'], '/')
+        self.assertEqual(first['Cache-Control'], 'no-cache')
+        self.assertIn('Accept-Encoding', first['Vary'])
+
+        again = self.client.get('/service-worker.js', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b'')
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        stale = self.client.get('/service-worker.js', headers={'If-None-Match': '"stale"'})
+        self.assertEqual(stale.status_code, 200)
+
+    def test_compressed_copy_matches_the_file(self):
+        plain = self.client.get('/service-worker.js')
+        self.assertNotIn('Content-Encoding', plain)
+
+        zipped = self.client.get('/service-worker.js', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(zipped.content), plain.content)
+        self.assertEqual(zipped['ETag'], plain['ETag'])
+
+
+class CatalogueSyncTests(TestCase):
+    """Snapshots and deltas for offline clients, from the ProductChange log."""
+
+    def rows(self, payload):
+        return {row[0]: dict(zip(payload['fields'], row)) for row in payload['products']}
+
+    def test_delta_brings_a_snapshot_up_to_date(self):
+        jacket = make_product('Denim jacket')
+        boots = make_product('Leather boots')
+        base = catalogue.snapshot()
+        self.assertEqual(set(self.rows(base)), {jacket.pk, boots.pk})
+
+        jacket.name = 'Cord jacket'
+        jacket.save()
+        boots_pk = boots.pk
+        boots.delete()
+        cap = make_product('Denim cap')
+        take_stock(cap.pk, 1)
+
+        change = catalogue.delta(base['version'])
+        self.assertEqual(change['version'], catalogue.current_version())
+        self.assertEqual(change['deleted'], [boots_pk])
+        rows = self.rows(change)
+        self.assertEqual(set(rows), {jacket.pk, cap.pk})
+        self.assertEqual(rows[jacket.pk]['name'], 'Cord jacket')
+        self.assertEqual(rows[cap.pk]['available'], 4)
+
+        self.assertEqual(catalogue.delta(change['version'])['products'], [])
+
+    def test_delta_asks_for_a_new_snapshot_when_too_far_behind_or_ahead(self):
+        make_product()
+        version = catalogue.current_version()
+        self.assertTrue(catalogue.delta(version + 1)['reset'])
+        with patch.object(catalogue, 'MAX_DELTA_CHANGES', 0):
+            self.assertTrue(catalogue.delta(0)['reset'])
+
+    def test_compaction_keeps_what_every_client_receives(self):
+        jacket = make_product('Denim jacket')
+        boots = make_product('Leather boots')
+        base = catalogue.current_version()
+        for name in ('Cord jacket', 'Suede jacket'):
+            jacket.name = name
+            jacket.save()
+        boots.delete()
+        before = [catalogue.delta(since) for since in range(base + 1)]
+
+        self.assertGreater(catalogue.compact(), 0)
+
+        self.assertEqual(ProductChange.objects.count(), 2)
+        self.assertEqual([catalogue.delta(since) for since in range(base + 1)], before)
+
+    def test_delta_view_accepts_a_timestamp(self):
+        make_product()
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.get(reverse('inventory:catalogue_delta'), {'since': since})
+        self.assertEqual(len(response.json()['products']), 1)
+
+        response = self.client.get(reverse('inventory:catalogue_delta'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unchanged_snapshot_is_a_304(self):
+        make_product()
+        url = reverse('inventory:catalogue_snapshot')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+
+class SalesRollupTests(TestCase):
+    """inventory.analytics keeps SalesRollup equal to summing the raw sales."""
+
+    def setUp(self):
+        self.jacket = make_product('Denim jacket')
+        self.boots = make_product('Leather boots', category='SHOES', selling_price=Decimal('2000'))
+        for product, quantity in ((self.jacket, 1), (self.jacket, 2), (self.boots, 1)):
+            sale = Sale.objects.create(
+                product=product, quantity=quantity, total_amount=quantity * product.selling_price,
+            )
+            analytics.record_sale(sale)
+        order = make_order(User.objects.create_user('payer'), (self.jacket, 1), (self.boots, 2))
+        Order.objects.filter(pk=order.pk).update(status='paid')
+        analytics.record_paid_orders([order.pk])
+
+    def rollups(self):
+        return list(
+            SalesRollup.objects.order_by('period', 'period_start', 'product_id')
+            .values_list('period', 'period_start', 'product_id', 'category', 'units', 'revenue', 'profit')
+        )
+
+    def test_totals_match_the_raw_sales(self):
+        revenue = Sale.objects.aggregate(total=Sum('total_amount'))['total'] + Decimal('1200') + 2 * Decimal('2000')
+        for period in analytics.PERIOD_KINDS:
+            totals = SalesRollup.objects.filter(period=period).aggregate(
+                units=Sum('units'), revenue=Sum('revenue'), profit=Sum('profit'),
+            )
+            # 7 units at a buying price of 500
+            self.assertEqual(totals, {'units': 7, 'revenue': revenue, 'profit': revenue - 7 * Decimal('500')})
+
+        self.assertEqual(
+            dict(SalesRollup.objects.filter(period='D').values_list('product_id', 'units')),
+            {self.jacket.pk: 4, self.boots.pk: 3},
+        )
+
+    def test_rebuild_reproduces_the_incremental_rollups(self):
+        incremental = self.rollups()
+        self.assertEqual(len(incremental), 6)
+        self.assertEqual(analytics.rebuild(), 6)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_summary_reads_the_rollups(self):
+        summary = analytics.summary('D')
+        self.assertEqual(summary['units'], 7)
+        self.assertEqual(summary['revenue'], Decimal('10800'))
+        self.assertEqual(summary['profit'], Decimal('7300'))
+        self.assertEqual([row['category'] for row in summary['categories']], ['SHOES', 'OTHER'])
+
+
+class ProductImportTests(TestCase):
+    """Batched, resumable sheet imports in inventory.imports."""
+
+    def setUp(self):
+        media = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+
+    def sheet(self, *names, category='Hoodie'):
+        lines = ['Name,Category,Size,Buying_price,Selling_price,Quantity']
+        lines += [f'{name},{category},M,500,1200,3' for name in names]
+        return ProductImport.objects.create(source=ContentFile('\n'.join(lines).encode(), name='sheet.csv'))
+
+    def test_valid_rows_are_created_and_bad_ones_reported(self):
+        product_import = self.sheet('Grey hoodie', '', 'Black hoodie')
+
+        product_import = imports.run(product_import.pk)
+
+        self.assertEqual(product_import.status, 'DONE')
+        self.assertEqual((product_import.total_rows, product_import.processed_rows), (3, 3))
+        self.assertEqual(product_import.created_count, 2)
+        # Row numbers count the header line, like the spreadsheet does
+        errors = [(error['row'], list(error['errors'])) for error in product_import.errors]
+        self.assertEqual(errors, [(3, ['name'])])
+        self.assertEqual(
+            set(Product.objects.values_list('name', 'category')),
+            {('Grey hoodie', 'HOODIE'), ('Black hoodie', 'HOODIE')},
+        )
+
+    @patch.object(imports, 'BATCH_SIZE', 2)
+    def test_failed_import_resumes_after_its_last_batch(self):
+        product_import = self.sheet(*[f'Hoodie {i}' for i in range(1, 6)])
+        validate = imports.validate
+        calls = []
+
+        def fail_on_the_fourth_row(row):
+            calls.append(row['name'])
+            if len(calls) == 4:
+                raise RuntimeError('worker died')
+            return validate(row)
+
+        with patch.object(imports, 'validate', fail_on_the_fourth_row), self.assertLogs('inventory.imports'):
+            product_import = imports.run(product_import.pk)
+        self.assertEqual(product_import.status, 'FAILED')
+        self.assertEqual((product_import.processed_rows, product_import.created_count), (2, 2))
+
+        product_import = imports.run(product_import.pk)
+
+        self.assertEqual(product_import.status, 'DONE')
+        self.assertEqual((product_import.processed_rows, product_import.created_count), (5, 5))
+        self.assertEqual(
+            sorted(Product.objects.values_list('name', flat=True)), [f'Hoodie {i}' for i in range(1, 6)],
+        )
+
+    def test_running_import_is_only_taken_over_with_force(self):
+        product_import = self.sheet('Grey hoodie')
+        ProductImport.objects.filter(pk=product_import.pk).update(status='RUNNING')
+
+        self.assertEqual(imports.run(product_import.pk).status, 'RUNNING')
+        self.assertFalse(Product.objects.exists())
+
+        self.assertEqual(imports.run(product_import.pk, force=True).status, 'DONE')
+        self.assertTrue(Product.objects.exists())
+
+
+class OrderIdTests(TestCase):
+    """Order.save() draws a fresh order_id when the unique index rejects one."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('orders')
+        self.taken = Order.objects.create(customer=self.user).order_id
+
+    def test_order_id_format(self):
+        self.assertRegex(self.taken, r'^TV-\d{14}-[0-9A-HJKMNP-TV-Z]{10}$')
+
+    def test_clashing_order_id_is_drawn_again(self):
+        with patch('inventory.models.generate_order_id', side_effect=[self.taken, 'TV-20261018093012-7KQ2M9XW4D']):
+            order = Order.objects.create(customer=self.user)
+        self.assertEqual(order.order_id, 'TV-20261018093012-7KQ2M9XW4D')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_gives_up_after_three_clashes(self):
+        order = Order(customer=self.user)
+        with patch('inventory.models.generate_order_id', return_value=self.taken) as generate:
+            with self.assertRaises(IntegrityError):
+                order.save()
+        self.assertEqual(generate.call_count, 3)
+        self.assertIsNone(order.order_id)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class MetricsTests(TestCase):
+    """PerfMiddleware's counters and their Prometheus rendering in inventory.metrics."""
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def series(self, name, view):
+        prefix = f'thriftvibes_{name}{{view="{view}"}} '
+        values = [line.removeprefix(prefix) for line in metrics.render().splitlines() if line.startswith(prefix)]
+        return float(values[0]) if values else None
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_every_request_is_timed_under_its_url_name(self):
+        self.client.get(reverse('inventory:product_list'))
+        self.client.get(reverse('inventory:product_list'), {'q': 'denim'})
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(self.series('request_seconds_count', 'inventory:product_list'), 2)
+        self.assertEqual(self.series('request_seconds_count', '<unresolved>'), 1)
+        # Unsampled: latency only
+        self.assertIsNone(self.series('db_queries_count', 'inventory:product_list'))
+
+    @override_settings(PERF_SAMPLE_RATE=1)
+    def test_sampled_requests_count_queries_and_template_time(self):
+        make_product()
+        self.client.get(reverse('inventory:product_list'))
+
+        self.assertEqual(self.series('db_queries_count', 'inventory:product_list'), 1)
+        self.assertGreater(self.series('db_queries_sum', 'inventory:product_list'), 0)
+        self.assertGreater(self.series('template_seconds_sum', 'inventory:product_list'), 0)
+
+    def test_repeated_statements_are_reported_as_n_plus_one(self):
+        stats = metrics.RequestStats()
+        stats.statements['SELECT "a", "b" FROM "t" WHERE "id" = %s'] = metrics.N_PLUS_ONE_THRESHOLD
+        stats.statements['SELECT "a" FROM "u"'] = metrics.N_PLUS_ONE_THRESHOLD - 1
+        metrics.record('inventory:order_list', 0.1, stats)
+
+        lines = [line for line in metrics.render().splitlines() if line.startswith('thriftvibes_n_plus_one_max')]
+        self.assertEqual(lines, [
+            'thriftvibes_n_plus_one_max_repeats{view="inventory:order_list",'
+            'query="SELECT ... FROM \\"t\\" WHERE \\"id\\" = %s"} 5',
+        ])
+        # IN lists of any length share one series
+        self.assertEqual(
+            metrics.fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            metrics.fingerprint('SELECT "a" FROM "t" WHERE "id" IN (%s)'),
+        )
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_metrics_need_staff_or_the_scrape_token(self):
+        url = reverse('inventory:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+
+        response = self.client.get(url, headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE thriftvibes_request_seconds histogram', response.content.decode())
+
+
+class CartTests(TestCase):
+    """The session cart (inventory.cart) and the sweep of abandoned orders."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('browser')
+        self.client.force_login(self.user)
+        self.jacket = make_product('Denim jacket', quantity=5)
+        self.boots = make_product('Leather boots', quantity=2, selling_price=Decimal('2000'))
+
+    def add_to_cart(self, product, quantity, action='add'):
+        return self.client.post(
+            reverse('inventory:cart'), {'product': product.pk, 'quantity': quantity, 'action': action},
+        )
+
+    def test_cart_lives_in_the_session_until_checkout(self):
+        self.add_to_cart(self.jacket, 1)
+        self.add_to_cart(self.jacket, 1)
+        self.add_to_cart(self.boots, 2)
+        self.add_to_cart(self.boots, 1, action='update')
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+        # Priced at checkout, not when added
+        Product.objects.filter(pk=self.jacket.pk).update(selling_price=Decimal('1000'))
+        response = self.client.post(reverse('inventory:create_order'))
+
+        order = Order.objects.get(customer=self.user)
+        self.assertRedirects(
+            response, reverse('inventory:checkout_order', args=[order.pk]), fetch_redirect_response=False,
+        )
+        self.assertEqual(
+            set(order.items.values_list('product_id', 'quantity', 'price')),
+            {(self.jacket.pk, 2, Decimal('1000')), (self.boots.pk, 1, Decimal('2000'))},
+        )
+        self.assertEqual(order.total_amount, Decimal('4000'))
+        self.assertEqual(self.client.session.get(cart.SESSION_KEY), None)
+
+    def test_cart_cannot_hold_more_than_is_available(self):
+        self.add_to_cart(self.boots, 2)
+        self.add_to_cart(self.boots, 1)
+        self.assertEqual(self.client.session[cart.SESSION_KEY], {str(self.boots.pk): 2})
+
+    def test_empty_cart_is_not_checked_out(self):
+        response = self.client.post(reverse('inventory:create_order'))
+        self.assertRedirects(response, reverse('inventory:cart'), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+
+    def test_offline_batch_is_applied_once(self):
+        body = {
+            'batch_id': 'b-1',
+            'items': [{'product': self.jacket.pk, 'quantity': 2}, {'product': 0, 'quantity': 1}],
+        }
+        url = reverse('inventory:cart_batch')
+
+        first = self.client.post(url, body, content_type='application/json').json()
+        self.assertEqual((first['added'], first['errors']), (1, {'0': 'Unknown product'}))
+        again = self.client.post(url, body, content_type='application/json').json()
+        self.assertEqual(again, {'status': 'duplicate'})
+        self.assertEqual(self.client.session[cart.SESSION_KEY], {str(self.jacket.pk): 2})
+
+    def test_delete_stale_only_removes_old_unpaid_pending_orders(self):
+        stale = make_order(self.user, (self.jacket, 1))
+        fresh = make_order(self.user, (self.jacket, 1))
+        confirmed = make_order(self.user, (self.jacket, 1))
+        paying = make_order(self.user, (self.jacket, 1))
+        Order.objects.filter(pk=confirmed.pk).update(status='confirmed')
+        Payment.objects.create(order=paying, phone_number=PHONE, amount=Decimal('1200'))
+        old = timezone.now() - timedelta(days=2)
+        Order.objects.exclude(pk=fresh.pk).update(updated_at=old)
+        another = make_order(self.user)
+        Order.objects.filter(pk=another.pk).update(updated_at=old)
+
+        self.assertEqual(delete_stale(timedelta(days=1), batch_size=1), 2)
+
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {fresh.pk, confirmed.pk, paying.pk})
+        self.assertFalse(OrderItem.objects.filter(order_id=stale.pk).exists())
+
+
+class AddItemsTests(TestCase):
+    """orders.add_items and the offline batch endpoint built on it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('adder')
+        self.jacket = make_product('Denim jacket')
+        self.boots = make_product('Leather boots', selling_price=Decimal('2000'))
+        self.order = make_order(self.user)
+
+    def lines(self):
+        return set(self.order.items.values_list('product_id', 'quantity', 'price'))
+
+    def test_repeated_products_merge_into_one_line(self):
+        OrderItem.objects.create(order=self.order, product=self.jacket, quantity=1, price=Decimal('900'))
+
+        pairs = [(self.jacket.pk, 1), (str(self.jacket.pk), '2'), (self.boots.pk, 1)]
+        added, errors = add_items(self.order, pairs)
+
+        self.assertEqual((added, errors), (2, {}))
+        # The existing line is topped up and repriced at today's price
+        self.assertEqual(
+            self.lines(), {(self.jacket.pk, 4, Decimal('1200')), (self.boots.pk, 1, Decimal('2000'))},
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('6800'))
+
+    def test_bad_lines_are_reported_and_the_rest_applied(self):
+        added, errors = add_items(self.order, [('x', 1), (self.jacket.pk, 0), (0, 1), (self.boots.pk, 1)])
+
+        self.assertEqual(added, 1)
+        self.assertEqual(errors, {
+            'x': 'Invalid product or quantity',
+            self.jacket.pk: 'Quantity must be greater than zero',
+            0: 'Unknown product',
+        })
+        self.assertEqual(self.lines(), {(self.boots.pk, 1, Decimal('2000'))})
+
+    def test_batch_endpoint_ignores_client_prices_and_replays(self):
+        self.client.force_login(self.user)
+        url = reverse('inventory:add_order_items_batch', args=[self.order.pk])
+        body = {'batch_id': 'b-1', 'items': [{'product': self.jacket.pk, 'quantity': 2, 'price': '1'}]}
+
+        def post():
+            return self.client.post(url, body, content_type='application/json')
+
+        self.assertEqual(post().json()['status'], 'ok')
+        self.assertEqual(post().json(), {'status': 'duplicate'})
+        self.assertEqual(self.lines(), {(self.jacket.pk, 2, Decimal('1200'))})
+
+        Order.objects.filter(pk=self.order.pk).update(status='confirmed')
+        body['batch_id'] = 'b-2'
+        self.assertEqual(post().status_code, 409)
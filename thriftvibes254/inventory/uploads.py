@@ -0,0 +1,84 @@
+"""
+Streaming upload limits.
+
+Uploads are spooled straight to a temp file instead of being buffered in
+memory. A body whose Content-Length is over MAX_IMAGE_UPLOAD_BYTES is
+refused before any of it is read; a file that turns out too big while
+streaming is dropped chunk by chunk (the other form fields, including the
+CSRF token, still parse). Views opt in with @limit_upload_size and check
+`request.upload_rejected`.
+"""
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    SkipFile,
+    TemporaryFileUploadHandler,
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+
+# Room for the other form fields and multipart boundaries
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class SizeLimitedUploadHandler(FileUploadHandler):
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes or settings.MAX_IMAGE_UPLOAD_BYTES
+        self.received = 0
+        request.upload_rejected = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.request.upload_rejected = True
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def limit_upload_size(view=None, *, max_bytes=None):
+    """
+    Swap in the size-limited, disk-spooling upload handlers for this view.
+    Handlers must be replaced before anything reads request.POST, which the
+    CSRF middleware would do, so CSRF is checked inside the wrapper instead.
+
+    A body whose Content-Length is already over the limit is refused without
+    reading it. The view still runs, with empty POST/FILES and
+    `upload_rejected` set, so it must not change anything in that case.
+
+    Use as @limit_upload_size, or @limit_upload_size(max_bytes=...) for a
+    limit other than MAX_IMAGE_UPLOAD_BYTES.
+    """
+    if view is None:
+        return partial(limit_upload_size, max_bytes=max_bytes)
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        limit = max_bytes or settings.MAX_IMAGE_UPLOAD_BYTES
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if request.method == 'POST' and content_length > limit + FORM_OVERHEAD_BYTES:
+            request.upload_handlers = []
+            request._post, request._files = QueryDict(), MultiValueDict()
+            request.upload_rejected = True
+            return view(request, *args, **kwargs)
+
+        request.upload_handlers = [
+            SizeLimitedUploadHandler(request, max_bytes=limit),
+            TemporaryFileUploadHandler(request),
+        ]
+        return protected(request, *args, **kwargs)
+
+    return wrapper
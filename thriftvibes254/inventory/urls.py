@@ -16,18 +16,31 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('add/', views.product_create, name='product_create'),
     path('edit/<int:pk>/', views.product_update, name='product_update'),
+    path('import/', views.product_import, name='product_import'),
+    path('import/<int:import_id>/', views.product_import_detail, name='product_import_detail'),
     path('delete/<int:pk>/', views.product_delete, name='product_delete'),
     path('sale/', views.record_sale, name='record_sale'),
     path('gallery/', views.product_gallery, name='product_gallery'),
     path("signup/", signup, name="signup"),
+    path('cart/', views.cart_view, name='cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('orders/new/', views.create_order, name='create_order'),
     path('orders/<int:order_id>/items/', views.add_order_items, name='add_order_items'),
+    path('orders/<int:order_id>/items/batch/', views.add_order_items_batch, name='add_order_items_batch'),
     path('orders/<int:order_id>/checkout/', checkout_order, name='checkout_order'),
     path('orders/<int:order_id>/confirmation/', order_confirmation, name='order_confirmation'),
     path("customer/dashboard/", customer_dashboard, name="customer_dashboard"),
     path("redirect/", redirect_after_login, name="redirect_after_login"),
     path("mpesa/callback/", views.mpesa_callback, name="mpesa_callback"),
     path("pay_order/<int:order_id>/", views.pay_order, name="pay_order"),
+    path("payments/<int:payment_id>/", views.payment_detail, name="payment_detail"),
+    path("payments/<int:payment_id>/status/", views.payment_status, name="payment_status"),
     path("profile/", user_profile, name="user_profile"),
     path("settings/", user_settings, name="user_settings"),
+    path("cache/stats/", views.cache_stats, name="cache_stats"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("exports/<str:dataset>.csv", views.export_csv, name="export_csv"),
+    path("api/products/autocomplete/", views.product_autocomplete, name="product_autocomplete"),
+    path("api/catalogue/snapshot/", views.catalogue_snapshot, name="catalogue_snapshot"),
+    path("api/catalogue/delta/", views.catalogue_delta, name="catalogue_delta"),
 ]
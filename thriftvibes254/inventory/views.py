@@ -1,19 +1,37 @@
+import hashlib
 import json
+from urllib.parse import urlencode
 from decimal import Decimal
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import HttpResponse, JsonResponse
-from django.templatetags.static import static
-from django.utils.timezone import now
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.timezone import is_naive, localdate, make_aware, now
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db import IntegrityError, transaction
 from django.db.models import Sum
 from django.views.decorators.csrf import csrf_exempt
-
-from .models import Product, Sale, Order, OrderItem, MpesaTransaction, UserProfile
-from .forms import ProductForm, SaleForm, OrderItemForm, CustomerSignupForm
-from .mpesa import stk_push
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.conf import settings
+
+from .models import Product, ProductImport, Sale, Order, OrderItem, OrderItemBatch, MpesaTransaction, Payment, UserProfile
+from .forms import ProductForm, ProductImportForm, ProductSearchForm, SaleForm, OrderItemForm, CartItemForm, CustomerSignupForm
+from .pagination import NEWEST, keyset_page
+from .callbacks import apply_callback, parse_callback
+from .batcher import stage_callback
+from .stock import InsufficientStock, hold_order, take_stock_or_raise
+from .caching import catalogue_version, get_or_build, stats as caching_stats
+from .images import queue_avatar
+from .uploads import limit_upload_size
+from .assets import service_worker_asset
+from . import analytics, catalogue, exports, imports, metrics, search
+from .orders import add_items
+from .cart import Cart, CartError
 
 
 
@@ -30,15 +48,75 @@ def signup(request):
     
     return render(request, "registration/signup.html", {"form": form})   
 
+def _catalogue_page(request, key=NEWEST):
+    """
+    One keyset page of the catalogue (or of a search) in descending `key`
+    order, plus its facet counts, cached until the catalogue version changes.
+    """
+    cursor = request.GET.get('after') or ''
+    version = catalogue_version()
+    form = ProductSearchForm(request.GET)
+    params = form.params()
+    query = urlencode(sorted((name, str(value)) for name, value in params.items()))
+    search_key = hashlib.sha1(query.encode()).hexdigest()[:16] if query else ''
+
+    products, next_cursor = get_or_build(
+        f"catalogue:{version}:page:{'-'.join(key)}:{search_key}:{cursor}",
+        lambda: keyset_page(search.search(params), cursor, key=key),
+        settings.CATALOGUE_CACHE_SECONDS,
+    )
+    facets = get_or_build(
+        f"catalogue:{version}:facets:{search_key}",
+        lambda: search.facets(params),
+        settings.CATALOGUE_CACHE_SECONDS,
+    )
+    return {
+        'products': products,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor,
+        'cursor': cursor,
+        'catalogue_version': version,
+        'cache_seconds': settings.CATALOGUE_CACHE_SECONDS,
+        'search_form': form,
+        'search_query': query,
+        'search_key': search_key,
+        'facets': _facet_links(facets, params),
+    }
+
+
+def _facet_links(facets, params):
+    """Give every facet value the query string that toggles it."""
+    def link(**changes):
+        merged = {**params, **changes}
+        return urlencode(sorted((k, str(v)) for k, v in merged.items() if v not in (None, '')))
+
+    for name in ('categories', 'sizes'):
+        field = 'category' if name == 'categories' else 'size'
+        for facet in facets[name]:
+            facet['query'] = link(**{field: '' if facet['selected'] else facet['value']})
+    for facet in facets['prices']:
+        facet['selected'] = (
+            params.get('min_price') == facet['min'] and params.get('max_price') == facet['max']
+        )
+        facet['query'] = link(
+            min_price=None if facet['selected'] else facet['min'],
+            max_price=None if facet['selected'] else facet['max'],
+        )
+    return facets
+
+
 def product_list(request):
-    products = Product.objects.all().order_by('-date_added')
-    return render(request, 'inventory/product_list.html', {'products': products})
+    context = _catalogue_page(request)
+    return render(request, 'inventory/product_list.html', context)
 
 
+@limit_upload_size
 def product_create(request):
     if request.method == 'POST':
-        form = ProductForm(request.POST)
-        if form.is_valid():
+        form = ProductForm(request.POST, request.FILES)
+        if request.upload_rejected:
+            messages.error(request, 'Product image is too large')
+        elif form.is_valid():
             form.save()
             return redirect('inventory:product_list')
     else:
@@ -46,12 +124,57 @@ def product_create(request):
     return render(request, 'inventory/product_form.html', {'form': form})
 
 
+@staff_member_required
+@limit_upload_size(max_bytes=settings.MAX_IMPORT_UPLOAD_BYTES)
+def product_import(request):
+    if request.method == 'POST':
+        form = ProductImportForm(request.POST, request.FILES)
+        if request.upload_rejected:
+            messages.error(request, 'Upload is too large')
+        elif form.is_valid():
+            product_import = form.save()
+            imports.start(product_import)
+            return redirect('inventory:product_import_detail', import_id=product_import.id)
+    else:
+        form = ProductImportForm()
+    recent = ProductImport.objects.order_by('-created_at')[:10]
+    return render(request, 'inventory/product_import.html', {'form': form, 'imports': recent})
+
+
+@staff_member_required
+def product_import_detail(request, import_id):
+    product_import = get_object_or_404(ProductImport, id=import_id)
+    if request.method == 'POST' and product_import.status == 'FAILED':
+        imports.start(product_import)
+        return redirect('inventory:product_import_detail', import_id=product_import.id)
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({
+            'status': product_import.status,
+            'progress': product_import.progress,
+            'processed_rows': product_import.processed_rows,
+            'total_rows': product_import.total_rows,
+            'created_count': product_import.created_count,
+            'error_count': len(product_import.errors),
+        })
+    return render(request, 'inventory/product_import_detail.html', {'import': product_import})
+
+
+@limit_upload_size
 def product_update(request, pk):
-    product = get_object_or_404(Product, pk=pk)
-    form = ProductForm(request.POST or None, instance=product)
-    if form.is_valid():
-        form.save()
-        return redirect('inventory:product_list')
+    if request.method == 'POST' and request.upload_rejected:
+        form = ProductForm(request.POST, request.FILES, instance=get_object_or_404(Product, pk=pk))
+        messages.error(request, 'Product image is too large')
+    elif request.method == 'POST':
+        # Locked so the quantity is checked against, and save() writes back,
+        # the current `reserved` rather than one a checkout has since changed
+        with transaction.atomic():
+            product = get_object_or_404(Product.objects.select_for_update(), pk=pk)
+            form = ProductForm(request.POST, request.FILES, instance=product)
+            if form.is_valid():
+                form.save()
+                return redirect('inventory:product_list')
+    else:
+        form = ProductForm(instance=get_object_or_404(Product, pk=pk))
     return render(request, 'inventory/product_form.html', {'form': form})
 
 
@@ -69,18 +192,18 @@ def record_sale(request):
             sale = form.save(commit=False)
             product = sale.product
 
-            # ✅ FIXED FIELD NAME
-            if sale.quantity > product.quantity:
+            try:
+                with transaction.atomic():
+                    # reduce stock only if enough is left (single UPDATE)
+                    take_stock_or_raise(product.pk, sale.quantity)
+
+                    # calculate total
+                    sale.total_amount = Decimal(sale.quantity) * product.selling_price
+                    sale.save()
+                    analytics.record_sale(sale)
+            except InsufficientStock:
                 messages.error(request, 'Not enough stock available')
             else:
-                # reduce stock
-                product.quantity -= sale.quantity
-                product.save()
-
-                # calculate total
-                sale.total_amount = Decimal(sale.quantity) * product.selling_price
-                sale.save()
-
                 messages.success(request, 'Sale recorded successfully')
                 return redirect('inventory:product_list')
     else:
@@ -89,16 +212,65 @@ def record_sale(request):
     return render(request, 'inventory/sale_form.html', {'form': form})
 
 def product_gallery(request):
-    products = Product.objects.all().order_by('-id')
-
-    context = {
-        'products': products
-    }
+    # The gallery has always listed the highest ids first
+    context = _catalogue_page(request, key=('id',))
     return render(request, 'inventory/product_gallery.html', context)
 @login_required
 def dashboard(request):
     products = Product.objects.all()
-    return render(request, 'inventory/dashboard.html', {'products': products})
+    context = {'products': products}
+    if request.user.is_staff:
+        period = request.GET.get('period', 'D')
+        if period not in analytics.PERIOD_KINDS:
+            period = 'D'
+        # Sales and stock changes both bump the catalogue version; the date is
+        # in the key because the window moves at midnight
+        context['sales'] = get_or_build(
+            f"catalogue:{catalogue_version()}:dashboard:{period}:{localdate()}",
+            lambda: analytics.summary(period, buckets=30 if period == 'D' else 12),
+            settings.CATALOGUE_CACHE_SECONDS,
+        )
+    return render(request, 'inventory/dashboard.html', context)
+
+@staff_member_required
+def export_csv(request, dataset):
+    """Stream a dataset as CSV; ?since= and ?until= take YYYY-MM-DD dates."""
+    if dataset not in exports.DATASETS:
+        raise Http404("Unknown dataset")
+    try:
+        since, until = (_query_date(request, name) for name in ('since', 'until'))
+    except ValueError as exc:
+        return HttpResponse(str(exc), status=400, content_type='text/plain; charset=utf-8')
+    response = StreamingHttpResponse(
+        exports.csv_lines(dataset, since, until),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.csv"'
+    return response
+
+def _query_date(request, name):
+    value = request.GET.get(name, '')
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:  # well formed but impossible, e.g. 2026-13-01
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name} must be a YYYY-MM-DD date, not {value!r}")
+    return parsed
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    bearer = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    if not request.user.is_staff and not (token and constant_time_compare(bearer, token)):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+def cache_stats(request):
+    return JsonResponse(caching_stats())
 
 def login_view(request):
     if request.method == "POST":
@@ -114,14 +286,74 @@ def login_view(request):
 
 
 def service_worker(request):
-    sw_path = static("pwa/service-worker.js")
-    with open("." + sw_path, "r") as f:
-        return HttpResponse(f.read(), content_type="application/javascript")
+    return service_worker_asset.serve(request)
     
+@login_required
+def cart_view(request):
+    cart = Cart(request.session)
+
+    if request.method == "POST":
+        form = CartItemForm(request.POST)
+        if form.is_valid():
+            product, quantity = form.cleaned_data['product'], form.cleaned_data['quantity']
+            try:
+                if request.POST.get('action') == 'update':
+                    cart.set(product, quantity)
+                else:
+                    cart.add(product, quantity)
+            except CartError as exc:
+                messages.error(request, str(exc))
+            return redirect('inventory:cart')
+    else:
+        # "Add to Order" on the product grid links here with ?product=<id>
+        form = CartItemForm(initial={'product': request.GET.get('product')})
+
+    lines, total = cart.lines()
+    return render(request, 'inventory/orders/cart.html', {
+        'form': form,
+        'lines': lines,
+        'total': total,
+    })
+
+
+@login_required
+@require_POST
+def cart_batch(request):
+    """
+    Offline-queued "Add Item" submissions replayed by the service worker:
+    {"batch_id": "...", "items": [{"product": 3, "quantity": 2}, ...]}.
+    """
+    try:
+        data = json.loads(request.body)
+        batch_id = str(data["batch_id"])[:64]
+        pairs = [(item["product"], item["quantity"]) for item in data["items"]]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Malformed batch"}, status=400)
+
+    cart = Cart(request.session)
+    result = cart.add_batch(batch_id, pairs)
+    if result is None:
+        return JsonResponse({"status": "duplicate"})
+    added, errors = result
+    return JsonResponse({
+        "status": "ok",
+        "added": added,
+        "errors": {str(k): v for k, v in errors.items()},
+        "total": str(cart.lines()[1]),
+    })
+
+
 @login_required
 def create_order(request):
-    order = Order.objects.create(customer=request.user)
-    return redirect('inventory:add_order_items', order_id=order.id)
+    """Check the cart out: one insert for the order and one for all its items."""
+    if request.method != "POST":
+        return redirect('inventory:cart')
+    try:
+        order = Cart(request.session).checkout(request.user)
+    except CartError as exc:
+        messages.error(request, str(exc))
+        return redirect('inventory:cart')
+    return redirect('inventory:checkout_order', order_id=order.id)
 
 @login_required
 def add_order_items(request, order_id):
@@ -130,18 +362,19 @@ def add_order_items(request, order_id):
     # 🚫 Lock order if not pending
     if order.status != "pending":
         messages.error(request, "You cannot modify this order.")
-        return redirect("inventory:order_detail", order.id)
+        return redirect("inventory:order_confirmation", order.id)
 
-    items = order.items.all()
+    items = order.items.select_related('product')
 
     if request.method == "POST":
         form = OrderItemForm(request.POST)
         if form.is_valid():
-            item = form.save(commit=False)
-            item.order = order
-            item.save()
-
-            messages.success(request, "Item added successfully")
+            # Priced from the product; adding one already on the order tops it up
+            _, errors = add_items(order, [(form.cleaned_data['product'].pk, form.cleaned_data['quantity'])])
+            for message in errors.values():
+                messages.error(request, message)
+            if not errors:
+                messages.success(request, "Item added successfully")
             return redirect("inventory:add_order_items", order.id)
     else:
         form = OrderItemForm()
@@ -156,22 +389,135 @@ def add_order_items(request, order_id):
 
 
 
+@login_required
+@require_POST
+def add_order_items_batch(request, order_id):
+    """
+    JSON endpoint the service worker replays offline-queued items to:
+    {"batch_id": "...", "items": [{"product": 3, "quantity": 2}, ...]}.
+    A batch_id is applied at most once, so a retried sync can't double up.
+    """
+    order = get_object_or_404(Order, id=order_id, customer=request.user)
+    if order.status != "pending":
+        return JsonResponse({"error": "Order can no longer be modified"}, status=409)
+    try:
+        data = json.loads(request.body)
+        batch_id = str(data["batch_id"])[:64]
+        pairs = [(item["product"], item["quantity"]) for item in data["items"]]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Malformed batch"}, status=400)
+
+    with transaction.atomic():
+        # Recorded in the items' transaction: if applying them fails, the
+        # batch isn't marked done and the client's retry goes through
+        try:
+            with transaction.atomic():
+                OrderItemBatch.objects.create(order=order, batch_id=batch_id)
+        except IntegrityError:
+            return JsonResponse({"status": "duplicate"})
+        added, errors = add_items(order, pairs)
+    return JsonResponse({
+        "status": "ok",
+        "added": added,
+        "errors": {str(k): v for k, v in errors.items()},
+        "total": str(Order.objects.values_list('total_amount', flat=True).get(pk=order.pk)),
+    })
+
+
+COMPACT_JSON = {'separators': (',', ':')}
+AUTOCOMPLETE_LIMIT = 20
+
+
+@login_required
+@require_GET
+def product_autocomplete(request):
+    """
+    Suggestions for forms.ProductAutocomplete, AUTOCOMPLETE_LIMIT at a time:
+    ?q=<start of words in the name>&page=<n>. "more" says whether page n+1 exists.
+    """
+    q = request.GET.get('q', '')
+    page = request.GET.get('page', '1')
+    page = min(int(page), 50) if page.isdigit() and int(page) > 0 else 1
+    products = search.match(Product.objects.all(), q)
+    # Matches come from the full-text index and are sorted by name (product_name_idx
+    # can supply that order); with no query yet, the newest stock first
+    products = products.order_by('name', 'id') if search.terms(q) else products.order_by('-date_added', '-id')
+    start = (page - 1) * AUTOCOMPLETE_LIMIT
+    # One extra row tells us whether there's another page without a COUNT
+    products = list(
+        products.only('name', 'size', 'selling_price', 'quantity', 'reserved')[start:start + AUTOCOMPLETE_LIMIT + 1]
+    )
+    response = JsonResponse({
+        "results": [
+            {
+                "id": product.pk,
+                "text": str(product),
+                "price": str(product.selling_price),
+                "available": product.available,
+            }
+            for product in products[:AUTOCOMPLETE_LIMIT]
+        ],
+        "more": len(products) > AUTOCOMPLETE_LIMIT,
+    }, json_dumps_params=COMPACT_JSON)
+    response['Cache-Control'] = 'private, max-age=30'
+    return response
+
+
+@require_GET
+@gzip_page
+@condition(etag_func=lambda request: str(catalogue.current_version()))
+def catalogue_snapshot(request):
+    response = JsonResponse(catalogue.snapshot(), json_dumps_params=COMPACT_JSON)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@require_GET
+@gzip_page
+def catalogue_delta(request):
+    """?since=<version> or ?since=<ISO timestamp> of the client's last sync."""
+    since = request.GET.get('since', '0')
+    if since.isdigit():
+        since = int(since)
+    else:
+        moment = parse_datetime(since)
+        if moment is None:
+            return JsonResponse({"error": "since must be a catalogue version or ISO timestamp"}, status=400)
+        if is_naive(moment):
+            moment = make_aware(moment)
+        since = catalogue.version_at(moment)
+    response = JsonResponse(catalogue.delta(since), json_dumps_params=COMPACT_JSON)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 @login_required
 def checkout_order(request, order_id):
     order = get_object_or_404(
-        Order,
+        Order.objects.with_items(),
         id=order_id,
         customer=request.user,
         status='pending'
     )
 
-    if not order.items.exists():
+    if not order.items.all():
         messages.error(request, "Your order has no items.")
-        return redirect('add_order_items', order_id=order.id)
+        return redirect('inventory:add_order_items', order_id=order.id)
 
     if request.method == "POST":
-        order.status = 'confirmed'
-        order.save()
+        try:
+            with transaction.atomic():
+                # Locking the order serialises double-submits, so stock is held once
+                locked = Order.objects.select_for_update().get(pk=order.pk)
+                if locked.status != 'pending':
+                    return redirect('inventory:order_confirmation', order_id=order.id)
+                hold_order(locked)
+                locked.status = 'confirmed'
+                locked.save()
+        except InsufficientStock as exc:
+            product = Product.objects.get(pk=exc.product_id)
+            messages.error(request, f"Sorry, only {product.available} of {product.name} left.")
+            return redirect('inventory:add_order_items', order_id=order.id)
         return redirect('inventory:order_confirmation', order_id=order.id)
 
     return render(request, 'inventory/orders/checkout.html', {'order': order})
@@ -201,66 +547,72 @@ def redirect_after_login(request):
 
 @login_required
 def pay_order(request, order_id):
+    order = get_object_or_404(Order, id=order_id, customer=request.user)
 
-    if request.method == "POST":
+    if request.method != "POST":
+        return redirect('inventory:checkout_order', order_id=order.id)
 
-        phone = request.POST['phone']
+    phone = request.POST.get('phone', '').strip()
+    if not phone:
+        messages.error(request, "Enter the M-Pesa phone number to charge.")
+        return redirect('inventory:checkout_order', order_id=order.id)
 
-        order = Order.objects.get(id=order_id)
+    with transaction.atomic():
+        # Locking the order serialises double-submits, so only one push is queued
+        order = get_object_or_404(Order.objects.select_for_update(), id=order.id)
+        if order.status != 'confirmed':
+            messages.error(request, "Only a confirmed order can be paid.")
+            return redirect('inventory:order_confirmation', order_id=order.id)
 
-        response = stk_push(
-            phone,
-            order.total_amount
-        )
+        existing = order.payments.filter(status__in=('PENDING', 'SUCCESS')).first()
+        if existing is not None:
+            messages.info(request, "This order already has a payment in progress.")
+            return redirect('inventory:payment_detail', payment_id=existing.id)
 
-        Payment.objects.create(
+        # Queued only - manage.py mpesa_worker sends the STK push in the background
+        payment = Payment.objects.create(
             order=order,
             phone_number=phone,
             amount=order.total_amount,
-            checkout_request_id=
-                response.get("CheckoutRequestID")
         )
 
-        return redirect('orders')
-
-@csrf_exempt
-def mpesa_callback(request):
-
-    data = json.loads(
-        request.body
-    )
-
-    callback = data['Body'][
-        'stkCallback'
-    ]
-
-    checkout_id = callback[
-        'CheckoutRequestID'
-    ]
-
-    result_code = callback[
-        'ResultCode'
-    ]
-
-    payment = Payment.objects.get(
-        checkout_request_id=checkout_id
-    )
-
-    if result_code == 0:
-
-        payment.status = "PAID"
+    return redirect('inventory:payment_detail', payment_id=payment.id)
 
-        payment.save()
 
-        payment.order.payment_status = "PAID"
-
-        payment.order.save()
+@login_required
+def payment_detail(request, payment_id):
+    payment = get_object_or_404(Payment, id=payment_id, order__customer=request.user)
+    return render(request, 'inventory/orders/payment.html', {'payment': payment})
 
-    else:
 
-        payment.status = "FAILED"
+@login_required
+def payment_status(request, payment_id):
+    """Polled by the payment page until the push is answered."""
+    payment = get_object_or_404(Payment, id=payment_id, order__customer=request.user)
+    return JsonResponse({
+        "status": payment.status,
+        "dispatch_status": payment.dispatch_status,
+        "receipt": payment.mpesa_receipt_number,
+        "error": payment.last_error if payment.dispatch_status == 'ERROR' else "",
+    })
 
-        payment.save()
+@csrf_exempt
+def mpesa_callback(request):
+    try:
+        data = json.loads(request.body)
+        result = parse_callback(data)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"ResultCode": 1, "ResultDesc": "Malformed callback"}, status=400)
+
+    # Replays are acknowledged too, otherwise Safaricom keeps retrying
+    if settings.MPESA_CALLBACK_MODE == "deferred":
+        stage_callback(data)
+    elif not apply_callback(result) and not Payment.objects.filter(
+        checkout_request_id=result.checkout_request_id,
+    ).exists():
+        # Safaricom can answer before the mpesa_worker has stored the
+        # CheckoutRequestID; the worker applies staged callbacks once it has
+        stage_callback(data)
 
     return JsonResponse({
         "ResultCode": 0,
@@ -282,17 +634,22 @@ def user_profile(request):
     return render(request, 'inventory/profile.html', context)
 
 @login_required
+@limit_upload_size
 def user_settings(request):
     """Settings page for users to manage profile and upload profile picture"""
     user = request.user
     profile, created = UserProfile.objects.get_or_create(user=user)
     
     if request.method == "POST":
-        # Handle profile picture upload
+        if request.upload_rejected:
+            limit_mb = settings.MAX_IMAGE_UPLOAD_BYTES // (1024 * 1024)
+            messages.error(request, f'Picture is too large (max {limit_mb}MB)')
+            return redirect('inventory:user_settings')
+
+        # Handle profile picture upload; resizing and storage happen in the background
         if 'profile_pic' in request.FILES:
-            profile.profile_pic = request.FILES['profile_pic']
-            profile.save()
-            messages.success(request, 'Profile picture updated successfully')
+            queue_avatar(profile, request.FILES['profile_pic'])
+            messages.success(request, 'Profile picture uploaded. It will appear in a few seconds.')
             return redirect('inventory:user_settings')
     
     context = {
@@ -0,0 +1,37 @@
+#!/usr/bin/env bash
+# Run the test suite and the stock race check against SQLite, then against a
+# throwaway PostgreSQL (Docker if available, otherwise a local pg_ctl cluster).
+#
+#   ./scripts/test_databases.sh
+set -euo pipefail
+cd "$(dirname "$0")/.."
+
+PG_PORT="${PG_PORT:-55432}"
+
+run_checks() {
+    python manage.py check
+    python manage.py test inventory
+    python manage.py bench_stock --threads 8 --attempts 50 --stock 200
+}
+
+echo "== SQLite =="
+DB_ENGINE=sqlite run_checks
+
+echo "== PostgreSQL =="
+if command -v docker >/dev/null 2>&1; then
+    container=$(docker run -d --rm -e POSTGRES_USER=thriftvibes254 \
+        -e POSTGRES_PASSWORD=thriftvibes254 -p "$PG_PORT:5432" postgres:17)
+    trap 'docker stop "$container" >/dev/null' EXIT
+    until docker exec "$container" pg_isready -U thriftvibes254 >/dev/null 2>&1; do sleep 1; done
+elif command -v pg_ctl >/dev/null 2>&1; then
+    pgdata=$(mktemp -d)
+    initdb -D "$pgdata" -U thriftvibes254 --auth=trust >/dev/null
+    pg_ctl -D "$pgdata" -o "-p $PG_PORT -k $pgdata" -l "$pgdata/log" -w start >/dev/null
+    trap 'pg_ctl -D "$pgdata" -m fast stop >/dev/null; rm -rf "$pgdata"' EXIT
+else
+    echo "Neither docker nor pg_ctl found; skipping PostgreSQL." >&2
+    exit 0
+fi
+
+DB_ENGINE=postgres DB_HOST=127.0.0.1 DB_PORT="$PG_PORT" DB_NAME=postgres \
+    DB_USER=thriftvibes254 DB_PASSWORD=thriftvibes254 run_checks
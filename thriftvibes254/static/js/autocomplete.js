@@ -0,0 +1,64 @@
+// Remote search for <select data-autocomplete-url> (forms.ProductAutocomplete):
+// typing in the box above the select replaces its options with the server's
+// matches a page at a time, so big catalogues never have to be rendered into
+// the page. Picking "Load more..." appends the next page. Nothing is chosen
+// for the user: Enter in the search box moves to the matches instead of
+// submitting, and the select's required check stops an empty submit.
+(function () {
+  document.querySelectorAll('select[data-autocomplete-url]').forEach(select => {
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.className = 'form-control mb-1';
+    input.placeholder = 'Type to search products';
+    input.setAttribute('aria-label', input.placeholder);
+    select.before(input);
+
+    const more = new Option('Load more...', '');
+    more.dataset.more = '1';
+    let timer = null;
+    let controller = null;
+    let page = 1;
+    let chosen = select.value;
+
+    function load(append) {
+      if (controller) controller.abort();
+      controller = new AbortController();
+      page = append ? page + 1 : 1;
+      const url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(input.value.trim()) + '&page=' + page;
+      fetch(url, { credentials: 'same-origin', signal: controller.signal })
+        .then(response => response.ok ? response.json() : { results: [], more: false })
+        .then(data => {
+          more.remove();
+          if (!append) select.replaceChildren(new Option('---------', ''));
+          data.results.forEach(item => {
+            const label = item.text + ' - KES ' + item.price + (item.available ? '' : ' (sold out)');
+            select.add(new Option(label, item.id, false, String(item.id) === chosen));
+          });
+          if (data.more) select.add(more);
+          chosen = select.value;
+        })
+        .catch(() => {});
+    }
+
+    input.addEventListener('input', () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => load(false), 200);
+    });
+    input.addEventListener('focus', () => load(false), { once: true });
+    input.addEventListener('keydown', event => {
+      if (event.key === 'Enter') {
+        event.preventDefault();
+        select.focus();
+      }
+    });
+
+    select.addEventListener('change', () => {
+      if (select.selectedOptions[0] === more) {
+        select.value = chosen;
+        load(true);
+      } else {
+        chosen = select.value;
+      }
+    });
+  });
+})();
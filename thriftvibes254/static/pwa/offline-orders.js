@@ -0,0 +1,41 @@
+// Queue "Add Item" submissions while offline and replay them on reconnect.
+(function () {
+  const form = document.querySelector('form[data-batch-url]');
+  if (!form || !self.outbox) return;
+  const notice = document.getElementById('offline-queue');
+
+  function showQueued() {
+    outbox.all().then(entries => {
+      const mine = entries.filter(entry => entry.url === form.dataset.batchUrl);
+      notice.hidden = mine.length === 0;
+      notice.textContent = mine.length + ' item(s) saved offline - they will be added when you are back online.';
+    });
+  }
+
+  function sync() {
+    const done = navigator.serviceWorker && 'SyncManager' in self
+      ? navigator.serviceWorker.ready.then(reg => reg.sync.register('order-items'))
+      : outbox.flush();
+    return done.catch(() => outbox.flush());
+  }
+
+  form.addEventListener('submit', event => {
+    if (navigator.onLine) return;
+    event.preventDefault();
+    const data = new FormData(form);
+    outbox.add({
+      id: crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random(),
+      url: form.dataset.batchUrl,
+      csrf: data.get('csrfmiddlewaretoken'),
+      items: [{ product: data.get('product'), quantity: data.get('quantity') }],
+    }).then(() => { form.reset(); showQueued(); sync(); });
+  });
+
+  self.addEventListener('online', () => {
+    outbox.flush().then(() => {
+      if (notice && !notice.hidden) location.reload();
+    });
+  });
+
+  showQueued();
+})();
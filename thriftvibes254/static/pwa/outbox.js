@@ -0,0 +1,51 @@
+// Offline queue of cart/order item batches, shared by pages and the service worker.
+(function (scope) {
+  const DB = 'thriftvibes';
+  const STORE = 'outbox';
+  const DEAD = [400, 404, 409, 422];
+
+  function open() {
+    return new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB, 1);
+      req.onupgradeneeded = () => req.result.createObjectStore(STORE, { keyPath: 'id' });
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function run(mode, fn) {
+    return open().then(db => new Promise((resolve, reject) => {
+      const tx = db.transaction(STORE, mode);
+      const req = fn(tx.objectStore(STORE));
+      tx.oncomplete = () => resolve(req.result);
+      tx.onerror = () => reject(tx.error);
+    }));
+  }
+
+  const outbox = {
+    add: entry => run('readwrite', store => store.put(entry)),
+    all: () => run('readonly', store => store.getAll()),
+    remove: id => run('readwrite', store => store.delete(id)),
+    clear: () => run('readwrite', store => store.clear()),
+
+    // Replay the queued batches one at a time. The server ignores a batch_id
+    // it has already applied, so a sync that dies halfway is safe to repeat.
+    async flush() {
+      const entries = await outbox.all();
+      for (const entry of entries) {
+        const response = await fetch(entry.url, {
+          method: 'POST',
+          credentials: 'same-origin',
+          headers: { 'Content-Type': 'application/json', 'X-CSRFToken': entry.csrf },
+          body: JSON.stringify({ batch_id: entry.id, items: entry.items }),
+        });
+        // Signed out or session expired: keep everything until they are back
+        if (response.status === 401 || response.status === 403) return;
+        // Bad data, missing or closed order: retrying will never succeed
+        if (response.ok || DEAD.includes(response.status)) await outbox.remove(entry.id);
+      }
+    },
+  };
+
+  scope.outbox = outbox;
+})(self);
@@ -0,0 +1,179 @@
+// ThriftVibes254 service worker
+importScripts('/static/pwa/outbox.js');
+
+const CACHE = 'thriftvibes-v2';
+const PAGES = 'thriftvibes-pages-v2';  // v1 held every page, signed-in ones too
+const SNAPSHOT_URL = '/api/catalogue/snapshot/';
+const DELTA_URL = '/api/catalogue/delta/';
+const AUTOCOMPLETE_URL = '/api/products/autocomplete/';
+const AUTOCOMPLETE_LIMIT = 20;  // views.AUTOCOMPLETE_LIMIT
+const PRECACHE = ['/offline/', SNAPSHOT_URL];
+// Only the public catalogue is kept for offline reading; account and staff
+// pages stay out of the cache.
+const PUBLIC_PAGES = ['/products/', '/gallery/'];
+const MAX_PAGES = 30;
+const LOGOUT_URLS = ['/logout/', '/accounts/logout/'];
+// ManifestStaticFilesStorage's content hash: 12 hex digits before the extension
+const HASHED = /\.[0-9a-f]{12}\.\w+$/;
+
+self.addEventListener('install', event => {
+  event.waitUntil(caches.open(CACHE).then(cache => cache.addAll(PRECACHE)));
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil(
+    caches.keys().then(keys => Promise.all(
+      keys.filter(key => key !== CACHE && key !== PAGES).map(key => caches.delete(key))
+    ))
+  );
+  self.clients.claim();
+});
+
+// Bring the cached snapshot up to date with a small delta instead of
+// downloading the whole catalogue again.
+let refreshing = null;
+function refreshCatalogue() {
+  if (refreshing) return refreshing;
+  refreshing = (async () => {
+    const cache = await caches.open(CACHE);
+    const cached = await cache.match(SNAPSHOT_URL);
+    if (!cached) {
+      await cache.add(SNAPSHOT_URL);
+      return;
+    }
+    const snapshot = await cached.json();
+    const response = await fetch(DELTA_URL + '?since=' + snapshot.version);
+    if (!response.ok) return;
+    const delta = await response.json();
+    if (delta.reset) {
+      await cache.add(SNAPSHOT_URL);
+      return;
+    }
+    if (delta.version === snapshot.version) return;
+    // Rows are arrays in `fields` order; the id is always first
+    const byId = new Map(snapshot.products.map(row => [row[0], row]));
+    delta.deleted.forEach(id => byId.delete(id));
+    delta.products.forEach(row => byId.set(row[0], row));
+    const merged = { version: delta.version, fields: delta.fields, products: Array.from(byId.values()) };
+    await cache.put(SNAPSHOT_URL, jsonResponse(merged));
+  })().catch(() => {}).finally(() => { refreshing = null; });
+  return refreshing;
+}
+
+// Offline stand-in for views.product_autocomplete: the same matching (every
+// term starts a word of the name) and the same response shape, read from the
+// cached snapshot.
+function fetchAndCache(request) {
+  return fetch(request).then(response => {
+    if (response.ok) {
+      const copy = response.clone();
+      caches.open(CACHE).then(cache => cache.put(request, copy));
+    }
+    return response;
+  });
+}
+
+function jsonResponse(data) {
+  return new Response(JSON.stringify(data), { headers: { 'Content-Type': 'application/json' } });
+}
+
+async function autocompleteFromSnapshot(url) {
+  const cached = await caches.match(SNAPSHOT_URL);
+  if (!cached) return jsonResponse({ results: [], more: false });
+  const snapshot = await cached.json();
+  const col = Object.fromEntries(snapshot.fields.map((name, i) => [name, i]));
+  const terms = (url.searchParams.get('q') || '').toLowerCase().match(/\w+/g) || [];
+  const page = Math.min(Math.max(parseInt(url.searchParams.get('page'), 10) || 1, 1), 50);
+  let rows = snapshot.products.filter(row => {
+    const words = String(row[col.name]).toLowerCase().match(/\w+/g) || [];
+    return terms.every(term => words.some(word => word.startsWith(term)));
+  });
+  rows = terms.length
+    ? rows.sort((a, b) => a[col.name].localeCompare(b[col.name]) || a[col.id] - b[col.id])
+    : rows.reverse();  // snapshot is in id order; newest first like the view
+  const start = (page - 1) * AUTOCOMPLETE_LIMIT;
+  return jsonResponse({
+    results: rows.slice(start, start + AUTOCOMPLETE_LIMIT).map(row => ({
+      id: row[col.id],
+      text: row[col.name] + ' (' + row[col.size] + ')',
+      price: row[col.price],
+      available: row[col.available],
+    })),
+    more: rows.length > start + AUTOCOMPLETE_LIMIT,
+  });
+}
+
+self.addEventListener('sync', event => {
+  if (event.tag === 'order-items') event.waitUntil(outbox.flush());
+});
+
+self.addEventListener('message', event => {
+  if (event.data === 'refresh-catalogue') event.waitUntil(refreshCatalogue());
+});
+
+// Keep the newest MAX_PAGES pages; Cache.keys() lists them oldest first.
+async function cachePage(request, response) {
+  const cache = await caches.open(PAGES);
+  await cache.delete(request);
+  await cache.put(request, response);
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, -MAX_PAGES).map(key => cache.delete(key)));
+}
+
+// Nothing a signed-in customer saw or queued should outlive the session
+function forgetSession() {
+  return Promise.all([caches.delete(PAGES), outbox.clear()]);
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== location.origin) return;
+  if (request.method === 'POST' && LOGOUT_URLS.includes(url.pathname)) {
+    event.waitUntil(forgetSession());
+    return;
+  }
+  if (request.method !== 'GET') return;
+
+  if (url.pathname.startsWith('/static/')) {
+    // Hashed names (style.3f2a9c1d4e5b.css) never change: cache first.
+    // Anything else can change under the same URL: network first.
+    if (HASHED.test(url.pathname)) {
+      event.respondWith(caches.match(request).then(hit => hit || fetchAndCache(request)));
+    } else {
+      event.respondWith(fetchAndCache(request)
+        .catch(() => caches.match(request).then(hit => hit || Response.error())));
+    }
+    return;
+  }
+
+  // Catalogue reads come from the local snapshot; it is refreshed behind the scenes
+  if (url.pathname === SNAPSHOT_URL) {
+    event.respondWith(caches.match(SNAPSHOT_URL).then(hit => {
+      event.waitUntil(refreshCatalogue());
+      return hit || fetch(request);
+    }));
+    return;
+  }
+
+  // Product pickers: the server while online, the snapshot when not
+  if (url.pathname === AUTOCOMPLETE_URL) {
+    event.respondWith(fetch(request).catch(() => autocompleteFromSnapshot(url)));
+    return;
+  }
+
+  // Pages: network first, last good copy of catalogue pages when offline
+  if (request.mode === 'navigate') {
+    event.respondWith(
+      fetch(request).then(response => {
+        if (response.ok && !response.redirected && PUBLIC_PAGES.includes(url.pathname)) {
+          event.waitUntil(cachePage(request, response.clone()));
+        }
+        return response;
+      }).catch(() => caches.match(request, { cacheName: PAGES })
+        .then(hit => hit || caches.match('/offline/')))
+    );
+    event.waitUntil(refreshCatalogue().then(() => outbox.flush()).catch(() => {}));
+  }
+});
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 import os
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its latency covers everything below it
+    'inventory.middleware.PerfMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,12 +82,101 @@ WSGI_APPLICATION = 'thriftvibes254.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# Set DB_ENGINE=postgres (plus DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT) for
+# production; needs `pip install "psycopg[binary,pool]"`. SQLite is the default.
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    DB_POOL = os.getenv("DB_POOL", "true").lower() == "true"
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv("DB_NAME", "thriftvibes254"),
+            'USER': os.getenv("DB_USER", "thriftvibes254"),
+            'PASSWORD': os.getenv("DB_PASSWORD", ""),
+            'HOST': os.getenv("DB_HOST", "localhost"),
+            'PORT': os.getenv("DB_PORT", "5432"),
+            # Django's pool and persistent connections are mutually exclusive
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv("DB_POOL_MIN", "2")),
+                    'max_size': int(os.getenv("DB_POOL_MAX", "10")),
+                    'timeout': 10,
+                } if DB_POOL else False,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                # Take the write lock up front instead of failing mid-transaction
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 5,
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA busy_timeout=5000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                    'PRAGMA cache_size=-20000;'
+                ),
+            },
+        }
+    }
+
+
+# Cache
+# CACHE_BACKEND=redis with REDIS_URL for a cache shared between workers (needs
+# `pip install redis`); the default is per-process local memory.
+
+if os.getenv("CACHE_BACKEND", "locmem") == "redis":
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_URL", "redis://127.0.0.1:6379/1"),
+            'KEY_PREFIX': 'thriftvibes254',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'thriftvibes254',
+        }
     }
-}
+
+# Sessions hold the shopping cart (inventory.cart). With a shared Redis cache
+# they are read from there and written through to the database, so an evicted
+# or flushed cache doesn't empty anyone's cart; per-process locmem can't be
+# shared between workers, so then they stay in the database only.
+SESSION_ENGINE = os.getenv(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db" if CACHES['default']['BACKEND'].endswith('RedisCache')
+    else "django.contrib.sessions.backends.db",
+)
+
+# Cached catalogue pages are invalidated through a version counter kept in the
+# cache (inventory.caching). Every locmem process has its own counter, so a
+# product change in one worker would leave the others serving stale pages:
+# page caching needs the shared Redis cache and is off without it.
+CATALOGUE_CACHE_SECONDS = int(os.getenv(
+    "CATALOGUE_CACHE_SECONDS",
+    "600" if CACHES['default']['BACKEND'].endswith('RedisCache') else "0",
+))
+if CATALOGUE_CACHE_SECONDS and not CACHES['default']['BACKEND'].endswith('RedisCache'):
+    raise ImproperlyConfigured("CATALOGUE_CACHE_SECONDS needs a shared cache: set CACHE_BACKEND=redis.")
+
+# Request metrics (inventory.metrics): every request's latency is recorded,
+# this share of requests also gets query/template timing and N+1 checks.
+PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", "0.1"))
+# Lets a Prometheus scraper read /metrics/ with "Authorization: Bearer <token>";
+# staff can always view it while logged in.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 
 # Password validation
@@ -130,9 +222,46 @@ STATICFILES_DIRS = [
 ]
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Hashed, precompressed static files after collectstatic (see inventory.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        if DEBUG else 'inventory.storage.ManifestStorage',
+    },
+}
+
+# Optional: with `pip install whitenoise` the app serves its own static files.
+# WhiteNoise gives hashed names from the manifest a long immutable
+# Cache-Control by itself; WHITENOISE_MAX_AGE only covers unhashed names
+# (e.g. pwa/outbox.js, imported by the service worker), so it stays short.
+try:
+    import whitenoise  # noqa: F401
+except ImportError:
+    pass
+else:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'whitenoise.middleware.WhiteNoiseMiddleware',
+    )
+    WHITENOISE_MAX_AGE = 60
 # MEDIA FILES (Images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Threads used to resize uploaded images in the background
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Uploads past this are cut off while streaming (see inventory.uploads)
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+# Bulk product import sheets and photo zips (see inventory.imports)
+MAX_IMPORT_UPLOAD_BYTES = int(os.getenv("MAX_IMPORT_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+
+# How long a confirmed order keeps its stock before manage.py release_holds frees it
+STOCK_HOLD_MINUTES = int(os.getenv("STOCK_HOLD_MINUTES", "15"))
+# Pending orders idle this long with no payment are deleted by manage.py clear_stale_orders
+STALE_ORDER_HOURS = int(os.getenv("STALE_ORDER_HOURS", "24"))
 
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = '/redirect/'
@@ -144,6 +273,20 @@ MPESA_CONSUMER_SECRET = os.getenv("GpK3DT8ZQMAeOBUzmxfkT1lG5qGuGZDPedPAQdJfZNKtG
 MPESA_SHORTCODE = os.getenv("174379")
 MPESA_PASSKEY = os.getenv("MPESA_PASSKEY")
 MPESA_ENV = os.getenv("MPESA_ENV")
+MPESA_CALLBACK_URL = os.getenv("MPESA_CALLBACK_URL")
+# Overrides the sandbox/production host, e.g. to point at the local Daraja stub
+MPESA_BASE_URL = os.getenv("MPESA_BASE_URL")
+# (connect, read) timeouts in seconds for Daraja calls
+MPESA_TIMEOUT = (
+    float(os.getenv("MPESA_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("MPESA_READ_TIMEOUT", "10")),
+)
+MPESA_POOL_SIZE = int(os.getenv("MPESA_POOL_SIZE", "10"))
+# Background STK push delivery (manage.py mpesa_worker)
+MPESA_DISPATCH_CONCURRENCY = int(os.getenv("MPESA_DISPATCH_CONCURRENCY", "4"))
+MPESA_DISPATCH_MAX_ATTEMPTS = int(os.getenv("MPESA_DISPATCH_MAX_ATTEMPTS", "5"))
+# "direct" applies callbacks in the request; "deferred" stages them for manage.py mpesa_batcher
+MPESA_CALLBACK_MODE = os.getenv("MPESA_CALLBACK_MODE", "direct")
 
 
 CSRF_TRUSTED_ORIGINS = [
@@ -1,22 +1,14 @@
-from django.http import HttpResponse
-from django.templatetags.static import static
-import os
 from django.shortcuts import render
 from django.contrib.auth import logout
 
+from inventory.assets import service_worker_asset
+
 
 
 
 def service_worker(request):
-    sw_path = static("pwa/service-worker.js")
-    file_path = os.path.join(os.getcwd(), sw_path.strip("/"))
+    return service_worker_asset.serve(request)
 
-    with open(file_path, "r") as f:
-        return HttpResponse(
-            f.read(),
-            content_type="application/javascript"
-        )
-        
 def offline_view(request):
     return render(request, "offline.html")
 